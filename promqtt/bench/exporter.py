@@ -0,0 +1,305 @@
+"""Microbenchmarks of the prometheus exporter.
+
+Measures the time and the peak memory of the exporter operations for a number of
+series, i.e. metric instances, distributed over multiple metrics:
+
+* `set_new`: `PrometheusExporter.set()` creating all series
+* `set_update`: `PrometheusExporter.set()` updating all series
+* `inc`: `Metric.inc()` on all series of a counter
+* `check_timeout`: `PrometheusExporter.check_timeout()`, without expired series
+* `render`: `PrometheusExporter.render()`
+* `render_cached`: `PrometheusExporter.render_bytes()` after a previous scrape,
+  i.e. with the cached exposition lines of unchanged series
+
+Each benchmark runs for different numbers of labels per series. Half of the
+metrics have a timeout. The results are written to a JSON file, which can be
+compared with the results of another run.
+
+Usage: python -m promqtt.bench.exporter [--series 10000 100000] [--output FILE]
+       [--compare BASELINE]
+
+"""
+
+import argparse
+import gc
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+from ..promexp import PrometheusExporter
+from ..promexp.metric import Metric
+from ..promexp.types import MetricTypeEnum
+
+# Number of metrics the series are distributed over
+METRICS = 10
+
+# Timeout of the metrics with timeout. Long enough to not expire during a run.
+TIMEOUT = 3600
+
+OPERATIONS = [
+    "set_new",
+    "set_update",
+    "inc",
+    "check_timeout",
+    "render",
+    "render_cached",
+]
+
+
+def make_labels(series: int, label_count: int) -> list[dict[str, str]]:
+    """Create the distinct label sets of a number of series"""
+
+    return [
+        {"device": f"dev{index}"}
+        | {
+            f"label{label}": f"value{index % (label + 7)}"
+            for label in range(1, label_count)
+        }
+        for index in range(series)
+    ]
+
+
+def make_exporter() -> PrometheusExporter:
+    """Create an exporter with the benchmark metrics, half of them with timeout"""
+
+    promexp = PrometheusExporter()
+
+    for index in range(METRICS):
+        promexp.register(
+            name=f"bench_metric{index}",
+            datatype=MetricTypeEnum.GAUGE,
+            helpstr="Benchmark metric",
+            timeout=TIMEOUT if index % 2 else 0,
+        )
+
+    return promexp
+
+
+def fill(promexp: PrometheusExporter, labels: list[dict[str, str]]) -> None:
+    """Set a value for each series, distributed over the metrics"""
+
+    for index, series_labels in enumerate(labels):
+        promexp.set(
+            name=f"bench_metric{index % METRICS}", labels=series_labels, value=index
+        )
+
+
+def _setups(
+    labels: list[dict[str, str]],
+) -> dict[str, tuple[Callable[[], Any], Callable[[Any], None]]]:
+    """Return the setup and the measured function of each operation"""
+
+    def filled() -> PrometheusExporter:
+        promexp = make_exporter()
+        fill(promexp, labels)
+        return promexp
+
+    def counter() -> Metric:
+        metric = Metric(
+            name="bench_counter", datatype=MetricTypeEnum.COUNTER, helpstr=""
+        )
+        for series_labels in labels:
+            metric.inc(series_labels)
+        return metric
+
+    def scraped() -> PrometheusExporter:
+        promexp = filled()
+        promexp.render_bytes()
+        return promexp
+
+    def inc(metric: Metric) -> None:
+        for series_labels in labels:
+            metric.inc(series_labels)
+
+    return {
+        "set_new": (make_exporter, lambda promexp: fill(promexp, labels)),
+        "set_update": (filled, lambda promexp: fill(promexp, labels)),
+        "inc": (counter, inc),
+        "check_timeout": (filled, lambda promexp: promexp.check_timeout()),
+        "render": (filled, lambda promexp: promexp.render()),
+        "render_cached": (scraped, lambda promexp: promexp.render_bytes()),
+    }
+
+
+def _measure(
+    setup: Callable[[], Any], func: Callable[[Any], None], memory: bool
+) -> tuple[float, int | None]:
+    """Measure the time of a function and optionally its peak memory. Memory is
+    measured in a separate run, as tracing slows down the execution."""
+
+    obj = setup()
+    gc.collect()
+
+    start = time.perf_counter()
+    func(obj)
+    seconds = time.perf_counter() - start
+
+    del obj
+
+    if not memory:
+        return seconds, None
+
+    obj = setup()
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        func(obj)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return seconds, peak
+
+
+def run_benchmarks(
+    series_counts: list[int],
+    label_counts: list[int],
+    operations: list[str] | None = None,
+    memory: bool = True,
+) -> dict[str, Any]:
+    """Run the benchmarks and return the results"""
+
+    results = []
+
+    for series in series_counts:
+        for label_count in label_counts:
+            setups = _setups(make_labels(series, label_count))
+
+            for operation in operations or OPERATIONS:
+                setup, func = setups[operation]
+                seconds, peak = _measure(setup, func, memory)
+
+                results.append(
+                    {
+                        "operation": operation,
+                        "series": series,
+                        "labels": label_count,
+                        "seconds": seconds,
+                        "ns_per_series": seconds / series * 1e9,
+                        "peak_bytes": peak,
+                    }
+                )
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def _key(result: dict[str, Any]) -> tuple[str, int, int]:
+    return result["operation"], result["series"], result["labels"]
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any]) -> list[dict[str, Any]]:
+    """Compare the results of two runs. Returns the ratio of time and peak memory,
+    current to baseline, for each benchmark contained in both runs."""
+
+    base = {_key(result): result for result in baseline["results"]}
+    rows = []
+
+    for result in current["results"]:
+        old = base.get(_key(result))
+        if old is None:
+            continue
+
+        row = {
+            "operation": result["operation"],
+            "series": result["series"],
+            "labels": result["labels"],
+            "time_ratio": (
+                result["seconds"] / old["seconds"] if old["seconds"] else None
+            ),
+            "memory_ratio": None,
+        }
+
+        if result["peak_bytes"] and old["peak_bytes"]:
+            row["memory_ratio"] = result["peak_bytes"] / old["peak_bytes"]
+
+        rows.append(row)
+
+    return rows
+
+
+def format_results(results: dict[str, Any]) -> str:
+    """Return a table of the results"""
+
+    lines = [
+        f"{'operation':<14} {'series':>9} {'labels':>6} {'seconds':>10} "
+        f"{'ns/series':>10} {'peak MiB':>9}"
+    ]
+
+    for result in results["results"]:
+        peak = result["peak_bytes"]
+        peak_str = f"{peak / 2**20:9.1f}" if peak is not None else f"{'-':>9}"
+
+        lines.append(
+            f"{result['operation']:<14} {result['series']:>9} {result['labels']:>6} "
+            f"{result['seconds']:>10.4f} {result['ns_per_series']:>10.0f} {peak_str}"
+        )
+
+    return "\n".join(lines)
+
+
+def format_comparison(rows: list[dict[str, Any]]) -> str:
+    """Return a table of a comparison with ratios of current to baseline"""
+
+    def ratio(value: float | None) -> str:
+        return f"{value:>8.2f}x" if value is not None else f"{'-':>9}"
+
+    lines = [f"{'operation':<14} {'series':>9} {'labels':>6} {'time':>9} {'memory':>9}"]
+
+    for row in rows:
+        lines.append(
+            f"{row['operation']:<14} {row['series']:>9} {row['labels']:>6} "
+            f"{ratio(row['time_ratio'])} {ratio(row['memory_ratio'])}"
+        )
+
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """Benchmark main function"""
+
+    parser = argparse.ArgumentParser(description="promqtt exporter microbenchmarks")
+    parser.add_argument(
+        "--series", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--labels", type=int, nargs="+", default=[1, 3, 8])
+    parser.add_argument(
+        "--operations", nargs="+", choices=OPERATIONS, default=OPERATIONS
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Do not measure the peak memory"
+    )
+    parser.add_argument("--output", type=Path, help="Write the results to this file")
+    parser.add_argument(
+        "--compare", type=Path, help="Compare with the results in this file"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.series, args.labels, args.operations, memory=not args.no_memory
+    )
+
+    print(format_results(results))
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=4), encoding="utf-8")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        print()
+        print(format_comparison(compare(baseline, results)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Synthetic MQTT load for benchmarking.
+
+A load profile describes a set of devices publishing JSON messages: the number of
+devices, the shape of their topics, the number of values per message, the payload
+size and the publish rate. For each profile, a matching promqtt configuration is
+created, which maps every value of a message to a metric labelled with the
+device.
+
+Each payload starts with the time it was sent at a fixed position, so that the
+ingest latency can be determined without parsing the payload again.
+
+"""
+
+import time
+from enum import Enum
+from typing import Any, Iterator, NamedTuple
+
+from ..cfgmodel import PromqttConfig
+from ..test.broker import FakeBroker
+
+# Start of each payload, followed by the send time with a fixed width
+_PAYLOAD_PREFIX = b'{"ts": '
+_TS_WIDTH = 20
+
+
+class TopicShapeEnum(Enum):
+    """Enumeration of the topic shapes of the generated messages"""
+
+    # bench/<device>
+    FLAT = "flat"
+
+    # tele/<device>/SENSOR, like Tasmota devices
+    TASMOTA = "tasmota"
+
+    # site/<site>/floor/<floor>/<device>/state
+    DEEP = "deep"
+
+
+# Topic template, subscription filter and index of the device level per shape
+_SHAPES = {
+    TopicShapeEnum.FLAT: ("bench/{device}", "bench/+", 1),
+    TopicShapeEnum.TASMOTA: ("tele/{device}/SENSOR", "tele/+/SENSOR", 1),
+    TopicShapeEnum.DEEP: (
+        "site/{site}/floor/{floor}/{device}/state",
+        "site/+/floor/+/+/state",
+        4,
+    ),
+}
+
+
+class LoadProfile(NamedTuple):
+    """Parameters of the generated load"""
+
+    # Number of devices publishing messages
+    devices: int = 100
+
+    # Topic shape of the messages
+    shape: TopicShapeEnum = TopicShapeEnum.TASMOTA
+
+    # Number of values in each message, each mapped to a metric
+    values: int = 4
+
+    # Minimum payload size in bytes, the payload is padded to this size
+    payload_size: int = 0
+
+    # Total number of messages per second, 0 for as fast as possible
+    rate: float = 0
+
+    # Number of messages to publish
+    messages: int = 10000
+
+
+def send_time(payload: bytes) -> float:
+    """Return the send time of a generated payload, as `time.perf_counter()`"""
+
+    start = len(_PAYLOAD_PREFIX)
+    return float(payload[start : start + _TS_WIDTH])
+
+
+def make_topic(profile: LoadProfile, device: int) -> str:
+    """Return the topic of a device"""
+
+    template = _SHAPES[profile.shape][0]
+
+    return template.format(device=f"dev{device}", site=device % 10, floor=device % 5)
+
+
+def make_payload(profile: LoadProfile, seq: int) -> bytes:
+    """Create the JSON payload of a message with the current time as send time"""
+
+    values = ", ".join(
+        f'"v{index}": {(seq + index) % 1000}' for index in range(profile.values)
+    )
+    body = f", {values}" if values else ""
+
+    payload = (
+        _PAYLOAD_PREFIX
+        + f"{time.perf_counter():{_TS_WIDTH}.6f}".encode()
+        + body.encode()
+    )
+
+    padding = profile.payload_size - len(payload) - len(', "pad": ""}')
+    if padding > 0:
+        payload += b', "pad": "' + b"x" * padding + b'"'
+
+    return payload + b"}"
+
+
+def make_config(
+    profile: LoadProfile, broker: FakeBroker, **kwargs: Any
+) -> PromqttConfig:
+    """Create a promqtt configuration handling the messages of a load profile.
+    Additional top level sections can be given as keyword arguments."""
+
+    _, topic_filter, device_level = _SHAPES[profile.shape]
+
+    data: dict[str, Any] = {
+        "mqtt": {
+            "broker": broker.host,
+            "port": broker.port,
+            "topic": topic_filter,
+        },
+        "http": {},
+        "metrics": {
+            f"bench_v{index}": {"type": "gauge", "help": f"Value {index}"}
+            for index in range(profile.values)
+        },
+        "types": {
+            "device": {
+                f"bench_v{index}": {
+                    "value": f"data['v{index}']",
+                    "labels": {"device": f"tlist[{device_level}]"},
+                }
+                for index in range(profile.values)
+            }
+        },
+        "messages": [{"topics": [topic_filter], "types": ["device"]}],
+    }
+    data.update(kwargs)
+
+    return PromqttConfig.parse_obj(data)
+
+
+def generate(profile: LoadProfile) -> Iterator[tuple[str, int]]:
+    """Return the topic and sequence number of each message to publish. The
+    devices publish in turn."""
+
+    topics = [make_topic(profile, device) for device in range(profile.devices)]
+
+    for seq in range(profile.messages):
+        yield topics[seq % len(topics)], seq
+
+
+def publish_load(broker: FakeBroker, profile: LoadProfile) -> float:
+    """Publish the messages of a load profile to the broker at the profile's rate.
+    Returns the time in seconds it took to publish them."""
+
+    start = time.perf_counter()
+
+    for topic, seq in generate(profile):
+        if profile.rate > 0:
+            delay = start + seq / profile.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        broker.publish(topic, make_payload(profile, seq))
+
+    return time.perf_counter() - start
@@ -0,0 +1,46 @@
+"""Unit tests of the exporter microbenchmarks"""
+
+from ..exporter import (
+    OPERATIONS,
+    compare,
+    format_comparison,
+    make_labels,
+    run_benchmarks,
+)
+
+
+def test_bench_make_labels() -> None:
+    """Each series has a distinct label set with the given number of labels"""
+
+    labels = make_labels(series=50, label_count=4)
+
+    assert len({tuple(sorted(series.items())) for series in labels}) == 50
+    assert all(len(series) == 4 for series in labels)
+
+
+def test_bench_exporter_results() -> None:
+    """Run all benchmarks for a small number of series and compare the results"""
+
+    results = run_benchmarks(series_counts=[100], label_counts=[1, 3])
+
+    assert len(results["results"]) == 2 * len(OPERATIONS)
+    for result in results["results"]:
+        assert result["seconds"] > 0
+        assert result["peak_bytes"] is not None
+
+    rows = compare(results, results)
+
+    assert len(rows) == len(results["results"])
+    assert all(row["time_ratio"] == 1.0 for row in rows)
+    assert "set_new" in format_comparison(rows)
+
+
+def test_bench_exporter_no_memory() -> None:
+    """Memory is not measured if disabled"""
+
+    results = run_benchmarks(
+        series_counts=[10], label_counts=[2], operations=["render"], memory=False
+    )
+
+    assert [result["operation"] for result in results["results"]] == ["render"]
+    assert results["results"][0]["peak_bytes"] is None
@@ -0,0 +1,68 @@
+"""Unit tests of the synthetic load generator and the throughput benchmark"""
+
+import json
+import time
+
+import pytest
+
+from ...promexp import PrometheusExporter
+from ...promqtt import MqttPrometheusBridge
+from ...promqtt.msg import Message
+from ...test.broker import FakeBroker
+from ..loadgen import (
+    LoadProfile,
+    TopicShapeEnum,
+    make_config,
+    make_payload,
+    make_topic,
+    send_time,
+)
+from ..throughput import format_results, run_benchmark
+
+
+def test_loadgen_payload() -> None:
+    """Payloads are JSON with the send time and padded to the payload size"""
+
+    profile = LoadProfile(values=3, payload_size=200)
+
+    before = time.perf_counter()
+    payload = make_payload(profile, seq=5)
+
+    data = json.loads(payload)
+    assert len(payload) == 200
+    assert (data["v0"], data["v1"], data["v2"]) == (5, 6, 7)
+    assert before <= send_time(payload) == data["ts"] <= time.perf_counter()
+
+
+@pytest.mark.parametrize("shape", list(TopicShapeEnum))
+def test_loadgen_config(shape: TopicShapeEnum) -> None:
+    """The generated configuration maps the messages of each topic shape"""
+
+    profile = LoadProfile(shape=shape, values=2)
+    promexp = PrometheusExporter()
+
+    with FakeBroker() as broker:
+        bridge = MqttPrometheusBridge(promexp, make_config(profile, broker))
+
+    bridge.handle_mqtt_message(
+        Message(make_topic(profile, 7), make_payload(profile, seq=1))
+    )
+
+    lines = promexp.render().split("\n")
+    assert 'bench_v0{device="dev7"} 1' in lines
+    assert 'bench_v1{device="dev7"} 2' in lines
+
+
+def test_throughput_benchmark() -> None:
+    """A benchmark run processes all messages and reports the results"""
+
+    results = run_benchmark(
+        LoadProfile(devices=10, messages=200), scrape_interval=0.01, timeout=10
+    )
+
+    assert results["processed"] == 200
+    assert results["throughput"] > 0
+    assert 0 < results["ingest_latency_p50"] <= results["ingest_latency_p99"]
+    assert "throughput" in format_results(results)
+
+    json.dumps(results)
@@ -0,0 +1,230 @@
+"""End-to-end throughput benchmark.
+
+Synthetic messages are published to an in-process MQTT broker and received by a
+`MqttClient` connected to it, which processes them like in production: through
+the ingest queue into the bridge and the prometheus exporter. While the messages
+are processed, the metrics are scraped periodically.
+
+The benchmark reports the sustained number of processed messages per second, the
+ingest latency from publishing a message until its metric updates are applied,
+and the time for rendering the metrics during ingestion.
+
+Usage: python -m promqtt.bench.throughput [options]
+
+"""
+
+import argparse
+import json
+import time
+from threading import Event, Lock, Thread
+from typing import Any
+
+from ..promexp import PrometheusExporter
+from ..promqtt import IngestQueue, MqttClient, MqttPrometheusBridge
+from ..promqtt.msg import Message
+from ..test.broker import FakeBroker
+from .loadgen import LoadProfile, TopicShapeEnum, make_config, publish_load, send_time
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Return a percentile (0 to 100) of a list of values"""
+
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[round(pct / 100 * (len(ordered) - 1))]
+
+
+class _Recorder:
+    """Record the ingest latency of processed messages"""
+
+    def __init__(self, bridge: MqttPrometheusBridge) -> None:
+        self.bridge = bridge
+        self._lock = Lock()
+        self.latencies: list[float] = []
+        self.last = 0.0
+
+    def handle(self, batch: list[Message]) -> None:
+        """Process a batch of messages and record their latencies"""
+
+        self.bridge.handle_mqtt_messages(batch)
+
+        now = time.perf_counter()
+        latencies = [now - send_time(msg.payload) for msg in batch]
+
+        with self._lock:
+            self.latencies.extend(latencies)
+            self.last = now
+
+    @property
+    def processed(self) -> int:
+        """Return the number of processed messages"""
+        return len(self.latencies)
+
+
+class _Scraper:
+    """Render the metrics periodically in a background thread"""
+
+    def __init__(self, promexp: PrometheusExporter, interval: float) -> None:
+        self._promexp = promexp
+        self._interval = interval
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="bench_scraper")
+        self.durations: list[float] = []
+
+    def start(self) -> None:
+        """Start scraping"""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop scraping"""
+
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            start = time.perf_counter()
+            self._promexp.render()
+            self.durations.append(time.perf_counter() - start)
+
+
+def run_benchmark(
+    profile: LoadProfile,
+    ingest: dict[str, Any] | None = None,
+    scrape_interval: float = 0.1,
+    timeout: float = 60.0,
+) -> dict[str, Any]:
+    """Run the benchmark for a load profile and return the results.
+
+    :param ingest: Settings of the ingest section of the configuration.
+    :param scrape_interval: Interval in seconds between scrapes.
+    :param timeout: Maximum time in seconds to wait for the messages to be
+      processed after publishing them."""
+
+    with FakeBroker() as broker:
+        cfg = make_config(profile, broker, ingest=ingest or {})
+
+        promexp = PrometheusExporter()
+        recorder = _Recorder(MqttPrometheusBridge(promexp, cfg=cfg))
+
+        queue = IngestQueue(promexp, cfg.ingest, recorder.handle)
+        queue.start()
+
+        client = MqttClient(promexp, cfg.mqtt, recorder.bridge, queue)
+        client.loop_start()
+
+        deadline = time.monotonic() + timeout
+        while not broker.subscriptions and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        scraper = _Scraper(promexp, scrape_interval)
+        scraper.start()
+
+        start = time.perf_counter()
+        publish_time = publish_load(broker, profile)
+
+        while (
+            recorder.processed + queue.dropped < profile.messages
+            and time.monotonic() < deadline + publish_time
+        ):
+            time.sleep(0.01)
+
+        scraper.stop()
+        client.loop_stop()
+        queue.stop()
+
+    duration = (recorder.last or time.perf_counter()) - start
+
+    return {
+        "profile": {
+            key: value.value if isinstance(value, TopicShapeEnum) else value
+            for key, value in profile._asdict().items()
+        },
+        "ingest": json.loads(cfg.ingest.json()),
+        "published": profile.messages,
+        "processed": recorder.processed,
+        "dropped": queue.dropped,
+        "publish_rate": profile.messages / publish_time if publish_time else 0.0,
+        "throughput": recorder.processed / duration if duration > 0 else 0.0,
+        "ingest_latency_p50": percentile(recorder.latencies, 50),
+        "ingest_latency_p99": percentile(recorder.latencies, 99),
+        "scrapes": len(scraper.durations),
+        "scrape_latency_p50": percentile(scraper.durations, 50),
+        "scrape_latency_p99": percentile(scraper.durations, 99),
+    }
+
+
+def format_results(results: dict[str, Any]) -> str:
+    """Return a human readable report of the benchmark results"""
+
+    return "\n".join(
+        [
+            f"published:   {results['published']} msgs "
+            f"({results['publish_rate']:.0f} msgs/s)",
+            f"processed:   {results['processed']} msgs, "
+            f"{results['dropped']} dropped",
+            f"throughput:  {results['throughput']:.0f} msgs/s",
+            f"ingest p50:  {results['ingest_latency_p50'] * 1e3:.2f} ms",
+            f"ingest p99:  {results['ingest_latency_p99'] * 1e3:.2f} ms",
+            f"scrape p50:  {results['scrape_latency_p50'] * 1e3:.2f} ms "
+            f"({results['scrapes']} scrapes)",
+            f"scrape p99:  {results['scrape_latency_p99'] * 1e3:.2f} ms",
+        ]
+    )
+
+
+def main() -> None:
+    """Benchmark main function"""
+
+    defaults = LoadProfile()
+
+    parser = argparse.ArgumentParser(description="promqtt throughput benchmark")
+    parser.add_argument("--devices", type=int, default=defaults.devices)
+    parser.add_argument(
+        "--shape",
+        choices=[shape.value for shape in TopicShapeEnum],
+        default=defaults.shape.value,
+    )
+    parser.add_argument(
+        "--values", type=int, default=defaults.values, help="Values per message"
+    )
+    parser.add_argument(
+        "--payload-size", type=int, default=defaults.payload_size, help="In bytes"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=defaults.rate,
+        help="Messages per second, 0 for as fast as possible",
+    )
+    parser.add_argument("--messages", type=int, default=defaults.messages)
+    parser.add_argument("--workers", type=int, default=1, help="Ingest workers")
+    parser.add_argument("--scrape-interval", type=float, default=0.1, help="In seconds")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    profile = LoadProfile(
+        devices=args.devices,
+        shape=TopicShapeEnum(args.shape),
+        values=args.values,
+        payload_size=args.payload_size,
+        rate=args.rate,
+        messages=args.messages,
+    )
+
+    results = run_benchmark(
+        profile,
+        ingest={"workers": args.workers},
+        scrape_interval=args.scrape_interval,
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print(format_results(results))
+
+
+if __name__ == "__main__":
+    main()
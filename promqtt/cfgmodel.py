@@ -3,10 +3,15 @@
 from enum import Enum
 from typing import Any
 
-from pydantic import BaseModel, Extra, Field, root_validator
+from pydantic import BaseModel, Extra, Field, root_validator, validator
 
 from .httpsrv.config import HttpServerConfig
-from .promexp.types import MetricTypeEnum
+from .promexp.types import (
+    AggregationEnum,
+    MetricTypeEnum,
+    SeriesLimitPolicyEnum,
+    WindowTypeEnum,
+)
 
 # pylint: disable=too-few-public-methods
 
@@ -17,6 +22,22 @@ class MqttModel(BaseModel):
     broker: str = Field(description="The hostname of the MQTT broker")
     port: int = Field(1883, description="The MQTT port to connect to.")
     topic: str = Field("#", description="The topic to subscribe")
+    derive_subscriptions: bool = Field(
+        False,
+        description=(
+            "Instead of subscribing to 'topic', subscribe to the topic filters "
+            "derived from the topics of the message configuration. Regex topics "
+            "are converted to filters with wildcards."
+        ),
+    )
+    share_group: str | None = Field(
+        None,
+        description=(
+            "Subscribe as member of this MQTT shared subscription group, i.e. "
+            "with the '$share/<group>/' prefix, so that the broker distributes "
+            "the messages between all promqtt instances of the group."
+        ),
+    )
 
     class Config:
         """Pydantic configuration"""
@@ -37,12 +58,100 @@ class MetricModel(BaseModel):
         ),
     )
     with_update_counter: bool = Field(False, description="Enable update counter metric")
+    max_series: int | None = Field(
+        None,
+        description=(
+            "Maximum number of instances, i.e. label combinations, of this metric. "
+            "0 for no limit. Defaults to the limit of the exporter section."
+        ),
+        ge=0,
+    )
+    series_policy: SeriesLimitPolicyEnum | None = Field(
+        None,
+        description=(
+            "Handling of new instances if the maximum number is reached. Defaults "
+            "to the policy of the exporter section."
+        ),
+    )
+    buckets: list[float] | None = Field(
+        None,
+        description=(
+            "Upper bounds of the buckets of a histogram metric. Defaults to the "
+            "buckets of the Prometheus client libraries."
+        ),
+    )
+    quantiles: list[float] | None = Field(
+        None,
+        description=(
+            "Quantiles estimated by a summary metric. Defaults to 0.5, 0.9 and 0.99."
+        ),
+    )
+    aggregation: AggregationEnum | None = Field(
+        None,
+        description=(
+            "Aggregation of the values of a gauge metric within a time window, "
+            "which is exported instead of the last value."
+        ),
+    )
+    window: float = Field(
+        0,
+        description="Length of the aggregation window in seconds",
+        ge=0,
+    )
+    window_type: WindowTypeEnum = Field(
+        WindowTypeEnum.TUMBLING,
+        description=(
+            "Type of the aggregation window. A tumbling window restarts the "
+            "aggregation every window length and exports the aggregate of the last "
+            "completed window, a sliding window aggregates the values of the window "
+            "length up to the time of the scrape."
+        ),
+    )
 
     class Config:
         """Pydantic configuration"""
 
         extra = Extra.forbid
 
+    @validator("buckets", "quantiles")
+    def check_sorted(  # pylint: disable=no-self-argument
+        cls, value: list[float] | None
+    ) -> list[float] | None:
+        """Pydantic validator to check that buckets and quantiles are increasing"""
+
+        if value is not None:
+            assert value, "At least one value is required."
+            assert all(
+                a < b for a, b in zip(value, value[1:])
+            ), "Values must be strictly increasing."
+
+        return value
+
+    @validator("quantiles")
+    def check_quantiles(  # pylint: disable=no-self-argument
+        cls, value: list[float] | None
+    ) -> list[float] | None:
+        """Pydantic validator to check the range of quantiles"""
+
+        if value is not None:
+            assert all(0 <= q <= 1 for q in value), "Quantiles must be in [0, 1]."
+
+        return value
+
+    @root_validator(skip_on_failure=True)
+    def check_aggregation(  # pylint: disable=no-self-argument
+        cls, values: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Pydantic validator to check the aggregation settings"""
+
+        if values["aggregation"] is not None:
+            assert (
+                values["type"] == MetricTypeEnum.GAUGE
+            ), "Only gauge metrics can be aggregated."
+            assert values["window"] > 0, "The aggregation requires a window."
+
+        return values
+
 
 class TypeConfig(BaseModel):
     """Configuration of a type / device"""
@@ -50,7 +159,13 @@ class TypeConfig(BaseModel):
     value: str = Field(
         description="The python expression to extract a value from the messsage"
     )
-    labels: dict[str, str] = Field(description="The labels attached to a metric")
+    labels: dict[str, str] = Field(
+        description=(
+            "The labels attached to a metric. The label values are python "
+            "expressions like the value expression. The named groups of matching "
+            "regex topics are available as 'groups', e.g. groups['device']."
+        )
+    )
 
     class Config:
         """Pydantic configuration"""
@@ -62,16 +177,219 @@ class ParserTypeEnum(Enum):
     """Types of MQTT message parsers"""
 
     JSON = "json"
+    RAW = "raw"
+    NUMBER = "number"
+    MSGPACK = "msgpack"
+    CBOR = "cbor"
 
 
 class MessageConfig(BaseModel):
     """Message configuration. This configures which types process which MQTT messages."""
 
-    topics: list[str] = Field(description="The topics which receive relevant messages")
+    topics: list[str] = Field(
+        description=(
+            "The topics which receive relevant messages. Topics can contain the "
+            "MQTT wildcards '+' and '#'. Topics starting with 're:' are regular "
+            "expressions."
+        )
+    )
     types: list[str] = Field(description="The types that process the messages")
     parser: ParserTypeEnum = Field(
         ParserTypeEnum.JSON,
-        description="The parser that converts the incoming message to a data structure.",
+        description=(
+            "The parser that converts the incoming message to a data structure. "
+            "'raw' provides the payload as string, 'number' parses a payload "
+            "consisting of a single number. 'msgpack' and 'cbor' require the "
+            "'msgpack' and 'cbor2' packages."
+        ),
+    )
+
+    class Config:
+        """Pydantic configuration"""
+
+        extra = Extra.forbid
+
+
+class OverflowPolicyEnum(Enum):
+    """Enumeration of the policies when the ingest queue is full"""
+
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+
+class IngestModel(BaseModel):
+    """Settings of the processing of received messages"""
+
+    label_cache_size: int = Field(
+        4096,
+        description=(
+            "Number of topics per type for which labels that only depend on the "
+            "topic are cached. Set to 0 to disable the cache."
+        ),
+    )
+    route_cache_size: int = Field(
+        4096,
+        description=(
+            "Number of topics for which the matching message handlers are "
+            "cached. Set to 0 to disable the cache."
+        ),
+    )
+    projection_min_size: int = Field(
+        4096,
+        description=(
+            "Minimum size in bytes of JSON payloads from which only the data "
+            "referenced by the mappings is extracted with a streaming parser. "
+            "Requires the 'ijson' package. Set to 0 to disable."
+        ),
+    )
+    payload_cache_size: int = Field(
+        4096,
+        description=(
+            "Number of topics for which a hash of the last payload and the "
+            "resulting metric updates are cached. If a payload repeats, the cached "
+            "updates are applied again without parsing and evaluating it. Set to "
+            "0 to disable the cache."
+        ),
+        ge=0,
+    )
+    workers: int = Field(
+        1,
+        description=(
+            "Number of worker threads processing the received messages. Messages "
+            "of the same topic are always processed by the same worker. Set to 0 "
+            "to process messages in the network thread of the MQTT client."
+        ),
+        ge=0,
+    )
+    queue_size: int = Field(
+        10000,
+        description=(
+            "Maximum number of received messages waiting for processing. Each "
+            "worker has its own queue with an equal share of this size."
+        ),
+        ge=0,
+    )
+    overflow: OverflowPolicyEnum = Field(
+        OverflowPolicyEnum.DROP_OLDEST,
+        description=(
+            "What to do with a received message when the queue is full: 'block' "
+            "waits for free space, stalling the MQTT client, 'drop_oldest' "
+            "discards the oldest waiting message and 'drop_newest' discards the "
+            "received message."
+        ),
+    )
+    batch_size: int = Field(
+        100,
+        description="Maximum number of messages processed by a worker at once.",
+        ge=1,
+    )
+
+    class Config:
+        """Pydantic configuration"""
+
+        extra = Extra.forbid
+
+
+class RuntimeEnum(Enum):
+    """Enumeration of the runtimes to run MQTT client and HTTP server"""
+
+    THREADED = "threaded"
+    ASYNCIO = "asyncio"
+
+
+class RuntimeModel(BaseModel):
+    """Settings of the runtime"""
+
+    mode: RuntimeEnum = Field(
+        RuntimeEnum.THREADED,
+        description=(
+            "With 'threaded', the MQTT client and the HTTP server run in separate "
+            "threads. With 'asyncio', both run on a single asyncio event loop and "
+            "received messages are processed in between. The ingest workers "
+            "setting is not used in this mode."
+        ),
+    )
+    render_in_executor: bool = Field(
+        True,
+        description=(
+            "In asyncio mode, create the HTTP responses in a separate thread, so "
+            "that receiving and processing messages continues while rendering."
+        ),
+    )
+
+    class Config:
+        """Pydantic configuration"""
+
+        extra = Extra.forbid
+
+
+class ClusterModel(BaseModel):
+    """Settings of the merged metrics of multiple promqtt instances"""
+
+    members: list[str] = Field(
+        [],
+        description=(
+            "Base URLs of the HTTP servers of the other promqtt instances, e.g. "
+            "'http://promqtt-2:8086'. If set, the '/metrics' endpoint serves the "
+            "merged metrics of this and all other instances."
+        ),
+    )
+    timeout: float = Field(
+        2.0, description="Timeout in seconds for retrieving the data of a member."
+    )
+    name: str = Field(
+        "",
+        description=(
+            "Name of this instance in the 'member' label of the merged metrics "
+            "kept per instance, e.g. the MQTT connection state. Defaults to the "
+            "host name."
+        ),
+    )
+
+    class Config:
+        """Pydantic configuration"""
+
+        extra = Extra.forbid
+
+
+class ExporterModel(BaseModel):
+    """Settings of the prometheus exporter"""
+
+    reaper_interval: float = Field(
+        0,
+        description=(
+            "Interval in seconds for removing timed out metric instances in a "
+            "background thread. Timed out instances are removed before rendering "
+            "in any case, the background thread only reduces the work of a scrape. "
+            "0 disables the background thread."
+        ),
+        ge=0,
+    )
+    max_series: int = Field(
+        0,
+        description=(
+            "Maximum number of instances of each metric without its own limit. "
+            "0 for no limit."
+        ),
+        ge=0,
+    )
+    max_total_series: int = Field(
+        0,
+        description=(
+            "Maximum total number of instances of all configured metrics, including "
+            "their update counters. 0 for no limit."
+        ),
+        ge=0,
+    )
+    series_policy: SeriesLimitPolicyEnum = Field(
+        SeriesLimitPolicyEnum.REJECT,
+        description=(
+            "Handling of new instances if the maximum number of instances of a "
+            "metric or the maximum total number is reached: 'reject' the new "
+            "instance or 'evict_lru' the least recently updated instance of the "
+            "metric."
+        ),
     )
 
     class Config:
@@ -93,12 +411,20 @@ class PromqttConfig(BaseModel):
 
     messages: list[MessageConfig]
 
+    ingest: IngestModel = Field(default_factory=lambda: IngestModel.parse_obj({}))
+
+    cluster: ClusterModel = Field(default_factory=lambda: ClusterModel.parse_obj({}))
+
+    runtime: RuntimeModel = Field(default_factory=lambda: RuntimeModel.parse_obj({}))
+
+    exporter: ExporterModel = Field(default_factory=lambda: ExporterModel.parse_obj({}))
+
     class Config:
         """Pydantic configuration"""
 
         extra = Extra.forbid
 
-    @root_validator
+    @root_validator(skip_on_failure=True)
     def check_references(  # pylint: disable=no-self-argument
         cls, values: dict[str, Any]
     ) -> dict[str, Any]:
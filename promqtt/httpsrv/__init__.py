@@ -1,9 +1,12 @@
 """HTTP server component"""
 
+from .aiohttpd import AsyncHttpServer
 from .httpd import HttpServer
-from .route import Route
+from .route import Response, Route
 
 __all__ = [
+    "AsyncHttpServer",
     "HttpServer",
+    "Response",
     "Route",
 ]
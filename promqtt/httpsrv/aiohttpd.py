@@ -0,0 +1,176 @@
+"""Implementation of the HTTP server running on an asyncio event loop"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import HttpServerConfig
+from .route import Response, Route
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpServer:
+    """HTTP server serving the routes on the running asyncio event loop. Only GET
+    requests are supported."""
+
+    # Maximum size of the request line and each header line
+    MAX_LINE = 8192
+
+    def __init__(
+        self,
+        cfg: HttpServerConfig,
+        routes: list[Route],
+        render_in_executor: bool = True,
+    ) -> None:
+        self._routes = routes
+        self._cfg = cfg
+        self._server: asyncio.Server | None = None
+
+        # A single thread is enough, as concurrent scrapes are rare
+        self._executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="http_render")
+            if render_in_executor
+            else None
+        )
+
+    @property
+    def routes(self) -> list[Route]:
+        """Return the routes"""
+
+        return self._routes
+
+    @property
+    def port(self) -> int:
+        """Return the port the server listens on, e.g. if port 0 was configured"""
+
+        if self._server is None or not self._server.sockets:
+            return self._cfg.port
+
+        return self._server.sockets[0].getsockname()[1]
+
+    def find_route(self, path: str) -> Route | None:
+        """Find a suitable route to handle the request. If no route can be found,
+        return None."""
+
+        for route in self._routes:
+            if route.can_handle(path):
+                return route
+
+        return None
+
+    async def start(self) -> None:
+        """Start serving requests on the running event loop"""
+
+        logger.info(f"Starting http server on {self._cfg.interface}:{self._cfg.port}.")
+
+        self._server = await asyncio.start_server(
+            self._handle_connection,
+            host=self._cfg.interface,
+            port=self._cfg.port,
+            limit=AsyncHttpServer.MAX_LINE,
+        )
+
+    async def stop(self) -> None:
+        """Stop serving requests"""
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def _render(self, route: Route) -> Response:
+        """Create the response of a route"""
+
+        if self._executor is None:
+            return route.response()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, route.response)
+
+    async def _handle_request(
+        self, method: str, path: str, headers: dict[str, str]
+    ) -> tuple[str, str | None, Response]:
+        """Handle a request. Returns the status, content type and the response."""
+
+        if method != "GET":
+            return "501 Not Implemented", None, Response(b"")
+
+        route = self.find_route(path)
+
+        if route is None:
+            return (
+                "404 Not Found",
+                None,
+                Response(b"URL not found. Please use /metrics path."),
+            )
+
+        try:
+            response = await self._render(route)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception(f"Failed to create response for {path}")
+            return "500 Internal Server Error", None, Response(b"")
+
+        if response.matches(headers.get("if-none-match")):
+            return "304 Not Modified", None, Response(b"", response.etag)
+
+        return "200 OK", route.content_type, response
+
+    async def _read_headers(self, reader: asyncio.StreamReader) -> dict[str, str]:
+        """Read the header lines of a request. Returns the headers with lower
+        case names."""
+
+        headers: dict[str, str] = {}
+
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Handle the requests of a connection until it is closed"""
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = await self._read_headers(reader)
+
+                method, path, version = request_line.decode("latin-1").split()
+                status, content_type, response = await self._handle_request(
+                    method, path, headers
+                )
+
+                keep_alive = version == "HTTP/1.1" and (
+                    headers.get("connection", "").lower() != "close"
+                )
+
+                head = [f"HTTP/1.1 {status}", f"Content-Length: {len(response.body)}"]
+                if content_type is not None:
+                    head.append(f"Content-type: {content_type}; charset=utf-8")
+                if response.etag is not None:
+                    head.append(f"ETag: {response.etag}")
+                if not keep_alive:
+                    head.append("Connection: close")
+
+                writer.write(
+                    ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body
+                )
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError) as ex:
+            logger.debug(f"Closing HTTP connection: {ex}")
+        finally:
+            writer.close()
@@ -21,15 +21,25 @@ class RouteHttpRequestHandler(BaseHTTPRequestHandler):
 
         route = self.find_route()
 
-        if route is not None:
-            self.send_response(200)
-            self.send_header("Content-type", f"{route.content_type}; charset=utf-8")
+        if route is None:
+            self.send_response(404)
             self.end_headers()
+            self.wfile.write(b"URL not found. Please use /metrics path.")
+            return
 
-            response = route.handler()
+        response = route.response()
 
-            self.wfile.write(response.encode("utf-8"))
-        else:
-            self.send_response(404)
+        if response.matches(self.headers.get("If-None-Match")):
+            self.send_response(304)
+            self.send_header("ETag", str(response.etag))
             self.end_headers()
-            self.wfile.write(b"URL not found. Please use /metrics path.")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-type", f"{route.content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(response.body)))
+        if response.etag is not None:
+            self.send_header("ETag", response.etag)
+        self.end_headers()
+
+        self.wfile.write(response.body)
@@ -1,13 +1,38 @@
 """Implementation of the HTTP server to serve prometheus data."""
 
-from typing import Callable
+from typing import Callable, NamedTuple
+
+
+class Response(NamedTuple):
+    """Response body of a route with an optional ETag"""
+
+    body: bytes
+
+    etag: str | None = None
+
+    def matches(self, if_none_match: str | None) -> bool:
+        """Return true if the ETag of the response matches the value of an
+        If-None-Match request header, i.e. the client has the response already."""
+
+        if self.etag is None or if_none_match is None:
+            return False
+
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+        return "*" in tags or self.etag in tags
 
 
 class Route:
     """Represents a route, i.e. a URL path and the corresponding function to
-    generate the web server response."""
+    generate the web server response. The handler returns the response as string,
+    as UTF-8 encoded bytes or as `Response` with an ETag."""
 
-    def __init__(self, path: str, content_type: str, handler: Callable[[], str]):
+    def __init__(
+        self,
+        path: str,
+        content_type: str,
+        handler: Callable[[], str | bytes | Response],
+    ):
         self._path = path
         self._content_type = content_type
         self._handler = handler
@@ -18,10 +43,23 @@ class Route:
         return self._content_type
 
     @property
-    def handler(self) -> Callable[[], str]:
+    def handler(self) -> Callable[[], str | bytes | Response]:
         """Return the handler function"""
         return self._handler
 
+    def response(self) -> Response:
+        """Call the handler and return its response"""
+
+        response = self._handler()
+
+        if isinstance(response, Response):
+            return response
+
+        if isinstance(response, str):
+            return Response(response.encode("utf-8"))
+
+        return Response(response)
+
     def can_handle(self, path: str) -> bool:
         """Return true if this route can handle the given path"""
         return path == self._path
@@ -0,0 +1,125 @@
+"""Unit tests of the asyncio HTTP server"""
+
+import asyncio
+
+import pytest
+
+from ..aiohttpd import AsyncHttpServer
+from ..config import HttpServerConfig
+from ..route import Response, Route
+
+
+async def _request(port: int, request: bytes) -> bytes:
+    """Send a raw request and return the raw response until the server closes the
+    connection."""
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    return response
+
+
+def _serve(render_in_executor: bool, *requests: bytes) -> list[bytes]:
+    """Start a server with a test route and return the responses of requests"""
+
+    def fail() -> str:
+        raise RuntimeError("Failed")
+
+    async def run() -> list[bytes]:
+        server = AsyncHttpServer(
+            HttpServerConfig(interface="127.0.0.1", port=0),
+            routes=[
+                Route("/metrics", "text/plain", lambda: "test 1"),
+                Route("/bytes", "text/plain", lambda: b"test 2"),
+                Route("/etag", "text/plain", lambda: Response(b"test 3", '"v1"')),
+                Route("/fail", "text/plain", fail),
+            ],
+            render_in_executor=render_in_executor,
+        )
+        await server.start()
+
+        try:
+            return [await _request(server.port, request) for request in requests]
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("render_in_executor", (True, False))
+def test_aiohttpd_get(render_in_executor: bool) -> None:
+    """A route is served"""
+
+    (response,) = _serve(
+        render_in_executor, b"GET /metrics HTTP/1.0\r\nHost: localhost\r\n\r\n"
+    )
+
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert b"Content-type: text/plain; charset=utf-8\r\n" in response
+    assert response.endswith(b"\r\n\r\ntest 1")
+
+
+def test_aiohttpd_get_bytes() -> None:
+    """A route handler can return the response as bytes"""
+
+    (response,) = _serve(True, b"GET /bytes HTTP/1.0\r\n\r\n")
+
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert response.endswith(b"\r\n\r\ntest 2")
+
+
+def test_aiohttpd_etag() -> None:
+    """Responses with ETag are not sent again if the client has them already"""
+
+    full, not_modified, modified = _serve(
+        True,
+        b"GET /etag HTTP/1.0\r\n\r\n",
+        b'GET /etag HTTP/1.0\r\nIf-None-Match: "v0", W/"v1"\r\n\r\n',
+        b'GET /etag HTTP/1.0\r\nIf-None-Match: "v0"\r\n\r\n',
+    )
+
+    assert b'\r\nETag: "v1"\r\n' in full
+    assert full.endswith(b"\r\n\r\ntest 3")
+
+    assert not_modified.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+    assert b'\r\nETag: "v1"\r\n' in not_modified
+    assert not_modified.endswith(
+        b'Content-Length: 0\r\nETag: "v1"\r\nConnection: close\r\n\r\n'
+    )
+
+    assert modified.startswith(b"HTTP/1.1 200 OK\r\n")
+
+
+def test_aiohttpd_keep_alive() -> None:
+    """Multiple requests can be sent on one connection"""
+
+    (response,) = _serve(
+        True,
+        b"GET /metrics HTTP/1.1\r\n\r\n"
+        b"GET /metrics HTTP/1.1\r\nConnection: close\r\n\r\n",
+    )
+
+    assert response.count(b"HTTP/1.1 200 OK") == 2
+    assert response.count(b"Connection: close") == 1
+
+
+def test_aiohttpd_errors() -> None:
+    """Unknown paths, failing routes and unsupported methods are answered with
+    an error status"""
+
+    responses = _serve(
+        True,
+        b"GET /unknown HTTP/1.0\r\n\r\n",
+        b"GET /fail HTTP/1.0\r\n\r\n",
+        b"POST /metrics HTTP/1.0\r\n\r\n",
+    )
+
+    assert [response.split(b"\r\n")[0] for response in responses] == [
+        b"HTTP/1.1 404 Not Found",
+        b"HTTP/1.1 500 Internal Server Error",
+        b"HTTP/1.1 501 Not Implemented",
+    ]
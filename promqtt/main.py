@@ -1,5 +1,6 @@
 """Application main implementation"""
 
+import asyncio
 import json
 import logging
 import os
@@ -10,11 +11,18 @@ from pathlib import Path
 import yaml
 from logfmter import Logfmter
 
-from .cfgmodel import MetricTypeEnum, PromqttConfig
-from .httpsrv import HttpServer, Route
+from .cfgmodel import MetricTypeEnum, PromqttConfig, RuntimeEnum
+from .httpsrv import AsyncHttpServer, HttpServer, Response, Route
 from .metadata import APPNAME, VERSION
 from .promexp import PrometheusExporter
-from .promqtt import MqttClient, MqttPrometheusBridge
+from .promqtt import (
+    AsyncIngestQueue,
+    CaptureWriter,
+    ClusterView,
+    IngestQueue,
+    MqttClient,
+    MqttPrometheusBridge,
+)
 from .utils import str_to_bool
 
 logger = logging.getLogger(__name__)
@@ -77,6 +85,58 @@ def load_config(filename: Path) -> PromqttConfig:
     return cfg
 
 
+def run_threaded(
+    cfg: PromqttConfig,
+    promexp: PrometheusExporter,
+    routes: list[Route],
+    recorder: CaptureWriter | None,
+) -> None:
+    """Run the HTTP server and the MQTT client in separate threads. Received
+    messages are processed by the ingest workers."""
+
+    httpsrv = HttpServer(cfg=cfg.http, routes=routes)
+    httpsrv.start_server_thread()
+
+    tmc = MqttPrometheusBridge(promexp, cfg=cfg)
+
+    ingest = IngestQueue(promexp, cfg.ingest, tmc.handle_mqtt_messages)
+    ingest.start()
+
+    try:
+        mqttclient = MqttClient(promexp, cfg.mqtt, tmc, ingest, recorder)
+        mqttclient.loop_forever()
+    finally:
+        ingest.stop()
+
+
+async def run_asyncio(
+    cfg: PromqttConfig,
+    promexp: PrometheusExporter,
+    routes: list[Route],
+    recorder: CaptureWriter | None,
+) -> None:
+    """Run the HTTP server and the MQTT client on the asyncio event loop. Received
+    messages are processed on the event loop in between network I/O."""
+
+    httpsrv = AsyncHttpServer(
+        cfg=cfg.http, routes=routes, render_in_executor=cfg.runtime.render_in_executor
+    )
+    await httpsrv.start()
+
+    tmc = MqttPrometheusBridge(promexp, cfg=cfg)
+
+    ingest = AsyncIngestQueue(
+        promexp, cfg.ingest, tmc.handle_mqtt_messages, asyncio.get_running_loop()
+    )
+
+    mqttclient = MqttClient(promexp, cfg.mqtt, tmc, ingest, recorder)
+
+    try:
+        await mqttclient.loop_asyncio()
+    finally:
+        await httpsrv.stop()
+
+
 def main():
     """Application main function"""
 
@@ -99,18 +159,47 @@ def main():
 
     # Intialize and start the HTTP server
 
+    cluster = ClusterView(promexp, cfg.cluster)
+
     routes = [
-        Route("/metrics", "text/plain", promexp.render),
+        Route(
+            "/metrics",
+            "text/plain",
+            (
+                (lambda: Response(*cluster.render_with_etag()))
+                if cluster.members
+                else lambda: Response(*promexp.render_with_etag())
+            ),
+        ),
+        Route(
+            "/state",
+            "application/json",
+            lambda: Response(*cluster.render_state_with_etag()),
+        ),
         Route("/cfg", "application/json", lambda: json.dumps(cfg.dict(), indent=4)),
     ]
 
-    httpsrv = HttpServer(cfg=cfg.http, routes=routes)
-    httpsrv.start_server_thread()
+    # Record received messages to a capture file for replaying them later
 
-    tmc = MqttPrometheusBridge(promexp, cfg=cfg)
+    recfile = os.environ.get("PROMQTT_RECORD")
+    recorder = None
+    if recfile:
+        logger.info(f"Recording received messages to '{recfile}'.")
+        recorder = CaptureWriter(Path(recfile))
+
+    if cfg.exporter.reaper_interval:
+        promexp.start_reaper(cfg.exporter.reaper_interval)
+
+    try:
+        if cfg.runtime.mode == RuntimeEnum.ASYNCIO:
+            asyncio.run(run_asyncio(cfg, promexp, routes, recorder))
+        else:
+            run_threaded(cfg, promexp, routes, recorder)
+    finally:
+        promexp.stop_reaper()
 
-    mqttclient = MqttClient(promexp, cfg.mqtt, tmc)
-    mqttclient.loop_forever()
+        if recorder is not None:
+            recorder.close()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
 """Prometheus exporter package"""
 
+from .limit import SeriesLimit
+from .merge import merge_states
 from .promexp import PrometheusExporter
 
 # __all__ = ["PrometheusExporter"]
@@ -0,0 +1,307 @@
+"""Distributions of observed values for histogram and summary metrics.
+
+A histogram counts the observations per bucket, a summary estimates quantiles of
+the observations with the P² algorithm, which needs constant memory and time per
+observation. See R. Jain and I. Chlamtac, "The P² algorithm for dynamic
+calculation of quantiles and histograms without storing observations",
+Communications of the ACM, 1985.
+
+"""
+
+import math
+from bisect import bisect_left, bisect_right
+from typing import Any, Sequence
+
+# Default buckets of the Prometheus client libraries
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+)
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _label_string(label_str: str, name: str, value: float) -> str:
+    """Add a label with a float value to a label string"""
+
+    value_str = "+Inf" if value == math.inf else str(float(value))
+    label = f'{name}="{value_str}"'
+
+    return f"{label_str},{label}" if label_str else label
+
+
+class Histogram:
+    """Count observations in buckets with upper bounds. Observing a value costs
+    O(log buckets)."""
+
+    __slots__ = ("_bounds", "_counts", "_sum", "_count")
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        # Sorted upper bounds of the buckets, without +Inf
+        self._bounds = tuple(sorted(bound for bound in bounds if bound != math.inf))
+
+        # Number of observations per bucket, not cumulative. The last bucket
+        # counts the observations above the largest bound.
+        self._counts = [0] * (len(self._bounds) + 1)
+
+        self._sum = 0.0
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        """Return the number of observations"""
+        return self._count
+
+    def observe(self, value: float) -> None:
+        """Add an observation"""
+
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def lines(self, name: str, label_str: str) -> list[str]:
+        """Return the lines in Prometheus format: the cumulative count per bucket,
+        the sum and the count of the observations."""
+
+        lines = []
+        cumulative = 0
+
+        for bound, count in zip((*self._bounds, math.inf), self._counts):
+            cumulative += count
+            lines.append(
+                f"{name}_bucket{{{_label_string(label_str, 'le', bound)}}} {cumulative}"
+            )
+
+        lines.append(f"{name}_sum{{{label_str}}} {self._sum}")
+        lines.append(f"{name}_count{{{label_str}}} {self._count}")
+
+        return lines
+
+    def get_state(self) -> dict[str, Any]:
+        """Return the histogram as JSON serializable structure"""
+
+        return {
+            "buckets": list(self._bounds),
+            "counts": list(self._counts),
+            "sum": self._sum,
+            "count": self._count,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict[str, Any]) -> "Histogram":
+        """Create a histogram from its state returned by `get_state()`"""
+
+        histogram = cls(state["buckets"])
+        histogram._counts = list(state["counts"])
+        histogram._sum = state["sum"]
+        histogram._count = state["count"]
+
+        return histogram
+
+
+def merge_histogram_states(
+    state1: dict[str, Any], state2: dict[str, Any]
+) -> dict[str, Any]:
+    """Merge the states of two histograms with the same buckets by adding up their
+    observations"""
+
+    if state1["buckets"] != state2["buckets"]:
+        raise ValueError("Cannot merge histograms with different buckets")
+
+    return {
+        "buckets": state1["buckets"],
+        "counts": [a + b for a, b in zip(state1["counts"], state2["counts"])],
+        "sum": state1["sum"] + state2["sum"],
+        "count": state1["count"] + state2["count"],
+    }
+
+
+class _P2Quantile:
+    """Estimate a quantile with the P² algorithm using five markers"""
+
+    __slots__ = ("_quantile", "_heights", "_positions", "_desired", "_increments")
+
+    def __init__(self, quantile: float) -> None:
+        self._quantile = quantile
+
+        # Heights of the markers. Until there are five observations, these are the
+        # sorted observations.
+        self._heights: list[float] = []
+
+        # Actual and desired positions of the markers
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self._increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def observe(self, value: float) -> None:
+        """Add an observation"""
+
+        heights = self._heights
+
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        positions = self._positions
+
+        # Find the cell of the observation and adjust the extreme markers
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            # heights[cell] <= value < heights[cell + 1]
+            cell = bisect_right(heights, value, 1, 4) - 1
+
+        for index in range(cell + 1, 5):
+            positions[index] += 1
+
+        for index in range(5):
+            self._desired[index] += self._increments[index]
+
+        # Adjust the heights of the middle markers if they are off their desired
+        # positions
+        for index in range(1, 4):
+            delta = self._desired[index] - positions[index]
+
+            if (delta >= 1 and positions[index + 1] - positions[index] > 1) or (
+                delta <= -1 and positions[index - 1] - positions[index] < -1
+            ):
+                step = 1 if delta > 0 else -1
+                height = self._parabolic(index, step)
+
+                if not heights[index - 1] < height < heights[index + 1]:
+                    height = self._linear(index, step)
+
+                heights[index] = height
+                positions[index] += step
+
+    def _parabolic(self, index: int, step: int) -> float:
+        """Return the piecewise-parabolic prediction of a marker height"""
+
+        heights, positions = self._heights, self._positions
+
+        return heights[index] + step / (positions[index + 1] - positions[index - 1]) * (
+            (positions[index] - positions[index - 1] + step)
+            * (heights[index + 1] - heights[index])
+            / (positions[index + 1] - positions[index])
+            + (positions[index + 1] - positions[index] - step)
+            * (heights[index] - heights[index - 1])
+            / (positions[index] - positions[index - 1])
+        )
+
+    def _linear(self, index: int, step: int) -> float:
+        """Return the linear prediction of a marker height"""
+
+        heights, positions = self._heights, self._positions
+
+        return heights[index] + step * (heights[index + step] - heights[index]) / (
+            positions[index + step] - positions[index]
+        )
+
+    @property
+    def value(self) -> float:
+        """Return the estimated quantile"""
+
+        heights = self._heights
+
+        if len(heights) < 5:
+            if not heights:
+                return math.nan
+            return heights[round(self._quantile * (len(heights) - 1))]
+
+        return heights[2]
+
+
+class Summary:
+    """Estimate quantiles of the observations. Observing a value costs constant time
+    per quantile."""
+
+    __slots__ = ("_estimators", "_fixed", "_sum", "_count")
+
+    def __init__(self, quantiles: Sequence[float]) -> None:
+        self._estimators = {quantile: _P2Quantile(quantile) for quantile in quantiles}
+
+        # Quantile values of a summary restored from its state
+        self._fixed: dict[float, float] = {}
+
+        self._sum = 0.0
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        """Return the number of observations"""
+        return self._count
+
+    def observe(self, value: float) -> None:
+        """Add an observation"""
+
+        for estimator in self._estimators.values():
+            estimator.observe(value)
+
+        self._fixed.clear()
+        self._sum += value
+        self._count += 1
+
+    def quantiles(self) -> dict[float, float]:
+        """Return the estimated value per quantile"""
+
+        if self._fixed:
+            return dict(self._fixed)
+
+        return {
+            quantile: estimator.value
+            for quantile, estimator in self._estimators.items()
+        }
+
+    def lines(self, name: str, label_str: str) -> list[str]:
+        """Return the lines in Prometheus format: the estimated value per quantile,
+        the sum and the count of the observations."""
+
+        lines = [
+            f"{name}{{{_label_string(label_str, 'quantile', quantile)}}} {value}"
+            for quantile, value in self.quantiles().items()
+        ]
+
+        lines.append(f"{name}_sum{{{label_str}}} {self._sum}")
+        lines.append(f"{name}_count{{{label_str}}} {self._count}")
+
+        return lines
+
+    def get_state(self) -> dict[str, Any]:
+        """Return the summary as JSON serializable structure"""
+
+        return {
+            "quantiles": [
+                [quantile, value] for quantile, value in self.quantiles().items()
+            ],
+            "sum": self._sum,
+            "count": self._count,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict[str, Any]) -> "Summary":
+        """Create a summary from its state returned by `get_state()`. The quantile
+        values are fixed until a value is observed."""
+
+        summary = cls([quantile for quantile, _ in state["quantiles"]])
+        summary._fixed = dict(state["quantiles"])
+        summary._sum = state["sum"]
+        summary._count = state["count"]
+
+        return summary
@@ -0,0 +1,39 @@
+"""Limit of the total number of metric instances"""
+
+from threading import Lock
+
+
+class SeriesLimit:
+    """Limit of the total number of instances shared by multiple metrics. Each
+    metric acquires a slot for a new instance and releases it when the instance is
+    removed.
+
+    The lock of the limit is only held while counting, so it can be used while
+    holding the lock of a metric."""
+
+    def __init__(self, max_series: int) -> None:
+        self._max_series = max_series
+        self._count = 0
+        self._lock = Lock()
+
+    @property
+    def count(self) -> int:
+        """Return the number of instances"""
+        return self._count
+
+    def acquire(self) -> bool:
+        """Acquire a slot for a new instance. Returns False if the limit is
+        reached."""
+
+        with self._lock:
+            if self._count >= self._max_series:
+                return False
+
+            self._count += 1
+            return True
+
+    def release(self, count: int = 1) -> None:
+        """Release the slots of removed instances"""
+
+        with self._lock:
+            self._count -= count
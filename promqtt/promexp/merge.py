@@ -0,0 +1,93 @@
+"""Merge the data of multiple prometheus exporters.
+
+When multiple promqtt instances share the load of processing MQTT messages, the
+same metric instance can be updated by any of them. The states returned by
+`PrometheusExporter.get_state()` of all instances are merged into a single
+exporter, which contains each metric instance exactly once.
+
+Metrics describing the instances themselves, e.g. their connection state, and
+summaries, whose quantiles cannot be merged, are kept for each instance. Their
+instances get the additional label 'member' with the name of the instance.
+
+"""
+
+from typing import Any, Iterable
+
+from .distribution import merge_histogram_states
+from .promexp import PrometheusExporter
+from .types import MetricTypeEnum
+from .utils import _get_label_string
+
+# Label with the name of the member of metrics kept per member
+MEMBER_LABEL = "member"
+
+
+def merge_states(
+    states: Iterable[dict[str, Any]], hide_empty_metrics: bool = False
+) -> PrometheusExporter:
+    """Merge exporter states into a new prometheus exporter.
+
+    For metrics with merge mode 'sum', the values of all states are summed up, for
+    histograms the observations per bucket. For merge mode 'member', the
+    instances of each state are kept with the name of the state's member as label.
+    The name is taken from the key 'member' of a state and defaults to its index.
+    Otherwise the value with the smallest age is used. The help text, type,
+    buckets and quantiles of a metric are taken from the first state containing
+    it."""
+
+    merged: dict[str, dict[str, Any]] = {}
+
+    for index, state in enumerate(states):
+        member = str(state.get("member", index))
+
+        for metric in state["metrics"]:
+            target = merged.setdefault(
+                metric["name"],
+                {
+                    "type": metric["type"],
+                    "help": metric["help"],
+                    "merge": metric.get("merge", "latest"),
+                    "buckets": metric.get("buckets"),
+                    "quantiles": metric.get("quantiles"),
+                    "series": {},
+                },
+            )
+
+            for series in metric["series"]:
+                if target["merge"] == "member":
+                    series = {
+                        **series,
+                        "labels": {**series["labels"], MEMBER_LABEL: member},
+                    }
+
+                key = _get_label_string(series["labels"])
+                current = target["series"].get(key)
+
+                if current is None:
+                    target["series"][key] = dict(series)
+                elif target["merge"] == "sum":
+                    if target["type"] == MetricTypeEnum.HISTOGRAM.value:
+                        current["value"] = merge_histogram_states(
+                            current["value"], series["value"]
+                        )
+                    else:
+                        current["value"] += series["value"]
+                    current["age"] = min(current["age"], series["age"])
+                elif series["age"] < current["age"]:
+                    target["series"][key] = dict(series)
+
+    promexp = PrometheusExporter(hide_empty_metrics=hide_empty_metrics)
+
+    for name, metric in merged.items():
+        promexp.register(
+            name=name,
+            datatype=MetricTypeEnum(metric["type"]),
+            helpstr=metric["help"],
+            buckets=metric["buckets"],
+            quantiles=metric["quantiles"],
+        )
+
+        for series in metric["series"].values():
+            promexp.restore(name, series["labels"], series["value"])
+
+    return promexp
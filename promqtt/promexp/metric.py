@@ -1,15 +1,102 @@
 """Implementation of a metric"""
 
-from typing import Iterator
+import heapq
+from collections import OrderedDict
+from itertools import count
+from operator import itemgetter
+from threading import Lock
+from typing import Any, Callable, Iterator, Sequence, cast
 
-from .metric_inst import MetricInstance
-from .types import MetricTypeEnum
-from .utils import _get_label_string
+from .distribution import DEFAULT_BUCKETS, DEFAULT_QUANTILES, Histogram, Summary
+from .exceptions import PrometheusExporterException
+from .limit import SeriesLimit
+from .metric_inst import AggregateInstance, DistributionInstance, MetricInstance
+from .types import (
+    AggregationEnum,
+    MetricTypeEnum,
+    SeriesLimitPolicyEnum,
+    WindowTypeEnum,
+)
+from .window import make_window
 
+# Key of a metric instance: the sorted label names and the label values in the
+# same order. For a single label, the value is used instead of a tuple.
+LabelKey = tuple[tuple[str, ...], Any]
 
-class Metric:
+
+def _key_labels(names: tuple[str, ...], values: Any) -> dict[str, Any]:
+    """Return the labels of a metric instance from its sorted label names and
+    label values"""
+
+    if len(names) == 1:
+        values = (values,)
+
+    return dict(zip(names, values))
+
+
+def _values_getter(names: tuple[str, ...]) -> Callable[[dict], Any]:
+    """Return a function returning the label values for the sorted label names as
+    strings, for a single label the value instead of a tuple. Label values are
+    usually strings already, so they are only converted if needed."""
+
+    if not names:
+        return lambda _: ()
+
+    getter = itemgetter(*names)
+
+    if len(names) == 1:
+
+        def get_value(labels: dict) -> Any:
+            value = getter(labels)
+            return value if isinstance(value, str) else str(value)
+
+        return get_value
+
+    def get_values(labels: dict) -> Any:
+        values = getter(labels)
+
+        for value in values:
+            if not isinstance(value, str):
+                return tuple(map(str, values))
+
+        return values
+
+    return get_values
+
+
+class Metric:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
     """Represents a Prometheus metric, i.e. a metric name with its helptext and type
-    information."""
+    information.
+
+    Each metric has its own lock protecting its instances. Rendering copies the
+    instances under the lock and formats the copy without holding it, so that
+    concurrent updates of a metric are only blocked for the time of the copy.
+
+    The generation of a metric is increased on every change of its instances. The
+    rendered metric is cached until the generation changes.
+
+    Instances are stored per set of label names and keyed by their label values.
+    The label names of the updates of a metric are usually the same, so the sorted
+    label names and a getter for the label values in this order are cached per
+    order of label names. Label values are converted to strings for the key, as
+    they are rendered as strings.
+
+    For metrics with timeout, the instances are kept in a heap ordered by the time
+    of their last update. Checking for timeouts only inspects the oldest entries.
+    Updating an instance does not touch the heap. Outdated entries of updated or
+    removed instances are skipped lazily when they reach the top of the heap.
+
+    The number of instances can be limited. If the limit is reached, new instances
+    are rejected or the least recently updated instance is evicted. For evicting,
+    the instances are kept in order of their last update. Additionally, a limit of
+    the total number of instances can be shared with other metrics. If it is
+    reached, a new instance of a metric evicting instances replaces the least
+    recently updated instance of the same metric.
+
+    The instances of histograms and summaries are distributions of the values set,
+    each value is added as observation. Gauges can aggregate the values set within
+    a time window instead of keeping the last value. As the aggregates change with
+    time, they are refreshed before rendering, see `refresh_windows()`."""
 
     def __init__(  # pylint: disable=too-many-arguments
         self,
@@ -18,13 +105,73 @@ class Metric:
         helpstr: str,
         timeout: int = 0,
         with_update_counter: bool = False,
+        *,
+        max_series: int = 0,
+        series_policy: SeriesLimitPolicyEnum = SeriesLimitPolicyEnum.REJECT,
+        buckets: Sequence[float] | None = None,
+        quantiles: Sequence[float] | None = None,
+        aggregation: AggregationEnum | None = None,
+        window: float = 0,
+        window_type: WindowTypeEnum = WindowTypeEnum.TUMBLING,
+        total_limit: SeriesLimit | None = None,
     ) -> None:
+        if aggregation is not None:
+            if datatype != MetricTypeEnum.GAUGE:
+                raise PrometheusExporterException(
+                    f"Cannot aggregate the values of {datatype.value} metric '{name}'"
+                )
+
+            if window <= 0:
+                raise PrometheusExporterException(
+                    f"The aggregation window of metric '{name}' must be positive"
+                )
+
         self._name = name
         self._datatype = datatype
         self._helpstr = helpstr
         self._timeout = timeout
-        self._data: dict[str, "MetricInstance"] = {}
+        self._data: dict[tuple[str, ...], dict[Any, MetricInstance]] = {}
+        self._schemas: dict[
+            tuple[str, ...], tuple[tuple[str, ...], Callable[[dict], Any]]
+        ] = {}
         self._with_update_counter = with_update_counter
+        self._lock = Lock()
+
+        self._header = (
+            f"# HELP {name} {helpstr}\n# TYPE {name} {datatype.value}".encode("utf-8")
+        )
+
+        self._generation = 0
+        self._rendered: tuple[int, bytes] | None = None
+
+        # Heap of (timestamp, sequence number, label names, label values, instance)
+        # of the instances of metrics with timeout, with one entry per instance
+        self._expiry: list[tuple[float, int, tuple[str, ...], Any, MetricInstance]] = []
+        self._expiry_seq = count()
+
+        self._max_series = max_series
+        self._total_limit = total_limit
+        self._evict = (bool(max_series) or total_limit is not None) and (
+            series_policy == SeriesLimitPolicyEnum.EVICT_LRU
+        )
+        self._rejected = 0
+        self._evicted = 0
+
+        # Buckets of histograms and quantiles of summaries, as well as the factory
+        # of the distributions of their instances
+        self._buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+        self._quantiles = tuple(sorted(quantiles or DEFAULT_QUANTILES))
+        self._distribution: Callable[[], Histogram | Summary] | None = None
+
+        if datatype == MetricTypeEnum.HISTOGRAM:
+            self._distribution = lambda: Histogram(self._buckets)
+        elif datatype == MetricTypeEnum.SUMMARY:
+            self._distribution = lambda: Summary(self._quantiles)
+
+        # Aggregation of the values within a window
+        self._aggregation = aggregation
+        self._window = window
+        self._window_type = window_type
 
     @property
     def name(self) -> str:
@@ -55,56 +202,181 @@ class Metric:
 
         return self._with_update_counter
 
+    @property
+    def aggregation(self) -> AggregationEnum | None:
+        """Return the aggregation of the values within a window, if any"""
+
+        return self._aggregation
+
+    @property
+    def rejected(self) -> int:
+        """Return the number of new instances rejected due to the limit"""
+
+        return self._rejected
+
+    @property
+    def evicted(self) -> int:
+        """Return the number of instances evicted due to the limit"""
+
+        return self._evicted
+
     def set(self, labels: dict[str, str], value: float | None):
         """Set a value for a metric instance"""
 
-        labelstr = _get_label_string(labels)
+        with self._lock:
+            self._set(labels, value)
+
+    def restore(self, labels: dict[str, Any], state: Any) -> None:
+        """Set a metric instance to a state as returned by `get_state()`"""
+
+        with self._lock:
+            if self._distribution is None:
+                self._set(labels, state)
+                return
+
+            distribution = (
+                Histogram.from_state(state)
+                if self._datatype == MetricTypeEnum.HISTOGRAM
+                else Summary.from_state(state)
+            )
+
+            self._set(labels, None)
+            self._set(labels, None, distribution)
+
+    def _set(
+        self,
+        labels: dict[str, str],
+        value: float | None,
+        distribution: Histogram | Summary | None = None,
+    ) -> None:
+        """Set a value for a metric instance. The lock must be held by the
+        caller.
+
+        :param distribution: Distribution of a new histogram or summary instance,
+          by default an empty one."""
+
+        names, values = self._label_key(labels)
+
+        series = self._data.get(names)
+        if series is None:
+            series = self._data.setdefault(names, OrderedDict() if self._evict else {})
+
+        instance = series.get(values)
 
         # If we do not know this instance yet
-        if labelstr not in self._data:
+        if instance is None:
             # we do not add new metrics without assigned value
-            if value is None:
+            if value is None and distribution is None:
                 return
 
-            # we don't know this instance yet, so we create a new one
-            self._data[labelstr] = MetricInstance(
-                metric=self, labels=labels, value=value
-            )
+            # we don't know this instance yet, so we create a new one. It is
+            # created before checking the limits, so that a value it cannot
+            # take neither uses up a slot nor evicts another instance.
+            instance = self._new_instance(labels, value, distribution)
+
+            if self._max_series and len(self) >= self._max_series:
+                if not self._evict:
+                    self._rejected += 1
+                    return
+
+                self._evict_lru()
+
+            elif self._total_limit is not None and not self._total_limit.acquire():
+                if not (self._evict and len(self)):
+                    self._rejected += 1
+                    return
+
+                # the new instance takes the slot of the evicted one
+                self._evict_lru()
+
+            series[values] = instance
+
+            if self._timeout:
+                self._schedule_expiry(names, values, instance)
 
         # we already know this instance
         else:
             # if the value is None, we remove it
             if value is None:
-                del self._data[labelstr]
+                del series[values]
+
+                if self._total_limit is not None:
+                    self._total_limit.release()
             else:
                 # we know this instance, so we update its value
-                instance = self._data[labelstr]
                 instance.value = value
 
+                if self._evict:
+                    cast(OrderedDict, series).move_to_end(values)
+
+        self._generation += 1
+
+    def _new_instance(
+        self,
+        labels: dict[str, str],
+        value: float | None,
+        distribution: Histogram | Summary | None,
+    ) -> MetricInstance:
+        """Create a new metric instance, for histograms and summaries with a
+        distribution, for aggregated metrics with a window"""
+
+        if self._aggregation is not None:
+            return AggregateInstance(
+                metric=self,
+                labels=labels,
+                value=cast(float, value),
+                window=make_window(self._aggregation, self._window, self._window_type),
+            )
+
+        if self._distribution is None:
+            return MetricInstance(metric=self, labels=labels, value=cast(float, value))
+
+        return DistributionInstance(
+            metric=self,
+            labels=labels,
+            value=value,
+            distribution=distribution or self._distribution(),
+        )
+
+    def _label_key(self, labels: dict[str, Any]) -> LabelKey:
+        """Return the key of the metric instance with the given labels"""
+
+        names = tuple(labels)
+        schema = self._schemas.get(names)
+
+        if schema is None:
+            sorted_names = tuple(sorted(names))
+            schema = self._schemas.setdefault(
+                names, (sorted_names, _values_getter(sorted_names))
+            )
+
+        return schema[0], schema[1](labels)
+
     def get(self, labels: dict[str, str]) -> float | None:
         """Return the last stored value of a metric instance. Returns None if
         the instance does not exist."""
 
-        labelstr = _get_label_string(labels)
+        names, values = self._label_key(labels)
+        inst = self._data.get(names, {}).get(values)
 
         # If we do not know this instance yet
-        if labelstr not in self._data:
+        if inst is None:
             return None
 
-        inst = self._data[labelstr]
         return inst.value
 
     def inc(self, labels: dict[str, str]):
         """Increases the value of the metric instance by one."""
 
-        val = self.get(labels)
+        with self._lock:
+            val = self.get(labels)
 
-        if val is None:
-            val = 0
+            if val is None:
+                val = 0
 
-        val += 1
+            val += 1
 
-        self.set(labels, val)
+            self._set(labels, val)
 
     @property
     def has_timeout(self) -> bool:
@@ -112,19 +384,183 @@ class Metric:
 
         return bool(self.timeout)
 
-    def check_timeout(self) -> None:
-        """Check all metric instances for timeout and remove the timed out instances."""
+    def _schedule_expiry(
+        self, names: tuple[str, ...], values: Any, instance: MetricInstance
+    ) -> None:
+        """Add an instance to the expiry heap with the time of its last update. The
+        lock must be held by the caller."""
 
-        # find all timed out metric instances
-        to_delete = [
-            labelstr
-            for labelstr, instance in self._data.items()
-            if instance.is_timed_out
+        heapq.heappush(
+            self._expiry,
+            (instance.timestamp, next(self._expiry_seq), names, values, instance),
+        )
+
+    def _evict_lru(self) -> None:
+        """Remove the least recently updated instance. The instances of each set of
+        label names are ordered by their last update, so only the first instance
+        of each set needs to be compared. The lock must be held by the caller."""
+
+        oldest = min(
+            (series for series in self._data.values() if series),
+            key=lambda series: next(iter(series.values())).timestamp,
+        )
+        cast(OrderedDict, oldest).popitem(last=False)
+        self._evicted += 1
+
+    def _instances(self) -> Iterator[MetricInstance]:
+        """Return an iterator over all metric instances. The lock must be held by
+        the caller."""
+
+        for series in self._data.values():
+            yield from series.values()
+
+    def check_timeout(self) -> None:
+        """Check the metric instances for timeout and remove the timed out
+        instances. Only the instances which were not updated for the longest time
+        are checked, until one has not timed out."""
+
+        if not self.has_timeout:
+            return
+
+        with self._lock:
+            removed = 0
+
+            while self._expiry:
+                timestamp, _, names, values, instance = self._expiry[0]
+                series = self._data[names]
+
+                if series.get(values) is not instance:
+                    # the instance was removed already
+                    heapq.heappop(self._expiry)
+
+                elif instance.timestamp != timestamp:
+                    # the instance was updated, so it moves back in the heap
+                    heapq.heappop(self._expiry)
+                    self._schedule_expiry(names, values, instance)
+
+                elif instance.is_timed_out:
+                    heapq.heappop(self._expiry)
+                    del series[values]
+                    removed += 1
+
+                else:
+                    break
+
+            if removed:
+                self._generation += 1
+
+                if self._total_limit is not None:
+                    self._total_limit.release(removed)
+
+    def refresh_windows(self) -> None:
+        """Update the aggregates of the instances of an aggregated metric, which
+        changed without updates as time passed."""
+
+        if self._aggregation is None:
+            return
+
+        with self._lock:
+            changed = False
+
+            for instance in self._instances():
+                if cast(AggregateInstance, instance).refresh():
+                    changed = True
+
+            if changed:
+                self._generation += 1
+
+    def get_state(self) -> dict[str, Any]:
+        """Return the metric and its instances as JSON serializable structure. The
+        time since the last update of an instance is given as age in seconds."""
+
+        with self._lock:
+            series = [
+                {
+                    "labels": _key_labels(names, values),
+                    "value": instance.state,
+                    "age": instance.age,
+                }
+                for names, instances in self._data.items()
+                for values, instance in instances.items()
+            ]
+
+        state: dict[str, Any] = {
+            "name": self._name,
+            "type": self._datatype.value,
+            "help": self._helpstr,
+            "series": series,
+        }
+
+        if self._datatype == MetricTypeEnum.HISTOGRAM:
+            state["buckets"] = list(self._buckets)
+        elif self._datatype == MetricTypeEnum.SUMMARY:
+            state["quantiles"] = list(self._quantiles)
+
+        return state
+
+    def _format_lines(self) -> tuple[int, list[bytes]]:
+        """Return the generation and the exposition lines of all metric instances.
+
+        The cached lines and copies of the data of the other instances are taken
+        consistently under the lock, the copies are formatted without holding it.
+        The formatted lines are cached by the instances if the metric did not
+        change meanwhile."""
+
+        with self._lock:
+            generation = self._generation
+            instances = list(self._instances())
+            sources = [instance.line_source() for instance in instances]
+
+        lines = [src if isinstance(src, bytes) else src() for src in sources]
+
+        formatted = [
+            (instance, line)
+            for instance, src, line in zip(instances, sources, lines)
+            if not isinstance(src, bytes)
         ]
 
-        # remove the metric instances
-        for labelstr in to_delete:
-            del self._data[labelstr]
+        if formatted:
+            with self._lock:
+                if self._generation == generation:
+                    for instance, line in formatted:
+                        instance.cache_line(line)
+
+        return generation, lines
+
+    def lines(self) -> list[bytes]:
+        """Return the exposition lines of all metric instances. The lines are
+        cached by the instances until their value changes."""
+
+        return self._format_lines()[1]
+
+    @property
+    def generation(self) -> int:
+        """Return the generation of the metric, which is increased on every change
+        of its instances."""
+
+        return self._generation
+
+    def rendered(self) -> bytes:
+        """Return the metric rendered to Prometheus format as UTF-8 encoded bytes,
+        including the HELP and TYPE lines. The result is cached until the metric
+        changes."""
+
+        cached = self._rendered
+        if cached is not None and cached[0] == self._generation:
+            return cached[1]
+
+        generation, lines = self._format_lines()
+
+        rendered = b"\n".join([self._header, *lines])
+        self._rendered = (generation, rendered)
+
+        return rendered
+
+    @property
+    def header(self) -> bytes:
+        """Return the HELP and TYPE lines of the metric in Prometheus format"""
+
+        return self._header
 
     def render_iter(self) -> Iterator[str]:
         """Return an iterator returning separate lines in Prometheus format"""
@@ -132,7 +568,8 @@ class Metric:
         yield f"# HELP {self.name} {self.helptext}"
         yield f"# TYPE {self.name} {self.datatype.value}"
 
-        yield from (str(instance) for instance in self._data.values())
+        for line in self.lines():
+            yield from line.decode("utf-8").split("\n")
 
     def render(self) -> str:
         """Render the metric to Prometheus format"""
@@ -144,4 +581,7 @@ class Metric:
 
     def __len__(self) -> int:
         """Returns the number of metric instances."""
-        return len(self._data)
+
+        # Copying the values is atomic, so that sets of label names can be added
+        # concurrently
+        return sum(map(len, list(self._data.values())))
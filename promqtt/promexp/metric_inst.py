@@ -1,24 +1,55 @@
 """Implementation of the metric instance"""
 
 import logging
-from typing import TYPE_CHECKING
+import sys
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable
 
+from .distribution import Histogram, Summary
 from .utils import _get_label_string, get_current_time
+from .window import SlidingWindow, TumblingWindow
 
 if TYPE_CHECKING:
     from .metric import Metric
 
 logger = logging.getLogger(__name__)
 
+# Exposition line of an instance, or a function formatting it
+LineSource = bytes | Callable[[], bytes]
+
+
+def _format_line(name: str, label_str: str, value: float) -> bytes:
+    """Format the exposition line of an instance"""
+
+    return f"{name}{{{label_str}}} {value}".encode("utf-8")
+
+
+def _format_distribution(
+    distribution: Histogram | Summary, name: str, label_str: str
+) -> bytes:
+    """Format the exposition lines of a histogram or summary instance"""
+
+    return "\n".join(distribution.lines(name, label_str)).encode("utf-8")
+
 
 class MetricInstance:
     """Represents a single metric instance. Instances are identified by a unique
-    combination of labels and a value."""
+    combination of labels and a value.
+
+    The exposition line of the instance is cached as bytes until the value
+    changes.
+
+    As there can be hundreds of thousands of instances, they are kept small: the
+    attributes are slotted, the labels are only kept as label string, which is
+    interned to share it between the metrics with the same labels, and the time
+    of the last update is a float of a monotonic clock."""
+
+    __slots__ = ("_metric", "_label_str", "_value", "_timestamp", "_line")
 
     def __init__(self, metric: "Metric", labels: dict[str, str], value: float):
         self._metric = metric
-        self._labels = labels
-        self._label_str = _get_label_string(labels)
+        self._label_str = sys.intern(_get_label_string(labels))
+        self._line: bytes | None = None
 
         self.value = value
 
@@ -34,14 +65,23 @@ class MetricInstance:
 
         self._value = value
         self._timestamp = get_current_time()
+        self._line = None
+
+        # Avoid formatting the instance on every update if not logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Set metric instance {self}")
+
+    @property
+    def timestamp(self) -> float:
+        """Return the time of the last update of the value"""
 
-        logger.debug(f"Set metric instance {self}")
+        return self._timestamp
 
     @property
     def age(self) -> float:
         """Return the age of the metric value, i.e. when it was last set."""
 
-        return (get_current_time() - self._timestamp).total_seconds()
+        return get_current_time() - self._timestamp
 
     @property
     def is_timed_out(self) -> bool:
@@ -52,10 +92,142 @@ class MetricInstance:
 
         return self.age >= self._metric.timeout
 
+    @property
+    def state(self) -> Any:
+        """Return the value as JSON serializable structure"""
+        return self._value
+
     @property
     def label_string(self) -> str:
         """Return the label string of this instance"""
         return self._label_str
 
+    def line_source(self) -> LineSource:
+        """Return the cached exposition line, or a function formatting it from a
+        copy of the instance data. The function does not access the instance, so
+        that it can be called without holding the lock of the metric."""
+
+        if self._line is not None:
+            return self._line
+
+        return partial(_format_line, self._metric.name, self._label_str, self._value)
+
+    def cache_line(self, line: bytes) -> None:
+        """Cache the exposition line formatted from a line source. The line must
+        match the current value of the instance."""
+
+        self._line = line
+
     def __str__(self) -> str:
         return f"{self._metric.name}{{{self.label_string}}} {self.value}"
+
+
+class DistributionInstance(MetricInstance):
+    """Metric instance of a histogram or summary. Setting the value adds an
+    observation to the distribution, the value is the number of observations."""
+
+    __slots__ = ("_distribution",)
+
+    def __init__(
+        self,
+        metric: "Metric",
+        labels: dict[str, str],
+        value: float | None,
+        distribution: Histogram | Summary,
+    ):
+        self._distribution = distribution
+
+        super().__init__(metric, labels, value)  # type: ignore
+
+    @property
+    def value(self) -> float:
+        """Return the number of observations"""
+
+        return self._distribution.count
+
+    @value.setter
+    def value(self, value: float | None) -> None:
+        """Add an observation. None only updates the time of the last update."""
+
+        if value is not None:
+            self._distribution.observe(value)
+
+        self._timestamp = get_current_time()
+        self._line = None
+
+    @property
+    def state(self) -> Any:
+        """Return the distribution as JSON serializable structure"""
+        return self._distribution.get_state()
+
+    def line_source(self) -> LineSource:
+        """Return the cached exposition lines, or a function formatting them from a
+        copy of the distribution"""
+
+        if self._line is not None:
+            return self._line
+
+        distribution = self._distribution
+        copy = (
+            Histogram.from_state(distribution.get_state())
+            if isinstance(distribution, Histogram)
+            else Summary.from_state(distribution.get_state())
+        )
+
+        return partial(_format_distribution, copy, self._metric.name, self._label_str)
+
+    def __str__(self) -> str:
+        return "\n".join(self._distribution.lines(self._metric.name, self.label_string))
+
+
+class AggregateInstance(MetricInstance):
+    """Metric instance aggregating its values within a time window. The value is
+    the aggregate of the window as of the last update or refresh."""
+
+    __slots__ = ("_window",)
+
+    def __init__(
+        self,
+        metric: "Metric",
+        labels: dict[str, str],
+        value: float,
+        window: TumblingWindow | SlidingWindow,
+    ):
+        self._window = window
+
+        super().__init__(metric, labels, value)
+
+    @property
+    def value(self) -> float:
+        """Return the aggregated value"""
+
+        return self._value
+
+    @value.setter
+    def value(self, value: float) -> None:
+        """Add a value to the window"""
+
+        self._timestamp = get_current_time()
+        self._window.add(self._timestamp, value)
+        self._value = self._window.value(self._timestamp)
+        self._line = None
+
+    def refresh(self) -> bool:
+        """Update the aggregate if it changed since the last update as time
+        passed, e.g. because values left the window. The time of the last update
+        is not changed. Returns True if the aggregate changed."""
+
+        now = get_current_time()
+
+        if now < self._window.expires:
+            return False
+
+        value = self._window.value(now)
+
+        if value == self._value:
+            return False
+
+        self._value = value
+        self._line = None
+
+        return True
@@ -1,25 +1,78 @@
 """Prometheus exporter"""
 
 import logging
-from threading import Lock
-from typing import Iterator
+import os
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Callable, Iterable, Iterator, Sequence
 
 from .exceptions import PrometheusExporterException, UnknownMeasurementException
+from .limit import SeriesLimit
 from .metric import Metric
-from .types import MetricTypeEnum
+from .types import (
+    AggregationEnum,
+    MetricTypeEnum,
+    SeriesLimitPolicyEnum,
+    WindowTypeEnum,
+)
 
 logger = logging.getLogger(__name__)
 
 
-class PrometheusExporter:
+class PrometheusExporter:  # pylint: disable=too-many-instance-attributes
     """Manage all measurements and provide the htp interface for interfacing with
-    Prometheus."""
+    Prometheus.
+
+    The lock of the exporter only protects the registry of metrics. Values are
+    set under the lock of the respective metric, so that setting values of
+    different metrics and rendering do not block each other.
+
+    The rendered output is cached until any metric changes. Concurrent renders
+    are coalesced: while a render is in progress, further callers wait for its
+    result instead of rendering themselves.
+
+    For metrics with a limit of instances, the number of rejected and evicted
+    instances is exported as counters, updated when checking for timeouts.
+
+    Metrics reflecting the current state of a component, e.g. the depth of a
+    queue, can be set by collectors, which are called before rendering."""
+
+    # Names of the counters of rejected and evicted metric instances
+    SERIES_REJECTED_METRIC = "promqtt_series_rejected"
+    SERIES_EVICTED_METRIC = "promqtt_series_evicted"
 
     def __init__(self, hide_empty_metrics: bool = False) -> None:
         self._prom: dict[str, Metric] = {}
         self._lock = Lock()
         self._hide_empty_metrics = hide_empty_metrics
 
+        # Names of the update counters, which are summed up when merging states
+        self._update_counters: set[str] = set()
+
+        # Names of the metrics describing this process, which are kept per member
+        # when merging states
+        self._per_member: set[str] = set()
+
+        # Random prefix of the ETags, so that they differ between instances
+        self._etag_prefix = os.urandom(4).hex()
+
+        # Cached output as (generation, body, etag) and state of the render in
+        # progress
+        self._cache: tuple[int, bytes, str] | None = None
+        self._render_cond = Condition()
+        self._rendering = False
+        self._renders = 0
+        self._render_failed = False
+
+        # Number of rejected and evicted instances of metrics with limit, as last
+        # exported
+        self._limited: dict[str, tuple[int, int]] = {}
+
+        # Functions setting metrics on demand, see `add_collector()`
+        self._collectors: list[Callable[[], None]] = []
+
+        self._reaper: Thread | None = None
+        self._reaper_stop = Event()
+
     def register(
         self,
         name: str,
@@ -27,7 +80,17 @@ class PrometheusExporter:
         helpstr: str,
         timeout: int = 0,
         with_update_counter: bool = False,
-    ):  # pylint: disable=too-many-arguments
+        *,
+        max_series: int = 0,
+        series_policy: SeriesLimitPolicyEnum = SeriesLimitPolicyEnum.REJECT,
+        buckets: Sequence[float] | None = None,
+        quantiles: Sequence[float] | None = None,
+        aggregation: AggregationEnum | None = None,
+        window: float = 0,
+        window_type: WindowTypeEnum = WindowTypeEnum.TUMBLING,
+        per_member: bool = False,
+        total_limit: SeriesLimit | None = None,
+    ):  # pylint: disable=too-many-arguments,too-many-locals
         """Register a name for exporting. This must be called before calling
         `set()`.
 
@@ -36,7 +99,24 @@ class PrometheusExporter:
         :param str helpstr: The help information / comment to include in the
           output.
         :param int timeout: Timeout in seconds for any value. Before rendering,
-          values which are updated longer ago than this value, are removed."""
+          values which are updated longer ago than this value, are removed.
+        :param int max_series: Maximum number of instances, 0 for no limit. Also
+          applies to the update counter.
+        :param series_policy: Handling of new instances if the limit is
+          reached.
+        :param buckets: Upper bounds of the buckets of a histogram, by default
+          the buckets of the Prometheus client libraries.
+        :param quantiles: Quantiles estimated by a summary, by default the median,
+          90th and 99th percentile.
+        :param aggregation: Aggregation of the values of a gauge set within a time
+          window, which is exposed instead of the last value.
+        :param window: Length of the aggregation window in seconds.
+        :param window_type: Type of the aggregation window.
+        :param per_member: The metric describes this process, e.g. its connection
+          state, so its instances are kept for each member when merging the
+          states of multiple promqtt instances.
+        :param total_limit: Limit of the total number of instances shared with
+          other metrics. Also applies to the update counter."""
 
         with self._lock:
             if name in self._prom:
@@ -50,17 +130,78 @@ class PrometheusExporter:
                 helpstr=helpstr,
                 timeout=timeout,
                 with_update_counter=with_update_counter,
+                max_series=max_series,
+                series_policy=series_policy,
+                buckets=buckets,
+                quantiles=quantiles,
+                aggregation=aggregation,
+                window=window,
+                window_type=window_type,
+                total_limit=total_limit,
             )
 
             self._prom[name] = metric
 
+            if per_member:
+                self._per_member.add(name)
+
         if with_update_counter:
             self.register(
                 name=f"{name}_updates",
                 datatype=MetricTypeEnum.COUNTER,
                 helpstr=f"Number of updates to {name}",
                 timeout=0,
+                max_series=max_series,
+                series_policy=series_policy,
+                total_limit=total_limit,
             )
+            self._update_counters.add(f"{name}_updates")
+
+        if max_series or total_limit is not None:
+            self._register_limit_counters()
+
+            with self._lock:
+                self._limited[name] = (-1, -1)
+
+            self._update_limit_counters()
+
+    def _register_limit_counters(self) -> None:
+        """Register the counters of rejected and evicted metric instances, if not
+        registered yet."""
+
+        for counter, instances in (
+            (
+                PrometheusExporter.SERIES_REJECTED_METRIC,
+                "rejected new metric instances",
+            ),
+            (PrometheusExporter.SERIES_EVICTED_METRIC, "evicted metric instances"),
+        ):
+            if counter not in self._prom:
+                self.register(
+                    name=counter,
+                    datatype=MetricTypeEnum.COUNTER,
+                    helpstr=f"Number of {instances} due to the limits of instances",
+                    per_member=True,
+                )
+
+    def _update_limit_counters(self) -> None:
+        """Export the number of rejected and evicted instances of the metrics with
+        limit, if they changed."""
+
+        with self._lock:
+            for name, exported in self._limited.items():
+                metric = self._prom[name]
+                counts = (metric.rejected, metric.evicted)
+
+                if counts != exported:
+                    labels = {"metric": name}
+                    self._prom[PrometheusExporter.SERIES_REJECTED_METRIC].set(
+                        labels, counts[0]
+                    )
+                    self._prom[PrometheusExporter.SERIES_EVICTED_METRIC].set(
+                        labels, counts[1]
+                    )
+                    self._limited[name] = counts
 
     def set(self, name: str, labels: dict[str, str], value: float | None):
         """Set a value for exporting.
@@ -72,6 +213,34 @@ class PrometheusExporter:
         :param fmt: The string format to use to convert value to a string.
           Default: '{0}'."""
 
+        self._check_registered(name)
+        self._set(name, labels, value)
+
+    def set_many(self, updates: Iterable[tuple[str, dict[str, Any], Any]]) -> None:
+        """Set multiple values for exporting.
+
+        :param updates: Iterable of (name, labels, value) tuples. See `set()` for
+          details. If any of the names is not registered, no value is set."""
+
+        updates = list(updates)
+
+        for name, _, _ in updates:
+            self._check_registered(name)
+
+        for name, labels, value in updates:
+            self._set(name, labels, value)
+
+    def restore(self, name: str, labels: dict[str, Any], state: Any) -> None:
+        """Set a metric instance to a state as contained in the result of
+        `get_state()`, e.g. the observations of a histogram."""
+
+        self._check_registered(name)
+
+        self._prom[name].restore(labels, state)
+
+    def _check_registered(self, name: str) -> None:
+        """Raise an exception if a metric name is not registered."""
+
         # We raise an exception if we do not know the metric name, i.e. if it
         # was not registered
         if name not in self._prom:
@@ -79,26 +248,139 @@ class PrometheusExporter:
                 f"Cannot set not registered measurement '{name}'."
             )
 
-        with self._lock:
-            metric = self._prom[name]
+    def _set(self, name: str, labels: dict[str, Any], value: float | None) -> None:
+        """Set a value of a registered metric."""
+
+        metric = self._prom[name]
 
-            metric.set(labels, value)
+        metric.set(labels, value)
 
-            if metric.with_update_counter:
-                counter = self._prom[f"{name}_updates"]
-                counter.inc(labels)
+        if metric.with_update_counter:
+            counter = self._prom[f"{name}_updates"]
+            counter.inc(labels)
 
     def check_timeout(self) -> None:
-        """Remove all metric instances which have timed out"""
+        """Remove all metric instances which have timed out. Also updates the
+        aggregates of windows, which change as time passes, and the counters of
+        rejected and evicted instances."""
+
+        for metric in self._metrics():
+            metric.refresh_windows()
+            metric.check_timeout()
+
+        self._update_limit_counters()
+
+    def start_reaper(self, interval: float) -> None:
+        """Start a background thread removing timed out metric instances
+        periodically, so that less work is left for rendering.
+
+        :param interval: Interval in seconds between the checks."""
+
+        if self._reaper is not None:
+            raise PrometheusExporterException("The reaper is already running")
+
+        def run() -> None:
+            while not self._reaper_stop.wait(interval):
+                self.check_timeout()
+
+        self._reaper_stop.clear()
+        self._reaper = Thread(target=run, name="promexp_reaper", daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self) -> None:
+        """Stop the background thread removing timed out metric instances"""
+
+        if self._reaper is None:
+            return
+
+        self._reaper_stop.set()
+        self._reaper.join()
+        self._reaper = None
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Add a function which is called before the metrics are rendered or their
+        state is returned. It sets metrics which are only determined on demand,
+        so that they are up to date, even if the component setting them is
+        stuck."""
+
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _collect(self) -> None:
+        """Call the collectors. A failing collector does not affect the others."""
 
         with self._lock:
-            for metric in self._prom.values():
-                metric.check_timeout()
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Collector {collector} failed")
+
+    def _metrics(self) -> list[Metric]:
+        """Return a copy of the registered metrics"""
+
+        with self._lock:
+            return list(self._prom.values())
+
+    def get_state(self) -> dict[str, Any]:
+        """Return the current data as JSON serializable structure, e.g. to merge
+        the data of multiple promqtt instances with `merge_states()`.
+
+        Each metric has a merge mode: the values of update counters and the
+        observations of histograms are summed up ('sum'). The instances of
+        metrics describing the process, of summaries and of aggregated gauges,
+        whose quantiles and aggregates cannot be merged, are kept for each member
+        ('member'). For all other metrics, the most recent value is used
+        ('latest')."""
+
+        return self.get_state_with_generation()[0]
+
+    def get_state_with_generation(self) -> tuple[dict[str, Any], int]:
+        """Return the current data, see `get_state()`, together with the generation
+        of the exporter it was taken at. The data does not change as long as the
+        generation stays the same."""
+
+        self._collect()
+        self.check_timeout()
+
+        # The generation is determined before taking the state, so that any change
+        # meanwhile leads to a different generation next time.
+        generation = self.generation
+
+        metrics = []
+
+        for metric in self._metrics():
+            state = metric.get_state()
+            state["merge"] = self._merge_mode(metric)
+            metrics.append(state)
+
+        return {"metrics": metrics}, generation
+
+    def _merge_mode(self, metric: Metric) -> str:
+        """Return the merge mode of a metric, see `get_state()`"""
+
+        if (
+            metric.name in self._update_counters
+            or metric.datatype == MetricTypeEnum.HISTOGRAM
+        ):
+            return "sum"
+
+        if (
+            metric.name in self._per_member
+            or metric.datatype == MetricTypeEnum.SUMMARY
+            or metric.aggregation is not None
+        ):
+            return "member"
+
+        return "latest"
 
     def render_iter(self) -> Iterator[str]:
-        """Return an iterator providing each line of Prometheus output."""
+        """Return an iterator providing each line of Prometheus output. Each metric
+        is rendered from a snapshot of its instances."""
 
-        for metric in self._prom.values():
+        for metric in self._metrics():
             if not self._hide_empty_metrics or len(metric):
                 yield from metric.render_iter()
 
@@ -109,6 +391,77 @@ class PrometheusExporter:
         :returns: String with output suitable for consumption by Prometheus over
           HTTP."""
 
+        return self.render_bytes().decode("utf-8")
+
+    def render_bytes(self) -> bytes:
+        """Render the current data to Prometheus format as UTF-8 encoded bytes, see
+        `render()`."""
+
+        return self.render_with_etag()[0]
+
+    def render_with_etag(self) -> tuple[bytes, str]:
+        """Render the current data to Prometheus format as UTF-8 encoded bytes. Also
+        returns an ETag for the output, which changes whenever the output changes.
+
+        If another thread is rendering already, wait for its result instead of
+        rendering again."""
+
+        with self._render_cond:
+            while self._rendering:
+                renders = self._renders
+                self._render_cond.wait_for(lambda: self._renders != renders)
+
+                # Use the result of the render in progress, if it succeeded
+                cache = self._cache
+                if cache is not None and not self._render_failed:
+                    return cache[1], cache[2]
+
+            self._rendering = True
+
+        failed = True
+        try:
+            cache = self._render()
+            failed = False
+        finally:
+            with self._render_cond:
+                self._rendering = False
+                self._render_failed = failed
+                self._renders += 1
+                self._render_cond.notify_all()
+
+        return cache[1], cache[2]
+
+    @property
+    def generation(self) -> int:
+        """Return the generation of the exporter, which changes whenever a metric is
+        registered or changed."""
+
+        metrics = self._metrics()
+
+        return len(metrics) + sum(metric.generation for metric in metrics)
+
+    def _render(self) -> tuple[int, bytes, str]:
+        """Render the output, re-rendering only the changed metrics. Returns the
+        generation, the output and its ETag, which are cached until the next
+        change."""
+
+        self._collect()
         self.check_timeout()
 
-        return "\n".join(self.render_iter())
+        # The generation is determined before rendering, so that any change while
+        # rendering leads to a different generation on the next render.
+        generation = self.generation
+
+        cache = self._cache
+        if cache is not None and cache[0] == generation:
+            return cache
+
+        body = b"\n".join(
+            metric.rendered()
+            for metric in self._metrics()
+            if not self._hide_empty_metrics or len(metric)
+        )
+
+        self._cache = (generation, body, f'"{self._etag_prefix}-{generation}"')
+
+        return self._cache
@@ -0,0 +1,117 @@
+"""Unit tests of histograms and summaries"""
+
+import random
+
+import pytest
+
+from ..distribution import Histogram, Summary, merge_histogram_states
+from ..promexp import MetricTypeEnum, PrometheusExporter
+
+
+def test_histogram_lines() -> None:
+    """The histogram renders cumulative buckets, the sum and the count"""
+
+    histogram = Histogram([1, 0.1])
+
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+
+    assert histogram.lines("lat", 'node="a"') == [
+        'lat_bucket{node="a",le="0.1"} 2',
+        'lat_bucket{node="a",le="1.0"} 3',
+        'lat_bucket{node="a",le="+Inf"} 4',
+        'lat_sum{node="a"} 2.65',
+        'lat_count{node="a"} 4',
+    ]
+
+
+def test_histogram_merge() -> None:
+    """Histogram states with the same buckets are merged by adding them up"""
+
+    histogram = Histogram([1])
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    state = merge_histogram_states(histogram.get_state(), histogram.get_state())
+
+    assert state == {"buckets": [1], "counts": [2, 2], "sum": 11.0, "count": 4}
+    assert Histogram.from_state(state).get_state() == state
+
+    with pytest.raises(ValueError):
+        merge_histogram_states(state, Histogram([2]).get_state())
+
+
+@pytest.mark.parametrize("quantile", [0.5, 0.9, 0.99])
+def test_summary_estimate(quantile: float) -> None:
+    """The estimated quantiles are close to the exact ones"""
+
+    rnd = random.Random(42)
+    values = [rnd.uniform(0, 100) for _ in range(10000)]
+
+    summary = Summary([quantile])
+    for value in values:
+        summary.observe(value)
+
+    exact = sorted(values)[int(quantile * (len(values) - 1))]
+
+    assert summary.quantiles()[quantile] == pytest.approx(exact, abs=2)
+    assert summary.count == len(values)
+
+
+def test_summary_few_observations() -> None:
+    """With less than five observations, the quantiles are exact"""
+
+    summary = Summary([0.5])
+    assert summary.lines("size", "") == [
+        'size{quantile="0.5"} nan',
+        "size_sum{} 0.0",
+        "size_count{} 0",
+    ]
+
+    for value in (3, 1, 2):
+        summary.observe(value)
+
+    assert summary.quantiles() == {0.5: 2}
+
+
+def test_summary_state() -> None:
+    """A restored summary keeps its quantiles until the next observation"""
+
+    summary = Summary([0.5])
+    for value in range(10):
+        summary.observe(value)
+
+    restored = Summary.from_state(summary.get_state())
+
+    assert restored.get_state() == summary.get_state()
+
+    restored.observe(100)
+    assert restored.count == 11
+
+
+def test_exporter_histogram() -> None:
+    """Values set for a histogram metric are observations, None removes the
+    instance like for other metrics"""
+
+    promexp = PrometheusExporter()
+    promexp.register(
+        name="lat",
+        datatype=MetricTypeEnum.HISTOGRAM,
+        helpstr="Latency",
+        buckets=[1],
+    )
+
+    promexp.set(name="lat", labels={"node": "a"}, value=0.5)
+    promexp.set(name="lat", labels={"node": "a"}, value=2)
+    assert promexp.render() == (
+        "# HELP lat Latency\n"
+        "# TYPE lat histogram\n"
+        'lat_bucket{node="a",le="1.0"} 1\n'
+        'lat_bucket{node="a",le="+Inf"} 2\n'
+        'lat_sum{node="a"} 2.5\n'
+        'lat_count{node="a"} 2'
+    )
+
+    promexp.set(name="lat", labels={"node": "a"}, value=None)
+
+    assert "lat_count" not in promexp.render()
@@ -0,0 +1,116 @@
+"""Unit tests of merging exporter states"""
+
+import json
+
+from ..merge import merge_states
+from ..promexp import MetricTypeEnum, PrometheusExporter
+
+
+def _exporter(power: float, updates: int) -> PrometheusExporter:
+    """Create an exporter with a power metric, updated a number of times"""
+
+    promexp = PrometheusExporter()
+    promexp.register(
+        name="power",
+        datatype=MetricTypeEnum.GAUGE,
+        helpstr="Power",
+        with_update_counter=True,
+    )
+
+    for _ in range(updates):
+        promexp.set(name="power", labels={"node": "a"}, value=power)
+
+    return promexp
+
+
+def test_merge_get_state() -> None:
+    """The exporter state is JSON serializable and contains all instances"""
+
+    state = json.loads(json.dumps(_exporter(1.5, 2).get_state()))
+
+    power, updates = state["metrics"]
+
+    assert power["name"] == "power"
+    assert power["type"] == "gauge"
+    assert power["merge"] == "latest"
+    assert power["series"][0]["labels"] == {"node": "a"}
+    assert power["series"][0]["value"] == 1.5
+    assert power["series"][0]["age"] >= 0
+
+    assert updates["name"] == "power_updates"
+    assert updates["merge"] == "sum"
+    assert updates["series"][0]["value"] == 2
+
+
+def test_merge_states() -> None:
+    """The most recent values are used, update counters are summed up and each
+    instance is contained only once."""
+
+    old = _exporter(1, 2).get_state()
+    new = _exporter(2, 3).get_state()
+    old["metrics"][0]["series"][0]["age"] = 10.0
+
+    lines = merge_states([old, new]).render().split("\n")
+
+    assert 'power{node="a"} 2' in lines
+    assert 'power_updates{node="a"} 5' in lines
+    assert len([line for line in lines if line.startswith("power{")]) == 1
+    assert len([line for line in lines if line.startswith("# TYPE power ")]) == 1
+
+
+def test_merge_states_disjoint() -> None:
+    """Instances only known to one state are kept"""
+
+    first = _exporter(1, 1)
+    second = _exporter(2, 1)
+    second.set(name="power", labels={"node": "b"}, value=3)
+
+    lines = merge_states([first.get_state(), second.get_state()]).render().split("\n")
+
+    assert 'power{node="b"} 3' in lines
+    assert 'power_updates{node="a"} 2' in lines
+
+
+def test_merge_histograms() -> None:
+    """The observations of histograms are summed up, summaries are kept per
+    member"""
+
+    def exporter(value: float) -> PrometheusExporter:
+        promexp = PrometheusExporter()
+        promexp.register(
+            name="lat", datatype=MetricTypeEnum.HISTOGRAM, helpstr="", buckets=[1]
+        )
+        promexp.register(
+            name="size", datatype=MetricTypeEnum.SUMMARY, helpstr="", quantiles=[0.5]
+        )
+        promexp.set(name="lat", labels={"node": "a"}, value=value)
+        promexp.set(name="size", labels={"node": "a"}, value=value)
+        return promexp
+
+    states = [json.loads(json.dumps(exporter(v).get_state())) for v in (0.5, 2)]
+    states[1]["member"] = "b"
+    output = merge_states(states).render()
+
+    assert 'lat_bucket{node="a",le="1.0"} 1\n' in output
+    assert 'lat_bucket{node="a",le="+Inf"} 2\n' in output
+    assert 'lat_count{node="a"} 2\n' in output
+    assert 'size_count{member="0",node="a"} 1\n' in output
+    assert 'size_sum{member="b",node="a"} 2.0\n' in output
+
+
+def test_merge_per_member() -> None:
+    """Metrics describing the process are kept per member"""
+
+    states = []
+    for connected in (0, 1):
+        promexp = PrometheusExporter()
+        promexp.register(
+            name="conn", datatype=MetricTypeEnum.GAUGE, helpstr="", per_member=True
+        )
+        promexp.set(name="conn", labels={}, value=connected)
+        states.append(promexp.get_state())
+
+    lines = merge_states(states).render().split("\n")
+
+    assert 'conn{member="0"} 0' in lines
+    assert 'conn{member="1"} 1' in lines
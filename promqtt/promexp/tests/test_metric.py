@@ -1,7 +1,10 @@
 """Unit tests of the metric module"""
 
+import pytest
+
+from ..limit import SeriesLimit
 from ..metric import Metric
-from ..types import MetricTypeEnum
+from ..types import MetricTypeEnum, SeriesLimitPolicyEnum
 
 
 def test_promexp_metric_len() -> None:
@@ -22,3 +25,254 @@ def test_promexp_metric_len() -> None:
     # Setting to None removes the instance
     metric1.set(labels={"foo": "bar"}, value=None)
     assert len(metric1) == 0
+
+
+def test_promexp_metric_line_source() -> None:
+    """The exposition line is formatted from a copy of the instance data and is
+    not affected by later updates."""
+
+    metric1 = Metric(name="metric1", datatype=MetricTypeEnum.GAUGE, helpstr="")
+    metric1.set(labels={"foo": "bar"}, value=17)
+
+    (instance,) = metric1._data[("foo",)].values()  # pylint: disable=protected-access
+    source = instance.line_source()
+    metric1.set(labels={"foo": "bar"}, value=18)
+
+    assert callable(source)
+    assert source() == b'metric1{foo="bar"} 17'
+    assert metric1.lines() == [b'metric1{foo="bar"} 18']
+
+    # the formatted line is cached
+    assert instance.line_source() == b'metric1{foo="bar"} 18'
+
+
+def test_promexp_metric_cached_lines() -> None:
+    """The exposition line of an instance is cached until its value changes."""
+
+    metric1 = Metric(name="metric1", datatype=MetricTypeEnum.GAUGE, helpstr="help")
+    metric1.set(labels={"foo": "bar"}, value=17)
+
+    lines = metric1.lines()
+    assert lines == [b'metric1{foo="bar"} 17']
+    assert metric1.lines()[0] is lines[0]
+
+    metric1.set(labels={"foo": "bar"}, value=18)
+    assert metric1.lines() == [b'metric1{foo="bar"} 18']
+
+    assert metric1.header == b"# HELP metric1 help\n# TYPE metric1 gauge"
+
+
+def test_promexp_metric_label_order() -> None:
+    """The order of the labels does not matter to identify an instance."""
+
+    metric1 = Metric(name="metric1", datatype=MetricTypeEnum.GAUGE, helpstr="")
+
+    metric1.set(labels={"foo": "1", "bar": "2"}, value=17)
+    metric1.set(labels={"bar": "2", "foo": "1"}, value=18)
+    metric1.set(labels={"foo": "2", "bar": "1"}, value=19)
+    metric1.inc(labels={})
+
+    assert len(metric1) == 3
+    assert metric1.get(labels={"bar": "2", "foo": "1"}) == 18
+    assert metric1.get(labels={"foo": "1"}) is None
+    assert list(metric1.render_iter())[2:] == [
+        'metric1{bar="2",foo="1"} 18',
+        'metric1{bar="1",foo="2"} 19',
+        "metric1{} 1",
+    ]
+
+
+def test_promexp_metric_label_values() -> None:
+    """Label values identify an instance by their string representation."""
+
+    metric1 = Metric(name="metric1", datatype=MetricTypeEnum.GAUGE, helpstr="")
+
+    metric1.set(labels={"n": 1}, value=17)  # type: ignore
+    metric1.set(labels={"n": "1"}, value=18)
+    metric1.set(labels={"n": 1.0}, value=19)  # type: ignore
+    metric1.set(labels={"n": [1], "m": True}, value=20)  # type: ignore
+
+    assert len(metric1) == 3
+    assert metric1.get(labels={"n": 1}) == 18  # type: ignore
+    assert list(metric1.render_iter())[2:] == [
+        'metric1{n="1"} 18',
+        'metric1{n="1.0"} 19',
+        'metric1{m="True",n="[1]"} 20',
+    ]
+
+
+def test_promexp_metric_timeout_heap(monkeypatch) -> None:
+    """Only instances not updated within the timeout are removed."""
+
+    now = 1000.0
+    monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", lambda: now)
+
+    metric1 = Metric(
+        name="metric1", datatype=MetricTypeEnum.GAUGE, helpstr="", timeout=10
+    )
+    metric1.set(labels={"foo": "a"}, value=1)
+    metric1.set(labels={"foo": "b"}, value=2)
+    metric1.set(labels={"foo": "c"}, value=3)
+
+    # Update one instance, remove another one and create it again
+    now += 5
+    metric1.set(labels={"foo": "a"}, value=4)
+    metric1.set(labels={"foo": "c"}, value=None)
+    metric1.set(labels={"foo": "c"}, value=5)
+
+    now += 6
+    metric1.check_timeout()
+    assert [metric1.get({"foo": name}) for name in "abc"] == [4, None, 5]
+
+    now += 5
+    metric1.check_timeout()
+    assert len(metric1) == 0
+
+
+def test_promexp_metric_state_labels() -> None:
+    """The state contains the labels of the instances with different label names."""
+
+    metric1 = Metric(name="metric1", datatype=MetricTypeEnum.GAUGE, helpstr="")
+    metric1.set(labels={"foo": "a"}, value=1)
+    metric1.set(labels={"foo": "b", "bar": "2"}, value=2)
+    metric1.set(labels={}, value=3)
+
+    assert [series["labels"] for series in metric1.get_state()["series"]] == [
+        {"foo": "a"},
+        {"bar": "2", "foo": "b"},
+        {},
+    ]
+    assert len(metric1) == 3
+
+
+def test_promexp_metric_series_limit_reject() -> None:
+    """New instances are rejected if the limit is reached."""
+
+    metric1 = Metric(
+        name="metric1", datatype=MetricTypeEnum.GAUGE, helpstr="", max_series=2
+    )
+
+    for name in "abc":
+        metric1.set(labels={"foo": name}, value=1)
+
+    # Existing instances can still be updated and a removed one makes room
+    metric1.set(labels={"foo": "a"}, value=2)
+    metric1.set(labels={"foo": "b"}, value=None)
+    metric1.set(labels={"foo": "d"}, value=3)
+
+    assert [metric1.get({"foo": name}) for name in "abcd"] == [2, None, None, 3]
+    assert (metric1.rejected, metric1.evicted) == (1, 0)
+
+
+def test_promexp_metric_series_limit_evict(monkeypatch) -> None:
+    """The least recently updated instance is evicted if the limit is reached."""
+
+    now = 1000.0
+    monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", lambda: now)
+
+    metric1 = Metric(
+        name="metric1",
+        datatype=MetricTypeEnum.GAUGE,
+        helpstr="",
+        max_series=3,
+        series_policy=SeriesLimitPolicyEnum.EVICT_LRU,
+    )
+
+    for labels in ({"foo": "a"}, {"foo": "b"}, {"foo": "c", "bar": "x"}):
+        now += 1
+        metric1.set(labels=labels, value=1)
+
+    now += 1
+    metric1.set(labels={"foo": "a"}, value=2)
+
+    now += 1
+    metric1.set(labels={"foo": "d"}, value=3)
+
+    now += 1
+    metric1.set(labels={"foo": "e"}, value=4)
+
+    assert len(metric1) == 3
+    assert metric1.get({"foo": "c", "bar": "x"}) is None
+    assert [metric1.get({"foo": name}) for name in "abde"] == [2, None, 3, 4]
+    assert (metric1.rejected, metric1.evicted) == (0, 2)
+
+
+def test_promexp_metric_total_limit(monkeypatch) -> None:
+    """The total limit is shared by metrics. If it is reached, new instances are
+    rejected or replace the least recently updated instance of the same metric."""
+
+    now = 1000.0
+    monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", lambda: now)
+
+    limit = SeriesLimit(3)
+    metric1 = Metric(
+        name="metric1", datatype=MetricTypeEnum.GAUGE, helpstr="", total_limit=limit
+    )
+    metric2 = Metric(
+        name="metric2",
+        datatype=MetricTypeEnum.GAUGE,
+        helpstr="",
+        timeout=10,
+        series_policy=SeriesLimitPolicyEnum.EVICT_LRU,
+        total_limit=limit,
+    )
+
+    metric1.set(labels={"foo": "a"}, value=1)
+    metric1.set(labels={"foo": "b"}, value=1)
+
+    # The first instance of the evicting metric cannot replace another one
+    now += 1
+    metric2.set(labels={"foo": "a"}, value=1)
+    now += 1
+    metric2.set(labels={"foo": "b"}, value=1)
+
+    metric1.set(labels={"foo": "c"}, value=1)
+
+    assert [metric2.get({"foo": name}) for name in "ab"] == [None, 1]
+    assert (metric1.rejected, metric1.evicted) == (1, 0)
+    assert (metric2.rejected, metric2.evicted) == (0, 1)
+    assert limit.count == 3
+
+    # Removed and timed out instances make room
+    metric1.set(labels={"foo": "a"}, value=None)
+    now += 10
+    metric2.check_timeout()
+    assert limit.count == 1
+
+    metric1.set(labels={"foo": "c"}, value=1)
+    assert metric1.get({"foo": "c"}) == 1
+    assert limit.count == 2
+
+
+def test_promexp_metric_total_limit_failed_instance() -> None:
+    """A new instance failing to take its value neither uses up a slot of the
+    limit nor evicts an existing instance."""
+
+    limit = SeriesLimit(2)
+    histogram = Metric(
+        name="histogram1",
+        datatype=MetricTypeEnum.HISTOGRAM,
+        helpstr="",
+        series_policy=SeriesLimitPolicyEnum.EVICT_LRU,
+        total_limit=limit,
+    )
+    gauge = Metric(
+        name="gauge1", datatype=MetricTypeEnum.GAUGE, helpstr="", total_limit=limit
+    )
+
+    histogram.set(labels={"foo": "a"}, value=1)
+    histogram.set(labels={"foo": "b"}, value=1)
+
+    for name in "cde":
+        with pytest.raises(TypeError):
+            histogram.set(labels={"foo": name}, value="x")  # type: ignore
+
+    assert [histogram.get({"foo": name}) for name in "abc"] == [1, 1, None]
+    assert (histogram.rejected, histogram.evicted) == (0, 0)
+    assert limit.count == 2
+
+    histogram.set(labels={"foo": "b"}, value=None)
+    gauge.set(labels={"foo": "a"}, value=1)
+
+    assert gauge.get({"foo": "a"}) == 1
+    assert gauge.rejected == 0
@@ -1,6 +1,8 @@
 """Unittests for promexp module"""
 
-from datetime import datetime, timedelta
+import sys
+import time
+from threading import Event, Thread
 
 import pytest
 
@@ -125,10 +127,10 @@ def test_promqtt_timeout(monkeypatch, promexp: PrometheusExporter) -> None:
     # create dummy functions returning the current time or time 13s in the
     # future to fake timeout.
     def tm_now():
-        return datetime(year=2023, month=8, day=7, hour=12, minute=30, second=0)
+        return 1000.0
 
     def tm_13s():
-        return tm_now() + timedelta(seconds=13)
+        return tm_now() + 13
 
     monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", tm_now)
 
@@ -182,3 +184,188 @@ def test_promexp_show_empty_metrics():
     # no metric instance, but header shall still appear in output
     assert _has_line(promexp, "# HELP test2 helpstr2")
     assert _has_line(promexp, "# TYPE test2 gauge")
+
+
+def test_promexp_set_many(promexp: PrometheusExporter) -> None:
+    """Setting multiple values at once, including update counters."""
+
+    promexp.register(
+        name="test1",
+        datatype=MetricTypeEnum.GAUGE,
+        helpstr="helpstr1",
+        with_update_counter=True,
+    )
+
+    promexp.set_many(
+        [
+            ("test1", {"foo": "bar"}, 1),
+            ("test1", {"foo": "baz"}, 2),
+            ("test1", {"foo": "bar"}, 3),
+        ]
+    )
+
+    assert _has_line(promexp, 'test1{foo="bar"} 3')
+    assert _has_line(promexp, 'test1{foo="baz"} 2')
+    assert _has_line(promexp, 'test1_updates{foo="bar"} 2')
+
+
+def test_promexp_set_many_not_registered(promexp: PrometheusExporter) -> None:
+    """If one metric in a batch is not registered, no value is set at all."""
+
+    promexp.register(name="test1", datatype=MetricTypeEnum.GAUGE, helpstr="help")
+
+    with pytest.raises(UnknownMeasurementException):
+        promexp.set_many([("test1", {}, 1), ("test2", {}, 2)])
+
+    assert not _has_line(promexp, "test1{} 1")
+
+
+def test_promexp_render_concurrent_set(promexp: PrometheusExporter) -> None:
+    """Rendering while values are set concurrently renders a consistent view."""
+
+    promexp.register(
+        name="test1",
+        datatype=MetricTypeEnum.GAUGE,
+        helpstr="help",
+        timeout=60,
+        with_update_counter=True,
+    )
+
+    stop = Event()
+    errors: list[Exception] = []
+
+    def writer(offset: int) -> None:
+        index = 0
+        while not stop.is_set():
+            promexp.set("test1", {"idx": str(offset + index % 1000)}, index)
+            promexp.set("test1", {"idx": str(offset + (index + 500) % 1000)}, None)
+            index += 1
+
+    def reader() -> None:
+        try:
+            for _ in range(50):
+                for line in promexp.render().split("\n"):
+                    assert line.startswith(("#", "test1{", "test1_updates{"))
+                promexp.get_state()
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            errors.append(ex)
+
+    writers = [Thread(target=writer, args=(offset,)) for offset in (0, 1000)]
+    for thread in writers:
+        thread.start()
+
+    # Switch threads frequently to provoke races
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+
+    try:
+        reader()
+    finally:
+        sys.setswitchinterval(interval)
+        stop.set()
+        for thread in writers:
+            thread.join()
+
+    assert not errors
+
+
+def test_promexp_render_bytes() -> None:
+    """Rendering to bytes returns the same output as rendering to a string."""
+
+    promexp = PrometheusExporter(hide_empty_metrics=True)
+    promexp.register(name="test1", datatype=MetricTypeEnum.GAUGE, helpstr="help")
+    promexp.register(name="test2", datatype=MetricTypeEnum.COUNTER, helpstr="empty")
+    promexp.set("test1", {"foo": "bär"}, 1.5)
+    promexp.set("test1", {"foo": "baz"}, 2)
+
+    expected = "\n".join(promexp.render_iter()).encode("utf-8")
+
+    assert promexp.render_bytes() == expected
+    assert promexp.render() == expected.decode("utf-8")
+
+
+def test_promexp_render_cache(promexp: PrometheusExporter) -> None:
+    """The output is cached until a metric changes and has a matching ETag."""
+
+    promexp.register(name="test1", datatype=MetricTypeEnum.GAUGE, helpstr="help")
+    promexp.register(name="test2", datatype=MetricTypeEnum.GAUGE, helpstr="help")
+    promexp.set("test1", {"foo": "bar"}, 1)
+
+    body, etag = promexp.render_with_etag()
+    assert promexp.render_with_etag()[0] is body
+
+    # Only the changed metric is rendered again
+    rendered = promexp._prom["test1"].rendered()  # pylint: disable=protected-access
+    promexp.set("test2", {"foo": "bar"}, 2)
+
+    body2, etag2 = promexp.render_with_etag()
+    assert etag2 != etag
+    assert body2 == body + b'\ntest2{foo="bar"} 2'
+    assert promexp._prom["test1"].rendered() is rendered  # pylint: disable=W0212
+
+    # Setting the same value again changes the timestamp, so the output changes
+    promexp.set("test2", {"foo": "bar"}, 2)
+    assert promexp.render_with_etag()[1] != etag2
+
+
+def test_promexp_render_single_flight(promexp: PrometheusExporter) -> None:
+    """Concurrent renders wait for the render in progress and share its result."""
+
+    promexp.register(name="test1", datatype=MetricTypeEnum.GAUGE, helpstr="help")
+    promexp.set("test1", {"foo": "bar"}, 1)
+
+    release = Event()
+    calls = []
+    render = promexp._render  # pylint: disable=protected-access
+
+    def slow_render() -> tuple[int, bytes, str]:
+        calls.append(1)
+        release.wait()
+        return render()
+
+    promexp._render = slow_render  # type: ignore # pylint: disable=W0212
+
+    results: list[bytes] = []
+    threads = [
+        Thread(target=lambda: results.append(promexp.render_bytes())) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(0.2)
+    release.set()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 4 and len(set(results)) == 1
+
+
+def test_promexp_reaper(monkeypatch, promexp: PrometheusExporter) -> None:
+    """The reaper removes timed out instances in the background."""
+
+    now = 1000.0
+    monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", lambda: now)
+
+    promexp.register(
+        name="test1", datatype=MetricTypeEnum.GAUGE, helpstr="help", timeout=10
+    )
+    promexp.set("test1", {"foo": "bar"}, 1)
+    metric = promexp._prom["test1"]  # pylint: disable=protected-access
+
+    promexp.start_reaper(0.01)
+
+    with pytest.raises(PrometheusExporterException):
+        promexp.start_reaper(0.01)
+
+    now += 11
+
+    deadline = time.monotonic() + 5
+    while len(metric) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    promexp.stop_reaper()
+    promexp.stop_reaper()
+
+    assert len(metric) == 0
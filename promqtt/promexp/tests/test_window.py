@@ -0,0 +1,229 @@
+"""Unit tests of the aggregation of values within time windows"""
+
+import math
+import random
+from statistics import mean
+from typing import Callable
+
+import pytest
+
+from ..exceptions import PrometheusExporterException
+from ..merge import merge_states
+from ..promexp import MetricTypeEnum, PrometheusExporter
+from ..types import AggregationEnum, WindowTypeEnum
+from ..window import SlidingWindow, TumblingWindow
+
+_AGGREGATE: dict[AggregationEnum, Callable[[list[float]], float]] = {
+    AggregationEnum.AVG: mean,
+    AggregationEnum.MIN: min,
+    AggregationEnum.MAX: max,
+    AggregationEnum.SUM: sum,
+    AggregationEnum.COUNT: len,
+}
+
+# Aggregates of a window without values, NaN for the others
+_EMPTY: dict[AggregationEnum, float] = {
+    AggregationEnum.SUM: 0,
+    AggregationEnum.COUNT: 0,
+}
+
+
+def _aggregated(window_type: WindowTypeEnum) -> PrometheusExporter:
+    """Create an exporter with a gauge exposing the maximum within 10 seconds"""
+
+    promexp = PrometheusExporter()
+    promexp.register(
+        "power",
+        MetricTypeEnum.GAUGE,
+        "Power",
+        aggregation=AggregationEnum.MAX,
+        window=10,
+        window_type=window_type,
+    )
+
+    return promexp
+
+
+def _assert_aggregate(
+    actual: float, aggregation: AggregationEnum, values: list[float]
+) -> None:
+    """Check the aggregate of the values in a window, which may be empty"""
+
+    if values:
+        assert actual == pytest.approx(_AGGREGATE[aggregation](values))
+    elif aggregation in _EMPTY:
+        assert actual == _EMPTY[aggregation]
+    else:
+        assert math.isnan(actual)
+
+
+@pytest.mark.parametrize("aggregation", list(AggregationEnum))
+def test_tumbling_window(aggregation: AggregationEnum) -> None:
+    """The aggregate of the window before the current one is exposed"""
+
+    window = TumblingWindow(aggregation, 10)
+
+    window.add(1, 4)
+    _assert_aggregate(window.value(1), aggregation, [])
+    assert window.expires == 10
+
+    window.add(5, 2)
+    window.add(9.5, 6)
+    window.add(10, 3)
+    _assert_aggregate(window.value(10), aggregation, [4, 2, 6])
+    _assert_aggregate(window.value(19), aggregation, [4, 2, 6])
+    _assert_aggregate(window.value(20), aggregation, [3])
+
+    # The window before is empty
+    assert window.expires == 30
+    _assert_aggregate(window.value(30), aggregation, [])
+    assert window.expires == math.inf
+
+    # A value after multiple empty windows
+    window.add(36, 1)
+    _assert_aggregate(window.value(39), aggregation, [])
+    _assert_aggregate(window.value(45), aggregation, [1])
+    _assert_aggregate(window.value(75), aggregation, [])
+
+
+@pytest.mark.parametrize("aggregation", list(AggregationEnum))
+def test_sliding_window(aggregation: AggregationEnum) -> None:
+    """The aggregate equals the aggregation of the values within the window"""
+
+    rnd = random.Random(7)
+    window = SlidingWindow(aggregation, 5)
+    samples: list[tuple[float, float]] = []
+    timestamp = 0.0
+
+    for _ in range(1000):
+        timestamp += rnd.uniform(0, 1)
+
+        # Only evaluate the aggregate sometimes
+        if rnd.random() < 0.5:
+            value = rnd.randint(0, 100)
+            samples.append((timestamp, value))
+            window.add(timestamp, value)
+
+        in_window = [val for ts, val in samples if ts > timestamp - 5]
+        if not in_window and aggregation not in _EMPTY:
+            assert math.isnan(window.value(timestamp))
+            continue
+
+        expected = _AGGREGATE[aggregation](in_window)
+        assert window.value(timestamp) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("aggregation", list(AggregationEnum))
+def test_sliding_window_expires(aggregation: AggregationEnum) -> None:
+    """Values leave the window without further updates"""
+
+    window = SlidingWindow(aggregation, 5)
+    window.add(1, 4)
+    window.add(2, 2)
+
+    assert window.value(6) == _AGGREGATE[aggregation]([2])
+    assert window.expires == 7
+
+    if aggregation in _EMPTY:
+        assert window.value(7) == _EMPTY[aggregation]
+    else:
+        assert math.isnan(window.value(7))
+
+    assert window.expires == math.inf
+
+
+def test_exporter_aggregation(monkeypatch) -> None:
+    """An aggregated gauge exposes the aggregate instead of the last value"""
+
+    now = 100.0
+    monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", lambda: now)
+
+    promexp = _aggregated(WindowTypeEnum.SLIDING)
+
+    for value in (5, 9, 7):
+        promexp.set(name="power", labels={"node": "a"}, value=value)
+        now += 3
+
+    assert promexp.render().endswith('power{node="a"} 9')
+
+    # The maximum leaves the window
+    now += 5
+    promexp.set(name="power", labels={"node": "a"}, value=2)
+
+    assert promexp.render().endswith('power{node="a"} 7')
+
+    # The values leave the window without updates
+    now += 2
+    assert promexp.render().endswith('power{node="a"} 2')
+
+    now += 10
+    assert promexp.render().endswith('power{node="a"} nan')
+
+
+def test_exporter_aggregation_tumbling(monkeypatch) -> None:
+    """The window before the current one is exposed when rendering without
+    further updates"""
+
+    now = 100.0
+    monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", lambda: now)
+
+    promexp = _aggregated(WindowTypeEnum.TUMBLING)
+
+    for value in (5, 9):
+        promexp.set(name="power", labels={"node": "a"}, value=value)
+
+    assert promexp.render().endswith('power{node="a"} nan')
+
+    now += 10
+    promexp.set(name="power", labels={"node": "a"}, value=7)
+
+    assert promexp.render().endswith('power{node="a"} 9')
+
+    now += 10
+    assert promexp.render().endswith('power{node="a"} 7')
+
+    # Time passes two empty windows
+    now += 10
+    assert promexp.render().endswith('power{node="a"} nan')
+
+    now += 10
+    assert promexp.render().endswith('power{node="a"} nan')
+
+
+def test_exporter_aggregation_merge(monkeypatch) -> None:
+    """The aggregates of the members cannot be merged, so they are kept per
+    member"""
+
+    now = 100.0
+    monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", lambda: now)
+
+    promexps = [_aggregated(WindowTypeEnum.TUMBLING) for _ in range(2)]
+
+    for promexp, value in zip(promexps, (5, 9)):
+        promexp.set(name="power", labels={"node": "a"}, value=value)
+
+    now += 10
+    states = [promexp.get_state() for promexp in promexps]
+
+    assert states[0]["metrics"][0]["merge"] == "member"
+    assert merge_states(states).render().split("\n")[2:] == [
+        'power{member="0",node="a"} 5',
+        'power{member="1",node="a"} 9',
+    ]
+
+
+@pytest.mark.parametrize(
+    "datatype, window",
+    [(MetricTypeEnum.COUNTER, 10), (MetricTypeEnum.GAUGE, 0)],
+)
+def test_exporter_invalid_aggregation(datatype: MetricTypeEnum, window: float) -> None:
+    """Only gauges can be aggregated, within a positive window"""
+
+    with pytest.raises(PrometheusExporterException):
+        PrometheusExporter().register(
+            name="power",
+            datatype=datatype,
+            helpstr="Power",
+            aggregation=AggregationEnum.AVG,
+            window=window,
+        )
@@ -8,3 +8,37 @@ class MetricTypeEnum(Enum):
 
     GAUGE = "gauge"
     COUNTER = "counter"
+    HISTOGRAM = "histogram"
+    SUMMARY = "summary"
+
+
+class SeriesLimitPolicyEnum(Enum):
+    """Enumeration of the policies for a new metric instance, if a metric has its
+    maximum number of instances already"""
+
+    # Do not add the new instance
+    REJECT = "reject"
+
+    # Remove the least recently updated instance
+    EVICT_LRU = "evict_lru"
+
+
+class AggregationEnum(Enum):
+    """Enumeration of the aggregations of the values set within a time window"""
+
+    AVG = "avg"
+    MIN = "min"
+    MAX = "max"
+    SUM = "sum"
+    COUNT = "count"
+
+
+class WindowTypeEnum(Enum):
+    """Enumeration of the time windows of aggregations"""
+
+    # Consecutive windows of fixed length, the aggregation restarts with each
+    # window
+    TUMBLING = "tumbling"
+
+    # The values of the window length up to the last update
+    SLIDING = "sliding"
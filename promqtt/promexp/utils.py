@@ -1,14 +1,15 @@
 """Utility functions"""
 
-from datetime import datetime
+import time
 
 
-def get_current_time() -> datetime:
-    """Return the current time as a datetime object.
+def get_current_time() -> float:
+    """Return the current time of a monotonic clock in seconds. Only the
+    difference between two times is meaningful.
 
     Wrapped in a function, so it can be stubbed for testing."""
 
-    return datetime.now()
+    return time.monotonic()
 
 
 def _get_label_string(labels: dict[str, str]) -> str:
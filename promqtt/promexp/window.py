@@ -0,0 +1,225 @@
+"""Aggregation of the values of a metric instance within a time window.
+
+Instead of the last value, an aggregated metric exposes the average, minimum,
+maximum, sum or number of the values set within a window. The aggregation is
+updated incrementally with each value in amortized constant time:
+
+* A tumbling window keeps the running aggregate of the current window and
+  exposes the aggregate of the window before, i.e. of the last completed window.
+* A sliding window keeps the values of the window length in a queue, together
+  with the running sum for average, sum and count. For minimum and maximum, only
+  the values which can still become the extreme value are kept, in monotonic
+  order, so that the extreme value is always the first one.
+
+Without values in the window, the sum and count are 0, the other aggregates are
+NaN.
+
+The aggregate changes with time even without new values. `expires` tells from
+when on the aggregate has to be evaluated again.
+
+"""
+
+import math
+from collections import deque
+
+from .types import AggregationEnum, WindowTypeEnum
+
+
+class TumblingWindow:  # pylint: disable=too-many-instance-attributes
+    """Aggregate the values of consecutive windows of fixed length"""
+
+    __slots__ = (
+        "_aggregation",
+        "_length",
+        "_window",
+        "_sum",
+        "_count",
+        "_extreme",
+        "_previous",
+        "_previous_empty",
+    )
+
+    def __init__(self, aggregation: AggregationEnum, length: float) -> None:
+        self._aggregation = aggregation
+        self._length = length
+
+        # Index of the current window, counted from the start of the clock
+        self._window = -1
+
+        self._sum = 0.0
+        self._count = 0
+
+        # Minimum or maximum of the current window
+        self._extreme = math.nan
+
+        # Aggregate of the window before the current one
+        self._previous = self._aggregate()
+        self._previous_empty = True
+
+    @property
+    def expires(self) -> float:
+        """Return the time from when on the aggregate changes, i.e. the end of
+        the current window, unless it and the previous window are empty"""
+
+        if not self._count and self._previous_empty:
+            return math.inf
+
+        return (self._window + 1) * self._length
+
+    def add(self, timestamp: float, value: float) -> None:
+        """Add a value set at a time"""
+
+        self._advance(timestamp)
+
+        if self._aggregation == AggregationEnum.MIN:
+            self._extreme = min(self._extreme, value) if self._count else value
+        elif self._aggregation == AggregationEnum.MAX:
+            self._extreme = max(self._extreme, value) if self._count else value
+
+        self._sum += value
+        self._count += 1
+
+    def value(self, now: float) -> float:
+        """Return the aggregate of the window before the one of a time"""
+
+        self._advance(now)
+
+        return self._previous
+
+    def _advance(self, now: float) -> None:
+        """Start the window of a time, if the time is past the current window"""
+
+        window = int(now // self._length)
+
+        if window == self._window:
+            return
+
+        # The current window is only the previous one if it directly precedes the
+        # new window, otherwise the previous window is empty
+        if window != self._window + 1:
+            self._reset()
+
+        self._previous = self._aggregate()
+        self._previous_empty = not self._count
+
+        self._window = window
+        self._reset()
+
+    def _reset(self) -> None:
+        """Remove the values of the current window"""
+
+        self._sum = 0.0
+        self._count = 0
+        self._extreme = math.nan
+
+    def _aggregate(self) -> float:
+        """Return the aggregate of the current window. Without values, the sum and
+        count are 0, the other aggregates are NaN."""
+
+        aggregation = self._aggregation
+
+        if aggregation in (AggregationEnum.MIN, AggregationEnum.MAX):
+            return self._extreme
+
+        if aggregation == AggregationEnum.SUM:
+            return self._sum
+
+        if aggregation == AggregationEnum.COUNT:
+            return self._count
+
+        return self._sum / self._count if self._count else math.nan
+
+
+class SlidingWindow:
+    """Aggregate the values of the window length up to the current time"""
+
+    __slots__ = ("_aggregation", "_length", "_values", "_sum")
+
+    def __init__(self, aggregation: AggregationEnum, length: float) -> None:
+        self._aggregation = aggregation
+        self._length = length
+
+        # Queue of (timestamp, value) in the window. For minimum and maximum, only
+        # the candidates for the extreme value.
+        self._values: deque[tuple[float, float]] = deque()
+
+        # Running sum of the values in the queue, only used for average, sum and
+        # count
+        self._sum = 0.0
+
+    @property
+    def expires(self) -> float:
+        """Return the time from when on the aggregate changes, i.e. when the
+        oldest value leaves the window"""
+
+        if not self._values:
+            return math.inf
+
+        return self._values[0][0] + self._length
+
+    def add(self, timestamp: float, value: float) -> None:
+        """Add a value set at a time"""
+
+        values = self._values
+        aggregation = self._aggregation
+
+        # Drop the values which cannot become the extreme value anymore, as the
+        # new value is more extreme and stays longer in the window
+        if aggregation == AggregationEnum.MIN:
+            while values and values[-1][1] >= value:
+                values.pop()
+        elif aggregation == AggregationEnum.MAX:
+            while values and values[-1][1] <= value:
+                values.pop()
+        else:
+            self._sum += value
+
+        values.append((timestamp, value))
+
+        self._expire(timestamp)
+
+    def value(self, now: float) -> float:
+        """Return the aggregate of the window up to a time"""
+
+        self._expire(now)
+
+        values = self._values
+        aggregation = self._aggregation
+
+        if aggregation == AggregationEnum.SUM:
+            return self._sum
+
+        if aggregation == AggregationEnum.COUNT:
+            return len(values)
+
+        if not values:
+            return math.nan
+
+        if aggregation in (AggregationEnum.MIN, AggregationEnum.MAX):
+            return values[0][1]
+
+        return self._sum / len(values)
+
+    def _expire(self, now: float) -> None:
+        """Drop the values which have left the window"""
+
+        values = self._values
+        start = now - self._length
+
+        while values and values[0][0] <= start:
+            self._sum -= values.popleft()[1]
+
+        # Avoid accumulating rounding errors
+        if not values:
+            self._sum = 0.0
+
+
+def make_window(
+    aggregation: AggregationEnum, length: float, window_type: WindowTypeEnum
+) -> TumblingWindow | SlidingWindow:
+    """Create the window of a metric instance"""
+
+    if window_type == WindowTypeEnum.SLIDING:
+        return SlidingWindow(aggregation, length)
+
+    return TumblingWindow(aggregation, length)
@@ -1,9 +1,17 @@
 """Implementation of the gateway to transfer data from MQTT to prometheus."""
 
+from .capture import CaptureWriter, read_capture
+from .cluster import ClusterView
+from .ingest import AsyncIngestQueue, IngestQueue
 from .mqttclt import MqttClient
 from .promqtt import MqttPrometheusBridge
 
 __all__ = [
+    "AsyncIngestQueue",
+    "CaptureWriter",
+    "ClusterView",
+    "IngestQueue",
     "MqttClient",
     "MqttPrometheusBridge",
+    "read_capture",
 ]
@@ -0,0 +1,139 @@
+"""Run the network loop of a paho MQTT client on an asyncio event loop.
+
+Instead of a blocking network loop, the socket of the client is registered with
+the event loop, which calls the client to read and write when the socket is ready.
+See the external event loop support of paho. Connecting to the broker blocks for
+resolving the host name and opening the connection, so it is done in a worker
+thread.
+
+"""
+
+import asyncio
+import logging
+from typing import Any
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncioMqttLoop:  # pylint: disable=too-few-public-methods
+    """Drive the network traffic of a paho MQTT client by the running asyncio
+    event loop."""
+
+    # Interval in seconds for keep-alive handling
+    MISC_INTERVAL = 1.0
+
+    # Delay in seconds between reconnection attempts
+    RECONNECT_DELAY = 5.0
+
+    def __init__(self, client: mqtt.Client) -> None:
+        self._client = client
+        self._loop = asyncio.get_running_loop()
+
+        # Socket registered with the event loop and whether the client connects
+        # in a worker thread
+        self._sock: Any = None
+        self._connecting = False
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        # The client may already be connected
+        self._register_socket()
+
+    def _register_socket(self) -> None:
+        """Register the socket of the client with the event loop, if connected"""
+
+        sock = self._client.socket()
+        if sock is not None:
+            self._on_socket_open(self._client, None, sock)
+
+            if self._client.want_write():
+                self._on_socket_register_write(self._client, None, sock)
+
+    def _unregister_socket(self) -> None:
+        """Remove the socket of the client from the event loop"""
+
+        if self._sock is not None:
+            self._on_socket_close(self._client, None, self._sock)
+
+    def _on_socket_open(self, client: mqtt.Client, userdata: Any, sock: Any) -> None:
+        del userdata
+
+        # Registered after connecting, see _connect()
+        if self._connecting:
+            return
+
+        self._sock = sock
+        self._loop.add_reader(sock, client.loop_read)
+
+    def _on_socket_close(self, client: mqtt.Client, userdata: Any, sock: Any) -> None:
+        del client
+        del userdata
+
+        if self._connecting or sock is not self._sock:
+            return
+
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+        self._sock = None
+
+    def _on_socket_register_write(
+        self, client: mqtt.Client, userdata: Any, sock: Any
+    ) -> None:
+        del userdata
+
+        if self._connecting:
+            return
+
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(
+        self, client: mqtt.Client, userdata: Any, sock: Any
+    ) -> None:
+        del client
+        del userdata
+
+        if self._connecting:
+            return
+
+        self._loop.remove_writer(sock)
+
+    async def _connect(self) -> bool:
+        """Connect to the broker. Resolving the host name and opening the connection
+        block, so this is done in a worker thread, while the event loop keeps
+        serving other requests. Returns False if the connection failed."""
+
+        self._unregister_socket()
+        self._connecting = True
+
+        try:
+            await self._loop.run_in_executor(None, self._client.reconnect)
+        except OSError as ex:
+            logger.warning(f"Failed to connect to MQTT broker: {ex}")
+            return False
+        finally:
+            self._connecting = False
+
+        self._register_socket()
+
+        return True
+
+    async def run(self) -> None:
+        """Connect to the broker, handle keep-alive and reconnect if the connection
+        is lost. Runs until cancelled."""
+
+        try:
+            while True:
+                result = self._client.loop_misc()
+
+                if result == mqtt.MQTT_ERR_NO_CONN and not await self._connect():
+                    await asyncio.sleep(AsyncioMqttLoop.RECONNECT_DELAY)
+                    continue
+
+                await asyncio.sleep(AsyncioMqttLoop.MISC_INTERVAL)
+        finally:
+            self._unregister_socket()
@@ -0,0 +1,142 @@
+"""Static analysis of value and label expressions."""
+
+import ast
+
+# Builtin functions which always return the same result for the same arguments.
+_PURE_BUILTINS = {
+    "abs",
+    "bool",
+    "float",
+    "format",
+    "hex",
+    "int",
+    "len",
+    "max",
+    "min",
+    "oct",
+    "repr",
+    "round",
+    "str",
+    "sum",
+}
+
+# Attributes of the message, which only depend on the topic
+_TOPIC_ATTRIBUTES = {"topic", "topic_list", "groups"}
+
+# Names which only depend on the topic
+_TOPIC_NAMES = {"tlist", "groups"}
+
+
+def is_topic_expression(source: str) -> bool:
+    """Return True if the result of an expression only depends on the topic of a
+    message, i.e. if it only references `tlist`, `groups`, `msg.topic`,
+    `msg.topic_list` or `msg.groups`, constants and pure builtin functions."""
+
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError:
+        return False
+
+    # Collect the msg names which are directly used for topic attributes
+    topic_msg_names = {
+        id(node.value)
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Attribute)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == "msg"
+        and node.attr in _TOPIC_ATTRIBUTES
+    }
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.NamedExpr, ast.Lambda)):
+            return False
+
+        if not isinstance(node, ast.Name):
+            continue
+
+        if node.id in _TOPIC_NAMES:
+            continue
+
+        if node.id == "msg" and id(node) in topic_msg_names:
+            continue
+
+        if node.id in _PURE_BUILTINS:
+            continue
+
+        return False
+
+    return True
+
+
+def _parent_map(tree: ast.AST) -> dict[int, ast.AST]:
+    """Return a mapping of node ids to their parent nodes"""
+
+    return {
+        id(child): node
+        for node in ast.walk(tree)
+        for child in ast.iter_child_nodes(node)
+    }
+
+
+def data_paths(source: str) -> set[tuple[str, ...]] | None:
+    """Return the key paths of the message data referenced by an expression, e.g.
+    `{('ENERGY', 'Power')}` for `data['ENERGY']['Power'] * 2`.
+
+    A path ends at the first key which is not a string, e.g. a list index. Returns
+    None if the expression uses the data in any other way than by looking up
+    constant keys, i.e. if it needs the complete data."""
+
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError:
+        return None
+
+    parents = _parent_map(tree)
+    paths: set[tuple[str, ...]] = set()
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Name):
+            continue
+
+        if node.id == "msg":
+            parent = parents.get(id(node))
+            if not (
+                isinstance(parent, ast.Attribute) and parent.attr in _TOPIC_ATTRIBUTES
+            ):
+                return None
+
+        if node.id != "data":
+            continue
+
+        if not isinstance(node.ctx, ast.Load):
+            return None
+
+        keys: list[str] = []
+        current: ast.AST = node
+        parent = parents.get(id(current))
+
+        while isinstance(parent, ast.Subscript) and parent.value is current:
+            key = parent.slice
+            if not (isinstance(key, ast.Constant) and isinstance(key.value, str)):
+                break
+
+            keys.append(key.value)
+            current = parent
+            parent = parents.get(id(current))
+
+        if not keys:
+            return None
+
+        paths.add(tuple(keys))
+
+    return paths
+
+
+def minimize_paths(paths: set[tuple[str, ...]]) -> set[tuple[str, ...]]:
+    """Remove all paths of which a prefix is also contained in the set"""
+
+    return {
+        path
+        for path in paths
+        if not any(path[:length] in paths for length in range(1, len(path)))
+    }
@@ -0,0 +1,213 @@
+"""Capture files of received MQTT messages.
+
+Captured messages can be replayed, e.g. to measure the performance of a
+configuration with real data without connecting to the broker.
+
+A capture file starts with a magic string identifying the format, followed by one
+record per message. Each record consists of a fixed size header with the arrival
+time, the length of the topic and the length of the payload, followed by the
+topic and the payload.
+
+"""
+
+import struct
+import time
+from pathlib import Path
+from threading import Lock
+from typing import BinaryIO, Iterable, Iterator, NamedTuple
+
+from .msg import Message
+from .promqtt import MqttPrometheusBridge
+
+# Magic string at the start of a capture file, including the format version
+MAGIC = b"PROMQTT-CAPTURE-1\n"
+
+# Record header: arrival time (seconds since epoch), topic length, payload length
+_HEADER = struct.Struct("<dHI")
+
+
+class CaptureFormatException(Exception):
+    """Raised if a file is not a valid capture file"""
+
+
+class CapturedMessage(NamedTuple):
+    """A message read from a capture file"""
+
+    timestamp: float
+    topic: str
+    payload: bytes
+
+
+class CaptureWriter:
+    """Append received messages to a capture file. A truncated record at the end
+    of an existing file is removed before appending.
+
+    :raises CaptureFormatException: If the file exists and is not a capture
+      file."""
+
+    def __init__(self, filename: Path) -> None:
+        self._lock = Lock()
+
+        # The file stays open until close() is called
+        # pylint: disable-next=consider-using-with
+        self._fhdl: BinaryIO = open(filename, mode="a+b")
+
+        self._fhdl.seek(0)
+        magic = self._fhdl.read(len(MAGIC))
+
+        if magic == MAGIC:
+            # Drop a truncated record of an interrupted recording, so that new
+            # records are appended after the last complete one
+            end = len(MAGIC)
+            for _ in _read_records(self._fhdl):
+                end = self._fhdl.tell()
+            self._fhdl.truncate(end)
+        elif MAGIC.startswith(magic):
+            # Empty file or interrupted while writing the magic string
+            self._fhdl.truncate(0)
+            self._fhdl.write(MAGIC)
+        else:
+            self._fhdl.close()
+            raise CaptureFormatException(f"'{filename}' is not a capture file.")
+
+    def write(self, timestamp: float, topic: str, payload: bytes) -> None:
+        """Append a message to the capture file"""
+
+        topic_data = topic.encode("utf-8")
+        record = (
+            _HEADER.pack(timestamp, len(topic_data), len(payload))
+            + topic_data
+            + payload
+        )
+
+        with self._lock:
+            self._fhdl.write(record)
+
+    def flush(self) -> None:
+        """Write buffered records to the file"""
+
+        with self._lock:
+            self._fhdl.flush()
+
+    def close(self) -> None:
+        """Close the capture file"""
+
+        with self._lock:
+            self._fhdl.close()
+
+
+def read_capture(filename: Path) -> Iterator[CapturedMessage]:
+    """Read the messages of a capture file. A truncated record at the end of the
+    file, e.g. from an interrupted recording, is ignored.
+
+    :raises CaptureFormatException: If the file is not a capture file."""
+
+    with open(filename, mode="rb") as fhdl:
+        if fhdl.read(len(MAGIC)) != MAGIC:
+            raise CaptureFormatException(f"'{filename}' is not a capture file.")
+
+        yield from _read_records(fhdl)
+
+
+def _read_records(fhdl: BinaryIO) -> Iterator[CapturedMessage]:
+    """Read the records following the magic string up to the last complete one.
+    After each message, the file position is at the end of its record."""
+
+    while True:
+        header = fhdl.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+
+        timestamp, topic_len, payload_len = _HEADER.unpack(header)
+
+        topic = fhdl.read(topic_len)
+        payload = fhdl.read(payload_len)
+        if len(topic) < topic_len or len(payload) < payload_len:
+            return
+
+        yield CapturedMessage(timestamp, topic.decode("utf-8"), payload)
+
+
+class ReplayStats:
+    """Throughput and latency of replaying messages"""
+
+    def __init__(self, duration: float, latencies: list[float]) -> None:
+        self._duration = duration
+        self._latencies = sorted(latencies)
+
+    @property
+    def messages(self) -> int:
+        """Return the number of replayed messages"""
+        return len(self._latencies)
+
+    @property
+    def duration(self) -> float:
+        """Return the duration of the replay in seconds"""
+        return self._duration
+
+    @property
+    def throughput(self) -> float:
+        """Return the number of messages handled per second"""
+
+        if self._duration <= 0:
+            return 0.0
+
+        return self.messages / self._duration
+
+    def latency(self, percentile: float) -> float:
+        """Return a percentile (0 to 100) of the time in seconds for handling a
+        message"""
+
+        if not self._latencies:
+            return 0.0
+
+        index = round(percentile / 100 * (len(self._latencies) - 1))
+        return self._latencies[index]
+
+    def report(self) -> str:
+        """Return a human readable report of the statistics"""
+
+        lines = [
+            f"messages:   {self.messages}",
+            f"duration:   {self.duration:.3f} s",
+            f"throughput: {self.throughput:.1f} msg/s",
+        ]
+
+        for percentile in (50, 90, 99, 100):
+            lines.append(
+                f"latency p{percentile}: {self.latency(percentile) * 1e6:.1f} us"
+            )
+
+        return "\n".join(lines)
+
+
+def replay(
+    bridge: MqttPrometheusBridge, messages: Iterable[CapturedMessage], speed: float = 0
+) -> ReplayStats:
+    """Feed captured messages to the bridge one by one.
+
+    :param speed: Replay speed relative to the original arrival times, e.g. 1 for
+      the original speed or 2 for twice as fast. 0 replays as fast as possible.
+    :returns: The duration of the replay and the time for handling each message."""
+
+    latencies: list[float] = []
+
+    start = time.perf_counter()
+    first: float | None = None
+
+    for captured in messages:
+        if speed > 0:
+            if first is None:
+                first = captured.timestamp
+
+            delay = start + (captured.timestamp - first) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        msg = Message(captured.topic, captured.payload)
+
+        begin = time.perf_counter()
+        bridge.handle_mqtt_message(msg)
+        latencies.append(time.perf_counter() - begin)
+
+    return ReplayStats(time.perf_counter() - start, latencies)
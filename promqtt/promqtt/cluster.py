@@ -0,0 +1,185 @@
+"""Merged metrics of multiple promqtt instances.
+
+Multiple promqtt instances can share the processing of MQTT messages by
+subscribing as members of the same MQTT shared subscription group. Each instance
+serves the state of its prometheus exporter at the '/state' endpoint. An instance
+configured with the URLs of the other members serves the merged metrics of all
+instances at its '/metrics' endpoint. Each state contains the name of its
+instance, which is used as label of the metrics kept per instance.
+
+The states of the members are retrieved concurrently within the timeout. Each
+state is served with an ETag, so that unchanged states are not transferred again,
+and the merged metrics are only merged again if any state has changed.
+
+"""
+
+import json
+import logging
+import os
+import socket
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any
+
+from ..cfgmodel import ClusterModel
+from ..promexp import PrometheusExporter, merge_states
+
+logger = logging.getLogger(__name__)
+
+# Path of the HTTP endpoint serving the exporter state
+STATE_PATH = "/state"
+
+# Retrieved state of a member as (ETag, state)
+MemberState = tuple[str | None, dict[str, Any]]
+
+
+class ClusterView:  # pylint: disable=too-many-instance-attributes
+    """Merge the metrics of this promqtt instance with the other members"""
+
+    def __init__(self, prom_exp: PrometheusExporter, cfg: ClusterModel) -> None:
+        self._prom_exp = prom_exp
+        self._cfg = cfg
+        self._name = cfg.name or socket.gethostname()
+
+        # Random prefix of the ETags of the state, so that they differ between
+        # instances and restarts
+        self._etag_prefix = os.urandom(4).hex()
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(cfg.members), 1), thread_name_prefix="cluster"
+        )
+
+        # Last retrieved state of each member and the retrievals in progress,
+        # which are not started again while pending
+        self._states: dict[str, MemberState] = {}
+        self._pending: dict[str, Future[MemberState | None]] = {}
+
+        # Merged exporter with the generation and ETags of the states it was
+        # merged from
+        self._merged: tuple[tuple[Any, ...], PrometheusExporter] | None = None
+        self._lock = Lock()
+
+    @property
+    def members(self) -> list[str]:
+        """Return the base URLs of the other members"""
+        return self._cfg.members
+
+    def _state(self) -> tuple[dict[str, Any], int]:
+        """Return the state of the local exporter with the name of this instance
+        and the generation of the exporter"""
+
+        state, generation = self._prom_exp.get_state_with_generation()
+        state["member"] = self._name
+
+        return state, generation
+
+    def render_state(self) -> str:
+        """Return the state of the local exporter as JSON string"""
+
+        return json.dumps(self._state()[0])
+
+    def render_state_with_etag(self) -> tuple[bytes, str]:
+        """Return the state of the local exporter as UTF-8 encoded JSON and its
+        ETag, which changes whenever the state changes"""
+
+        state, generation = self._state()
+
+        return json.dumps(state).encode("utf-8"), f'"{self._etag_prefix}-{generation}"'
+
+    def _fetch_state(
+        self, member: str, cached: MemberState | None
+    ) -> MemberState | None:
+        """Retrieve the exporter state of a member. Returns the cached state if it
+        has not changed and None if the member is not reachable."""
+
+        url = member.rstrip("/") + STATE_PATH
+
+        request = urllib.request.Request(url)
+        if cached is not None and cached[0] is not None:
+            request.add_header("If-None-Match", cached[0])
+
+        try:
+            with urllib.request.urlopen(request, timeout=self._cfg.timeout) as response:
+                return response.headers.get("ETag"), json.loads(response.read())
+        except urllib.error.HTTPError as ex:
+            if ex.code == 304 and cached is not None:
+                return cached
+            logger.warning(f"Failed to retrieve state of cluster member {url}: {ex}")
+            return None
+        except (OSError, ValueError) as ex:
+            logger.warning(f"Failed to retrieve state of cluster member {url}: {ex}")
+            return None
+
+    def _fetch_states(self) -> dict[str, Future[MemberState | None]]:
+        """Start retrieving the states of all members, unless a retrieval is still
+        in progress"""
+
+        futures = {}
+
+        for member in self._cfg.members:
+            future = self._pending.get(member)
+            if future is None:
+                future = self._executor.submit(
+                    self._fetch_state, member, self._states.get(member)
+                )
+                self._pending[member] = future
+            futures[member] = future
+
+        return futures
+
+    def merged(self) -> PrometheusExporter:
+        """Return an exporter with the merged metrics of all members which are
+        reachable within the timeout. The exporter is reused as long as no state
+        has changed."""
+
+        with self._lock:
+            futures = self._fetch_states()
+
+            state, generation = self._state()
+            states = [state]
+            key: list[Any] = [generation]
+
+            wait(futures.values(), timeout=self._cfg.timeout)
+
+            for member, future in futures.items():
+                if not future.done():
+                    logger.warning(
+                        f"Timeout retrieving state of cluster member {member}"
+                    )
+                    continue
+
+                del self._pending[member]
+
+                result = future.result()
+                if result is None:
+                    self._states.pop(member, None)
+                    continue
+
+                self._states[member] = result
+                states.append(result[1])
+                key.append((member, result[0]))
+
+            # States without ETag cannot be compared, so the merged metrics are
+            # not reused then
+            cacheable = all(etag is not None for _, etag in key[1:])
+
+            if cacheable and self._merged is not None and self._merged[0] == tuple(key):
+                return self._merged[1]
+
+            merged = merge_states(states)
+            self._merged = (tuple(key), merged) if cacheable else None
+
+            return merged
+
+    def render(self) -> str:
+        """Render the merged metrics of all reachable members"""
+
+        return self.merged().render()
+
+    def render_with_etag(self) -> tuple[bytes, str]:
+        """Render the merged metrics of all reachable members as UTF-8 encoded
+        bytes together with their ETag, see `PrometheusExporter.render_with_etag()`"""
+
+        return self.merged().render_with_etag()
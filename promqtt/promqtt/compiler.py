@@ -0,0 +1,247 @@
+"""Compiler for the value and label expressions of mappings.
+
+Expressions are compiled once when the configuration is loaded. In addition, all
+mappings of a type are fused into a single generated function, which sets up the
+evaluation context once per message and returns the updates of all mappings.
+
+"""
+
+import logging
+from types import CodeType
+from typing import TYPE_CHECKING, Any, Callable
+
+from ..utils import LruCache
+from .msg import Message
+
+if TYPE_CHECKING:
+    from .mapping import Mapping, MetricUpdate
+
+logger = logging.getLogger(__name__)
+
+
+class ExpressionCompileError(Exception):
+    """Raised when an expression from the configuration cannot be compiled."""
+
+
+def compile_expression(source: str, origin: str) -> CodeType:
+    """Compile a python expression to a code object.
+
+    :param str source: The source code of the expression.
+    :param str origin: Description where the expression comes from. Used in
+      error messages and tracebacks."""
+
+    try:
+        return compile(source, f"<{origin}>", "eval")
+    except SyntaxError as ex:
+        raise ExpressionCompileError(
+            f"{origin}: Invalid expression '{source}': {ex}"
+        ) from ex
+
+
+# Template code for evaluating one mapping inside of the fused function of a type.
+# Expressions are placed on separate lines in parentheses, so that e.g. comments in
+# an expression cannot break the generated code.
+_MAPPING_TEMPLATE = """
+    # {mapping}
+    try:
+        _value = (
+{value}
+        )
+    except Exception as _ex:
+        _value_fault({index}, msg, _ex)
+    else:
+        try:
+            _labels = {{{labels}}}
+        except Exception as _ex:
+            _label_fault({index}, msg, _ex)
+        else:
+            _results.append((_metrics[{index}], _labels, _value))
+"""
+
+# Template code for a mapping whose labels only depend on the topic. The labels are
+# taken from the result of the topic label function, which is cached per topic.
+_TOPIC_MAPPING_TEMPLATE = """
+    # {mapping}
+    _labels = _topic_labels[{index}]
+    if _labels is not None:
+        try:
+            _value = (
+{value}
+            )
+        except Exception as _ex:
+            _value_fault({index}, msg, _ex)
+        else:
+            _results.append((_metrics[{index}], _labels, _value))
+"""
+
+# Template code for evaluating the labels of a mapping in the topic label function
+_TOPIC_LABELS_TEMPLATE = """
+    # {mapping}
+    try:
+        _results[{index}] = {{{labels}}}
+    except Exception as _ex:
+        _label_fault({index}, msg, _ex)
+"""
+
+_LABEL_TEMPLATE = """
+                {name!r}: (
+{value}
+                ),"""
+
+_FUNCTION_TEMPLATE = """
+def _type_program(msg, _topic_labels):
+    data = msg.data
+    tlist = msg.topic_list
+    groups = msg.groups
+    _results = []
+{body}
+    return _results
+"""
+
+_TOPIC_FUNCTION_TEMPLATE = """
+def _topic_label_program(msg):
+    tlist = msg.topic_list
+    groups = msg.groups
+    _results = [None] * {count}
+{body}
+    return _results
+"""
+
+
+def _generate_labels(mapping: "Mapping") -> str:
+    """Generate the source code of the label dictionary of a mapping"""
+
+    return "".join(
+        _LABEL_TEMPLATE.format(name=label_name, value=label_exp)
+        for label_name, label_exp in mapping.label_exps.items()
+    )
+
+
+def _generate_source(mappings: list["Mapping"]) -> str:
+    """Generate the source code of the fused function for a list of mappings."""
+
+    body = []
+
+    for index, mapping in enumerate(mappings):
+        if mapping.has_topic_labels:
+            template = _TOPIC_MAPPING_TEMPLATE
+        else:
+            template = _MAPPING_TEMPLATE
+
+        body.append(
+            template.format(
+                mapping=mapping,
+                index=index,
+                value=mapping.value_exp,
+                labels=_generate_labels(mapping),
+            )
+        )
+
+    topic_body = [
+        _TOPIC_LABELS_TEMPLATE.format(
+            mapping=mapping, index=index, labels=_generate_labels(mapping)
+        )
+        for index, mapping in enumerate(mappings)
+        if mapping.has_topic_labels
+    ]
+
+    source = _FUNCTION_TEMPLATE.format(body="".join(body))
+    source += _TOPIC_FUNCTION_TEMPLATE.format(
+        count=len(mappings), body="".join(topic_body)
+    )
+
+    return source
+
+
+class TypeProgram:
+    """All mappings of a type fused into one generated function.
+
+    The function evaluates the value and label expressions of all mappings for a
+    message and returns the resulting metric updates. A mapping whose value or
+    labels cannot be evaluated does not contribute an update, but does not affect
+    the other mappings.
+
+    Labels which only depend on the message topic are evaluated by a separate
+    function. Its results are cached per topic and the cached label dictionaries
+    are passed on to the exporter as they are."""
+
+    def __init__(
+        self,
+        type_name: str,
+        mappings: list["Mapping"],
+        label_cache_size: int = 4096,
+    ) -> None:
+        self._type_name = type_name
+        self._mappings = mappings
+        self._label_cache: LruCache[str, list[dict[str, Any] | None]] = LruCache(
+            label_cache_size
+        )
+        self._has_topic_labels = any(mapping.has_topic_labels for mapping in mappings)
+        self._func, self._topic_label_func = self._compile()
+
+    def _compile(
+        self,
+    ) -> tuple[
+        Callable[[Message, list[dict[str, Any] | None]], list["MetricUpdate"]],
+        Callable[[Message], list[dict[str, Any] | None]],
+    ]:
+        """Generate and compile the fused function and the topic label function of
+        this type."""
+
+        source = _generate_source(self._mappings)
+
+        namespace: dict[str, Any] = {
+            "_metrics": [mapping.metric for mapping in self._mappings],
+            "_value_fault": self._value_fault,
+            "_label_fault": self._label_fault,
+        }
+
+        code = compile(source, f"<{self}>", "exec")
+        exec(code, namespace)  # pylint: disable=exec-used
+
+        logger.debug(f"Compiled {self} with {len(self._mappings)} mappings")
+
+        return namespace["_type_program"], namespace["_topic_label_program"]
+
+    def _value_fault(self, index: int, msg: Message, ex: Exception) -> None:
+        """Called from the generated function if a value expression fails."""
+
+        self._mappings[index].log_value_fault(msg, ex)
+
+    def _label_fault(self, index: int, msg: Message, ex: Exception) -> None:
+        """Called from the generated function if a label expression fails."""
+
+        self._mappings[index].log_label_fault(msg, ex)
+
+    @property
+    def type_name(self) -> str:
+        """Return the name of the type"""
+        return self._type_name
+
+    @property
+    def mappings(self) -> list["Mapping"]:
+        """Return the mappings of this type"""
+        return self._mappings
+
+    def _topic_labels(self, msg: Message) -> list[dict[str, Any] | None]:
+        """Return the labels of the mappings which only depend on the topic. The
+        result is cached per topic."""
+
+        if not self._has_topic_labels:
+            return []
+
+        labels = self._label_cache.get(msg.topic)
+
+        if labels is None:
+            labels = self._topic_label_func(msg)
+            self._label_cache.put(msg.topic, labels)
+
+        return labels
+
+    def evaluate(self, msg: Message) -> list["MetricUpdate"]:
+        """Evaluate all mappings of this type and return the metric updates."""
+
+        return self._func(msg, self._topic_labels(msg))
+
+    def __str__(self) -> str:
+        return f"TypeProgram(type={self._type_name})"
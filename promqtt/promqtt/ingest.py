@@ -0,0 +1,267 @@
+"""Bounded queue between the MQTT client and the message processing.
+
+The MQTT client only puts received messages into the queue, so its network loop
+never waits for the processing of messages. A pool of worker threads takes the
+messages from the queue in batches and hands them over to the bridge. The
+messages are distributed to the workers by topic, so the messages of a topic are
+processed in the order they were received.
+
+"""
+
+import asyncio
+import logging
+from collections import deque
+from threading import Condition, Lock, Thread
+from typing import Callable
+
+from ..cfgmodel import IngestModel, MetricTypeEnum, OverflowPolicyEnum
+from ..promexp import PrometheusExporter
+from .msg import Message
+
+logger = logging.getLogger(__name__)
+
+# Function processing a batch of messages
+BatchHandler = Callable[[list[Message]], None]
+
+
+class _Shard:  # pylint: disable=too-few-public-methods
+    """Queue of the messages processed by one worker"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.messages: deque[Message] = deque()
+        self.cond = Condition()
+        self.dropped = 0
+        self.stopping = False
+
+
+class IngestQueue:
+    """Queue received messages and process them with a pool of workers"""
+
+    # Name of the queue depth metric
+    DEPTH_METRIC = "promqtt_ingest_queue_depth"
+
+    # Name of the dropped messages metric
+    DROPPED_METRIC = "promqtt_ingest_dropped_messages"
+
+    def __init__(
+        self, prom_exp: PrometheusExporter, cfg: IngestModel, handler: BatchHandler
+    ) -> None:
+        self._prom_exp = prom_exp
+        self._cfg = cfg
+        self._handler = handler
+
+        self._shards = [
+            _Shard(max(cfg.queue_size // cfg.workers, 1)) for _ in range(cfg.workers)
+        ]
+        self._threads: list[Thread] = []
+
+        # Serializes the metric updates, so that an outdated depth does not
+        # overwrite a newer one, and the values last published
+        self._metrics_lock = Lock()
+        self._published: tuple[int, int] | None = None
+
+        if self._shards:
+            self._prom_exp.register(
+                name=IngestQueue.DEPTH_METRIC,
+                datatype=MetricTypeEnum.GAUGE,
+                helpstr="Number of received messages waiting for processing",
+                per_member=True,
+            )
+            self._prom_exp.register(
+                name=IngestQueue.DROPPED_METRIC,
+                datatype=MetricTypeEnum.COUNTER,
+                helpstr="Number of received messages dropped because the queue was full",
+                per_member=True,
+            )
+
+            # The metrics are determined when scraped, so they are current even if
+            # all workers are stuck
+            self._prom_exp.add_collector(self._update_metrics)
+
+    @property
+    def depth(self) -> int:
+        """Return the number of messages waiting for processing"""
+        return sum(len(shard.messages) for shard in self._shards)
+
+    @property
+    def dropped(self) -> int:
+        """Return the number of dropped messages"""
+        return sum(shard.dropped for shard in self._shards)
+
+    def start(self) -> None:
+        """Start the worker threads"""
+
+        for index, shard in enumerate(self._shards):
+            thread = Thread(
+                target=self._run_worker,
+                args=(index, shard),
+                name=f"ingest_worker_{index}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f"Started {len(self._threads)} ingest worker(s).")
+
+    def stop(self) -> None:
+        """Process the queued messages and stop the worker threads"""
+
+        for shard in self._shards:
+            with shard.cond:
+                shard.stopping = True
+                shard.cond.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
+
+    def put(self, msg: Message) -> None:
+        """Queue a received message for processing. Without workers, the message is
+        processed immediately."""
+
+        if not self._shards:
+            self._handler([msg])
+            return
+
+        shard = self._shards[hash(msg.topic) % len(self._shards)]
+
+        with shard.cond:
+            if len(shard.messages) >= shard.maxsize:
+                if self._cfg.overflow == OverflowPolicyEnum.BLOCK:
+                    shard.cond.wait_for(
+                        lambda: len(shard.messages) < shard.maxsize or shard.stopping
+                    )
+                elif self._cfg.overflow == OverflowPolicyEnum.DROP_OLDEST:
+                    shard.messages.popleft()
+                    shard.dropped += 1
+                else:
+                    shard.dropped += 1
+                    return
+
+            shard.messages.append(msg)
+            shard.cond.notify_all()
+
+    def _take_batch(self, shard: _Shard) -> list[Message] | None:
+        """Wait for messages and take a batch of them from the queue. Returns None
+        if the worker shall stop."""
+
+        with shard.cond:
+            shard.cond.wait_for(lambda: shard.messages or shard.stopping)
+
+            if not shard.messages:
+                return None
+
+            count = min(len(shard.messages), max(self._cfg.batch_size, 1))
+            batch = [shard.messages.popleft() for _ in range(count)]
+
+            # wake up a blocked network thread
+            shard.cond.notify_all()
+
+            return batch
+
+    def _run_worker(self, index: int, shard: _Shard) -> None:
+        """Process the messages of a shard until the queue is stopped"""
+
+        while True:
+            batch = self._take_batch(shard)
+            if batch is None:
+                break
+
+            try:
+                self._handler(batch)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Ingest worker {index} failed to handle messages")
+
+        logger.debug(f"Ingest worker {index} stopped.")
+
+    def _update_metrics(self) -> None:
+        """Publish the queue depth and the number of dropped messages. Unchanged
+        values are not set again, so that the rendered output stays cached."""
+
+        with self._metrics_lock:
+            values = (self.depth, self.dropped)
+
+            if values != self._published:
+                self._prom_exp.set_many(
+                    [
+                        (IngestQueue.DEPTH_METRIC, {}, values[0]),
+                        (IngestQueue.DROPPED_METRIC, {}, values[1]),
+                    ]
+                )
+                self._published = values
+
+
+class AsyncIngestQueue(IngestQueue):
+    """Queue received messages and process them on the asyncio event loop.
+
+    Processing is scheduled with `call_soon()`, so the event loop can handle
+    network I/O in between the batches. With the 'block' overflow policy, a
+    batch is processed immediately when the queue is full."""
+
+    def __init__(
+        self,
+        prom_exp: PrometheusExporter,
+        cfg: IngestModel,
+        handler: BatchHandler,
+        loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        super().__init__(prom_exp, cfg.copy(update={"workers": 1}), handler)
+
+        self._loop = loop
+        self._scheduled = False
+
+    def start(self) -> None:
+        """Nothing to start, processing is scheduled on the event loop"""
+
+    def stop(self) -> None:
+        """Process the queued messages"""
+
+        while self._shards[0].messages:
+            self._process_batch()
+
+    def put(self, msg: Message) -> None:
+        """Queue a received message for processing. Must be called from the event
+        loop thread."""
+
+        shard = self._shards[0]
+
+        if len(shard.messages) >= shard.maxsize:
+            if self._cfg.overflow == OverflowPolicyEnum.BLOCK:
+                self._process_batch()
+            elif self._cfg.overflow == OverflowPolicyEnum.DROP_OLDEST:
+                shard.messages.popleft()
+                shard.dropped += 1
+            else:
+                shard.dropped += 1
+                return
+
+        shard.messages.append(msg)
+
+        if not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon(self._run_scheduled)
+
+    def _process_batch(self) -> None:
+        """Process a batch of queued messages"""
+
+        shard = self._shards[0]
+
+        count = min(len(shard.messages), max(self._cfg.batch_size, 1))
+        batch = [shard.messages.popleft() for _ in range(count)]
+
+        try:
+            self._handler(batch)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to handle messages")
+
+    def _run_scheduled(self) -> None:
+        """Process a batch and schedule processing of the remaining messages"""
+
+        self._process_batch()
+
+        if self._shards[0].messages:
+            self._loop.call_soon(self._run_scheduled)
+        else:
+            self._scheduled = False
@@ -3,87 +3,88 @@
 import logging
 from typing import Any
 
-from ..promexp import PrometheusExporter
+from .analysis import is_topic_expression
+from .compiler import compile_expression
 from .msg import Message
 
 logger = logging.getLogger(__name__)
 
+# A single update of the prometheus exporter, i.e. metric name, labels and value
+MetricUpdate = tuple[str, dict[str, Any], Any]
+
 
 class Mapping:
     """A mapping takes data from a message received from MQTT, extracts a value and
-    possibly also label values and submits the results to the prometheus
-    exporter.
+    possibly also label values for a metric.
+
+    The expressions are checked when the mapping is created. They are evaluated by
+    the function of the type the mapping belongs to, see `TypeProgram`.
 
     """
 
-    def __init__(  # pylint: disable=too-many-arguments
+    def __init__(
         self,
-        promexp: PrometheusExporter,
         type_name: str,
         value_exp: str,
         label_exps: dict[str, str],
         metric,
     ) -> None:
         self._type_name = type_name
-        self._promexp = promexp
         self._value_exp = value_exp
         self._label_exps = label_exps
         self._metric = metric
 
-    def handle_msg_data(self, msg: Message) -> None:
-        """Handle a message received from MQTT"""
-
-        eglobals: dict[str, Any] = {}
-        elocals: dict[str, Any] = {
-            "msg": msg,
-            "data": msg.data,
-            "tlist": msg.topic_list,
-        }
-
-        # calculate value
-
-        try:
-            # pylint: disable=eval-used
-            value = eval(self._value_exp, eglobals, elocals)
-        except Exception as ex:  # pylint: disable=broad-except
-            # We only print a debug log, as we want the message handling to be
-            # fault tolerant. Message contents sometimes change over time and
-            # not every member is available all the time. To issues are to be
-            # expected
-            logger.warning(
-                f"{self}: Cannot evaluate value expression '{self._value_exp}' "
-                f"for message {msg}: {ex}"
-            )
-            return
-
-        # calculate labels
-
-        labels = {}
-        label_fault = False
-
-        for label_name, value_exp in self._label_exps.items():
-            try:
-                # pylint: disable=eval-used
-                labels[label_name] = eval(value_exp, eglobals, elocals)
-            except Exception as ex:  # pylint: disable=broad-except
-                # We only print a debug log, as we want the message handling to
-                # be fault tolerant. Message contents sometimes change over time
-                # and not every member is available all the time. To issues are
-                # to be expected
-                logger.debug(
-                    f"{self}: Cannot evaluate label expression '{self._value_exp}' "
-                    f"for message {msg}: {ex}"
-                )
-
-                label_fault = True
-
-        # if at least one label had a fault, we return
-        if label_fault:
-            return
-
-        # Hand over metric data to prometheus exporter
-
-        self._promexp.set(name=self._metric, labels=labels, value=value)
+        for source in (value_exp, *label_exps.values()):
+            compile_expression(source, str(self))
+
+        self._has_topic_labels = all(
+            is_topic_expression(label_exp) for label_exp in label_exps.values()
+        )
+
+    @property
+    def metric(self) -> str:
+        """Return the name of the metric updated by this mapping"""
+        return self._metric
+
+    @property
+    def value_exp(self) -> str:
+        """Return the source of the value expression"""
+        return self._value_exp
+
+    @property
+    def label_exps(self) -> dict[str, str]:
+        """Return the sources of the label expressions"""
+        return self._label_exps
+
+    @property
+    def has_topic_labels(self) -> bool:
+        """Return True if all labels only depend on the topic of a message. The
+        labels are then the same for all messages of a topic."""
+        return self._has_topic_labels
+
+    def log_value_fault(self, msg: Message, ex: Exception) -> None:
+        """Log a failure to evaluate the value expression for a message."""
+
+        # We only print a warning, as we want the message handling to be
+        # fault tolerant. Message contents sometimes change over time and
+        # not every member is available all the time. To issues are to be
+        # expected
+        logger.warning(
+            f"{self}: Cannot evaluate value expression '{self._value_exp}' "
+            f"for message {msg}: {ex}"
+        )
+
+    def log_label_fault(self, msg: Message, ex: Exception) -> None:
+        """Log a failure to evaluate a label expression for a message."""
+
+        # We only print a debug log, as we want the message handling to be
+        # fault tolerant. Message contents sometimes change over time and
+        # not every member is available all the time. To issues are to be
+        # expected
+        logger.debug(
+            f"{self}: Cannot evaluate label expressions {self._label_exps} "
+            f"for message {msg}: {ex}"
+        )
 
     def __str__(self) -> str:
         return f"Mapping(type={self._type_name}, metric={self._metric})"
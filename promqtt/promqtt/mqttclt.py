@@ -2,12 +2,16 @@
 for prometheus."""
 
 import logging
+import time
 from typing import Any
 
 import paho.mqtt.client as mqtt
 
 from ..cfgmodel import MetricTypeEnum, MqttModel
 from ..promexp import PrometheusExporter
+from .aioloop import AsyncioMqttLoop
+from .capture import CaptureWriter
+from .ingest import IngestQueue
 from .msg import Message
 
 logger = logging.getLogger(__name__)
@@ -19,22 +23,33 @@ class MqttClient:  # pylint: disable=too-few-public-methods
     # Name of MQTT connection state metric
     MQTT_CONN_STATE_METRIC = "promqtt_mqtt_conn_state"
 
-    def __init__(self, prom_exp: PrometheusExporter, cfg: MqttModel, promqtt) -> None:
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        prom_exp: PrometheusExporter,
+        cfg: MqttModel,
+        promqtt,
+        ingest: IngestQueue | None = None,
+        recorder: CaptureWriter | None = None,
+    ) -> None:
         self._prom_exp = prom_exp
         self._cfg: MqttModel = cfg
         self._promqtt = promqtt
+        self._ingest = ingest
+        self._recorder = recorder
 
         # register metric for MQTT connection state
         self._prom_exp.register(
             name=MqttClient.MQTT_CONN_STATE_METRIC,
             datatype=MetricTypeEnum.GAUGE,
             helpstr="Connection state of the connection to the MQTT broker",
+            per_member=True,
         )
 
         self._setup_mqtt_client()
 
     def _setup_mqtt_client(self) -> None:
-        """Configure MQTT client and establish connection"""
+        """Configure the MQTT client. The connection is established by the network
+        loop."""
 
         logger.info(
             f"Connecting to MQTT broker at {self._cfg.broker}:{self._cfg.port}."
@@ -47,16 +62,45 @@ class MqttClient:  # pylint: disable=too-few-public-methods
         self._mqttc.on_connect = self._on_connect
         self._mqttc.on_disconnect = self._on_disconnect
 
-        self._mqttc.connect(host=self._cfg.broker, port=self._cfg.port)
-        logger.info(
-            f"Connection to MQTT broker {self._cfg.broker}:{self._cfg.port} established."
-        )
+        # The connection is established by the network loop, see loop_forever(),
+        # loop_start() and loop_asyncio()
+        self._mqttc.connect_async(host=self._cfg.broker, port=self._cfg.port)
+
+    def _subscription_topics(self) -> list[str]:
+        """Return the topic filters to subscribe to"""
+
+        if self._cfg.derive_subscriptions:
+            topics = self._promqtt.subscriptions
+        else:
+            topics = [self._cfg.topic]
+
+        if self._cfg.share_group:
+            return [f"$share/{self._cfg.share_group}/{topic}" for topic in topics]
+
+        return topics
 
     def loop_forever(self) -> None:
         """Run infinite loop to receive messages from MQTT broker"""
 
         self._mqttc.loop_forever()
 
+    async def loop_asyncio(self) -> None:
+        """Receive messages from MQTT broker on the running asyncio event loop.
+        Runs until cancelled."""
+
+        await AsyncioMqttLoop(self._mqttc).run()
+
+    def loop_start(self) -> None:
+        """Start a background thread to receive messages from MQTT broker"""
+
+        self._mqttc.loop_start()
+
+    def loop_stop(self) -> None:
+        """Disconnect from the MQTT broker and stop the background thread"""
+
+        self._mqttc.disconnect()
+        self._mqttc.loop_stop()
+
     def _on_message(self, client: mqtt.Client, obj, msg) -> None:
         """Callback function called by the MQTT client to handle incoming MQTT
         messages."""
@@ -64,10 +108,16 @@ class MqttClient:  # pylint: disable=too-few-public-methods
         del client
         del obj
 
+        if self._recorder is not None:
+            self._recorder.write(time.time(), msg.topic, msg.payload)
+
         msg = Message(msg.topic, msg.payload)
         logger.debug(f"Received message: {msg}")
 
-        self._promqtt.handle_mqtt_message(msg)
+        if self._ingest is not None:
+            self._ingest.put(msg)
+        else:
+            self._promqtt.handle_mqtt_message(msg)
 
     def _on_connect(
         self, client: mqtt.Client, userdata: Any, flags: dict, result: int
@@ -86,8 +136,9 @@ class MqttClient:  # pylint: disable=too-few-public-methods
 
         # Subscribing in on_connect() means that if we lose the connection and
         # reconnect then subscriptions will be renewed.
-        self._mqttc.subscribe(self._cfg.topic)
-        logger.debug(f"Subscribed to '{self._cfg.topic}'.")
+        topics = self._subscription_topics()
+        self._mqttc.subscribe([(topic, 0) for topic in topics])
+        logger.debug(f"Subscribed to {', '.join(repr(t) for t in topics)}.")
 
         self._prom_exp.set(
             name=MqttClient.MQTT_CONN_STATE_METRIC,
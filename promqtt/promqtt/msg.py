@@ -1,9 +1,12 @@
 """Representation of a MQTT message"""
 
-import json
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from ..cfgmodel import ParserTypeEnum
+from .parsers import get_parser
+
+if TYPE_CHECKING:
+    from .projection import Projection
 
 
 class Message:
@@ -14,6 +17,7 @@ class Message:
         self._topic_list = topic.split("/")
         self._payload = payload
         self._data = None
+        self._groups: dict[str, str] = {}
 
     @property
     def topic(self) -> str:
@@ -26,7 +30,7 @@ class Message:
         return self._payload
 
     @property
-    def data(self) -> dict[str, Any] | None:
+    def data(self) -> Any:
         """Return the parsed data of the message, e.g. the parsed JSON
         content"""
 
@@ -37,11 +41,29 @@ class Message:
         """Returns the topic as a list of topic components"""
         return self._topic_list
 
-    def parse(self, parser: ParserTypeEnum) -> None:
-        """Parse the message payload with the given parser / format."""
+    @property
+    def groups(self) -> dict[str, str]:
+        """Return the named groups of the regex topics matching the topic of the
+        message"""
+
+        return self._groups
+
+    @groups.setter
+    def groups(self, groups: dict[str, str]) -> None:
+        """Set the named groups of the matching regex topics"""
+
+        self._groups = groups
+
+    def parse(
+        self, parser: ParserTypeEnum, projection: "Projection | None" = None
+    ) -> None:
+        """Parse the message payload with the given parser / format. If a
+        projection is given, only the data referenced by it may be extracted."""
 
-        if parser == ParserTypeEnum.JSON:
-            self._data = json.loads(self._payload)
+        if projection is not None:
+            self._data = projection.parse(self._payload)
+        else:
+            self._data = get_parser(parser)(self._payload)
 
     def __str__(self) -> str:
         return f"{self.topic}: {self.payload!r}"
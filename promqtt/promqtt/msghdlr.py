@@ -1,58 +1,79 @@
 """Handler for received MQTT messages"""
 
-import logging
 import re
 
 from ..cfgmodel import ParserTypeEnum
-from .msg import Message
+from .compiler import TypeProgram
 
-logger = logging.getLogger(__name__)
+# Prefix of topics which are regular expressions
+REGEX_PREFIX = "re:"
 
 
-class MessageHandler:
-    """A message handler receives a message from MQTT, parses the contents and
-    hands it over to the mapping instances."""
-
-    def __init__(self, topics: list[str], parser: ParserTypeEnum, mappings) -> None:
-        self._topics = topics
-        self._parser = parser
-        self._mappings = mappings
-
-    def _can_handle_topic(self, topic) -> bool:
-        """Check if a topic can be handled. Checks for both literal matches and
-        regex topic patterns, i.e. topics starting with the prefix 're:'."""
+def topic_matches_filter(topic_filter: str, topic: str) -> bool:
+    """Check if a topic matches a MQTT topic filter, which may contain the
+    wildcards '+' (one level) and '#' (any number of levels)."""
 
-        for handled_topic in self._topics:
-            if handled_topic.startswith("re:"):
-                regex = handled_topic[3:]
-                match = re.match(regex, topic)
-                if match:
-                    return True
-            elif topic == handled_topic:
-                return True
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
 
+    # Wildcards do not match topics starting with '$', see MQTT spec 4.7.2
+    if topic.startswith("$") and filter_levels[0] in ("+", "#"):
         return False
 
-    def handle(self, msg: Message) -> None:
-        """Handle a message received from MQTT.
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
 
-        This first checks if the handler can handle this message. If not it
-        immediately returns. If yes, it parses the message payload if not
-        already done so and forwards it to the mapping instances.
+        if index >= len(topic_levels):
+            return False
 
-        """
+        if level not in ("+", topic_levels[index]):
+            return False
 
-        if not self._can_handle_topic(msg.topic):
-            return
+    return len(filter_levels) == len(topic_levels)
 
-        logger.debug(f"Handler {self} handles {msg.topic}")
 
-        # If the data of the message has not yet been parsed, do it now.
-        if msg.data is None:
-            msg.parse(self._parser)
+class MessageHandler:
+    """A message handler describes the messages of a set of topics: the parser for
+    their payload and the type programs processing them. The messages are routed
+    to the handlers by the `TopicRouter`."""
+
+    def __init__(
+        self, topics: list[str], parser: ParserTypeEnum, mappings: list[TypeProgram]
+    ) -> None:
+        self._topics = topics
+        self._parser = parser
+        self._mappings = mappings
 
-        for mapping in self._mappings:
-            mapping.handle_msg_data(msg)
+        # Topic filters and precompiled regular expressions
+        self._filters = [
+            topic for topic in topics if not topic.startswith(REGEX_PREFIX)
+        ]
+        self._patterns = [
+            re.compile(topic[len(REGEX_PREFIX) :])
+            for topic in topics
+            if topic.startswith(REGEX_PREFIX)
+        ]
+
+    @property
+    def filters(self) -> list[str]:
+        """Return the literal topics and MQTT topic filters of this handler"""
+        return self._filters
+
+    @property
+    def patterns(self) -> list[re.Pattern]:
+        """Return the compiled regular expressions of the regex topics"""
+        return self._patterns
+
+    @property
+    def parser(self) -> ParserTypeEnum:
+        """Return the parser for the message payload"""
+        return self._parser
+
+    @property
+    def mappings(self) -> list[TypeProgram]:
+        """Return the type programs processing the messages"""
+        return self._mappings
 
     def __str__(self) -> str:
         return f"MessageHandler([{', '.join(self._topics)}])"
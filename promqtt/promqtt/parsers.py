@@ -0,0 +1,118 @@
+"""Parsers converting MQTT message payloads to data structures.
+
+The parsers are registered per parser type. Parsers for binary formats depend on
+optional packages, they can only be used if these are installed. If the `orjson`
+package is installed, it is used to speed up JSON parsing.
+
+"""
+
+import json
+from typing import Any, Callable
+
+from ..cfgmodel import ParserTypeEnum
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgpack  # type: ignore
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2  # type: ignore
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+# A parser function converts a payload to a data structure
+ParserFunc = Callable[[bytes], Any]
+
+
+class ParserUnavailableException(Exception):
+    """Raised when a parser is requested, which is not available, e.g. because an
+    optional package is not installed."""
+
+
+def parse_json(payload: bytes) -> Any:
+    """Parse a JSON payload"""
+
+    return json.loads(payload)
+
+
+def parse_json_fast(payload: bytes) -> Any:
+    """Parse a JSON payload with orjson. Falls back to the standard library for
+    payloads orjson does not accept, e.g. with NaN values."""
+
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        return json.loads(payload)
+
+
+def parse_raw(payload: bytes) -> str:
+    """Return the payload as string"""
+
+    return payload.decode("utf-8", errors="replace")
+
+
+def parse_number(payload: bytes) -> int | float:
+    """Parse a payload consisting of a single number, e.g. b'21.5'"""
+
+    try:
+        return int(payload)
+    except ValueError:
+        return float(payload)
+
+
+def parse_msgpack(payload: bytes) -> Any:
+    """Parse a MessagePack payload"""
+
+    return msgpack.unpackb(payload)
+
+
+def parse_cbor(payload: bytes) -> Any:
+    """Parse a CBOR payload"""
+
+    return cbor2.loads(payload)
+
+
+_PARSERS: dict[ParserTypeEnum, ParserFunc | None] = {
+    ParserTypeEnum.JSON: parse_json if orjson is None else parse_json_fast,
+    ParserTypeEnum.RAW: parse_raw,
+    ParserTypeEnum.NUMBER: parse_number,
+    ParserTypeEnum.MSGPACK: None if msgpack is None else parse_msgpack,
+    ParserTypeEnum.CBOR: None if cbor2 is None else parse_cbor,
+}
+
+# Packages required by the parsers with optional dependencies
+_REQUIRED_PACKAGES = {
+    ParserTypeEnum.MSGPACK: "msgpack",
+    ParserTypeEnum.CBOR: "cbor2",
+}
+
+
+def register_parser(parser_type: ParserTypeEnum, func: ParserFunc) -> None:
+    """Register a parser function for a parser type, replacing the existing
+    one."""
+
+    _PARSERS[parser_type] = func
+
+
+def get_parser(parser_type: ParserTypeEnum) -> ParserFunc:
+    """Return the parser function for a parser type.
+
+    :raises ParserUnavailableException: If the parser is not available."""
+
+    func = _PARSERS.get(parser_type)
+
+    if func is None:
+        package = _REQUIRED_PACKAGES.get(parser_type)
+        hint = f" Please install the '{package}' package." if package else ""
+
+        raise ParserUnavailableException(
+            f"Parser '{parser_type.value}' is not available.{hint}"
+        )
+
+    return func
@@ -0,0 +1,267 @@
+"""Projection parsing of large JSON payloads.
+
+The value and label expressions of the mappings processing a topic are analyzed
+to find the key paths of the message data they reference. For large payloads,
+only these paths are extracted with a streaming parser. This requires the `ijson`
+package with its C backend.
+
+The parser stops as soon as all paths are found and the objects containing them
+are complete. The rest of the payload must not repeat any top-level key of the
+paths, so none of these keys may occur in it as string and it must not contain
+escape sequences, which could spell a key differently.
+
+Streaming only pays off if the referenced keys appear early in the payload. The
+projection therefore falls back to parsing the complete payload for a topic, if
+the streaming parser had to read a large part of a payload. It also falls back if
+a key of the paths, including the keys of the objects containing them, occurs
+multiple times in its object or may occur again in the rest of the payload, as
+the complete parse keeps the last occurrence.
+
+"""
+
+import json
+import logging
+from typing import Any, Iterator
+
+from ..cfgmodel import ParserTypeEnum
+from .analysis import data_paths, minimize_paths
+from .compiler import TypeProgram
+from .parsers import get_parser
+
+try:
+    import ijson  # type: ignore
+    from ijson.common import ObjectBuilder  # type: ignore
+
+    _BACKEND = ijson.get_backend("yajl2_c")
+except ImportError:  # pragma: no cover
+    _BACKEND = None
+
+logger = logging.getLogger(__name__)
+
+_SCALAR_EVENTS = {"null", "boolean", "integer", "double", "number", "string"}
+_START_EVENTS = {"start_map", "start_array"}
+_END_EVENTS = {"end_map", "end_array"}
+
+
+class Projection:
+    """Extract a set of key paths from JSON payloads.
+
+    The extracted data is a nested dictionary containing only the key paths, so
+    that the expressions referencing them give the same result as for the complete
+    data. If a key of the paths occurs multiple times in an object, the complete
+    payload is parsed instead."""
+
+    # Read buffer size of the streaming parser. Small buffers allow to stop early.
+    BUF_SIZE = 256
+
+    # If the streaming parser reads more than this fraction of a payload, it is
+    # slower than parsing the complete payload.
+    MAX_STREAM_FRACTION = 0.25
+
+    def __init__(self, paths: set[tuple[str, ...]], min_size: int) -> None:
+        self._paths = paths
+        self._prefixes = {".".join(path): path for path in paths}
+
+        # Prefixes of the objects containing the paths, which must be complete
+        # before stopping, and of the paths and these objects, whose keys must not
+        # repeat
+        self._parents = {
+            ".".join(path[:index]) for path in paths for index in range(1, len(path))
+        }
+        self._tracked = self._parents | set(self._prefixes)
+
+        # The top-level keys as they occur in a payload, which must not occur in
+        # the rest of the payload
+        self._keys = {
+            json.dumps(path[0], ensure_ascii=False).encode("utf-8") for path in paths
+        }
+        self._min_size = min_size
+        self._streaming = True
+
+    @property
+    def paths(self) -> set[tuple[str, ...]]:
+        """Return the extracted key paths"""
+        return self._paths
+
+    @property
+    def streaming(self) -> bool:
+        """Return True if the streaming parser is used for large payloads"""
+        return self._streaming
+
+    def parse(self, payload: bytes) -> Any:
+        """Parse a JSON payload. Only the key paths of the projection are
+        extracted from large payloads."""
+
+        if not self._streaming or len(payload) < self._min_size:
+            return get_parser(ParserTypeEnum.JSON)(payload)
+
+        data, consumed = self._extract(payload)
+
+        if data is None:
+            logger.debug("Disabling streaming projection, keys may be duplicated")
+            self._streaming = False
+
+            return get_parser(ParserTypeEnum.JSON)(payload)
+
+        if consumed > self.MAX_STREAM_FRACTION * len(payload):
+            logger.debug(
+                f"Disabling streaming projection, read {consumed} of "
+                f"{len(payload)} bytes"
+            )
+            self._streaming = False
+
+        return data
+
+    def _extract(self, payload: bytes) -> tuple[dict[str, Any] | None, int]:
+        """Extract the key paths from a payload with the streaming parser. Returns
+        the extracted data and the number of bytes read from the payload. The data
+        is None if a key of the paths occurs multiple times or may occur again in
+        the rest of the payload.
+
+        The payload is fed to the parser in chunks, so that all events up to the
+        end of a chunk are known, except for a token continuing in the next
+        chunk."""
+
+        found: dict[str, Any] = {}
+        seen: set[str] = set()
+        closed: set[str] = set()
+
+        # Builder and nesting depth of a container value being extracted
+        builder = None
+        depth = 0
+        current = ""
+
+        for end, events in self._parse_chunks(payload):
+            for prefix, event, value in events:
+                if builder is not None:
+                    builder.event(event, value)
+
+                    if event in _START_EVENTS:
+                        depth += 1
+                    elif event in _END_EVENTS:
+                        depth -= 1
+
+                    if depth == 0:
+                        found[current] = builder.value
+                        builder = None
+                elif event in ("map_key", "end_map"):
+                    if self._track(prefix, event, value, seen, closed):
+                        return None, end
+                elif prefix in self._prefixes:
+                    if event in _START_EVENTS:
+                        builder = ObjectBuilder()
+                        builder.event(event, value)
+                        depth = 1
+                        current = prefix
+                    elif event in _SCALAR_EVENTS:
+                        found[prefix] = value
+
+            if (
+                builder is None
+                and len(found) == len(self._prefixes)
+                and len(closed) == len(self._parents)
+            ):
+                absent = self._keys_absent(payload, end)
+                return (self._build(found) if absent else None), end
+
+        return self._build(found), len(payload)
+
+    def _track(  # pylint: disable=too-many-arguments
+        self, prefix: str, event: str, key: str, seen: set[str], closed: set[str]
+    ) -> bool:
+        """Track the keys of the paths and the completed objects containing them.
+        Returns True if a key of the paths occurs again."""
+
+        if event == "end_map":
+            if prefix in self._parents:
+                closed.add(prefix)
+            return False
+
+        key_prefix = f"{prefix}.{key}" if prefix else key
+
+        if key_prefix not in self._tracked:
+            return False
+
+        if key_prefix in seen:
+            return True
+
+        seen.add(key_prefix)
+        return False
+
+    def _parse_chunks(self, payload: bytes) -> Iterator[tuple[int, list]]:
+        """Feed a payload to the streaming parser in chunks. Returns the end of
+        each chunk and the parser events up to it."""
+
+        events = ijson.sendable_list()
+        parser = _BACKEND.parse_coro(events, use_float=True)
+
+        for start in range(0, len(payload), self.BUF_SIZE):
+            end = min(start + self.BUF_SIZE, len(payload))
+
+            parser.send(payload[start:end])
+            if end == len(payload):
+                parser.close()
+
+            yield end, events
+            del events[:]
+
+    def _keys_absent(self, payload: bytes, end: int) -> bool:
+        """Return True if the payload after the end of a chunk cannot contain any
+        top-level key of the paths"""
+
+        # A key continuing in the next chunk starts at most the length of the
+        # longest key before the end of the chunk
+        start = max(end - max(map(len, self._keys)), 0)
+
+        if payload.find(b"\\", start) != -1:
+            return False
+
+        return all(payload.find(key, start) == -1 for key in self._keys)
+
+    def _build(self, found: dict[str, Any]) -> dict[str, Any]:
+        """Build the nested data structure from the extracted values"""
+
+        data: dict[str, Any] = {}
+
+        for prefix, value in found.items():
+            path = self._prefixes[prefix]
+
+            node = data
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+
+            node[path[-1]] = value
+
+        return data
+
+
+def build_projection(
+    parser: ParserTypeEnum | None, mappings: list[TypeProgram], min_size: int
+) -> Projection | None:
+    """Create a projection for the data referenced by a list of type programs.
+    Returns None if a projection cannot be used, e.g. because an expression needs
+    the complete data or the parser is not a JSON parser."""
+
+    if _BACKEND is None or parser != ParserTypeEnum.JSON or min_size <= 0:
+        return None
+
+    paths: set[tuple[str, ...]] = set()
+
+    for program in mappings:
+        for mapping in program.mappings:
+            for source in [mapping.value_exp, *mapping.label_exps.values()]:
+                exp_paths = data_paths(source)
+                if exp_paths is None:
+                    return None
+
+                paths.update(exp_paths)
+
+    # Keys which cannot be distinguished in the prefixes of the streaming parser
+    for path in paths:
+        if any("." in key or key == "item" for key in path):
+            return None
+
+    if not paths:
+        return None
+
+    return Projection(minimize_paths(paths), min_size)
@@ -1,17 +1,30 @@
 """Client for receiving messages from MQTT and parsing them and publishing them
 for prometheus."""
 
+import hashlib
 import logging
+from typing import Iterable
 
 from ..cfgmodel import MessageConfig, MetricModel, PromqttConfig, TypeConfig
-from ..promexp import PrometheusExporter
-from .mapping import Mapping
+from ..promexp import PrometheusExporter, SeriesLimit
+from ..utils import LruCache
+from .compiler import TypeProgram
+from .mapping import Mapping, MetricUpdate
 from .msg import Message
 from .msghdlr import MessageHandler
+from .parsers import get_parser
+from .router import TopicRouter
+from .subscriptions import derive_subscriptions
 
 logger = logging.getLogger(__name__)
 
 
+def _payload_digest(payload: bytes) -> bytes:
+    """Return a digest identifying a message payload"""
+
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
 class MqttPrometheusBridge:  # pylint: disable=too-few-public-methods
     """Client for receiving messages from MQTT and parsing them and publishing
     them for prometheus."""
@@ -23,13 +36,39 @@ class MqttPrometheusBridge:  # pylint: disable=too-few-public-methods
         self._prom_exp = prom_exp
         self._cfg = cfg
 
+        # Digest of the last payload and the resulting metric updates per topic
+        self._payload_cache: LruCache[str, tuple[bytes, list[MetricUpdate]]] = LruCache(
+            cfg.ingest.payload_cache_size
+        )
+
         self._register_measurements(cfg.metrics)
         self._load_types(cfg.types)
         self._load_msg_handlers(cfg.messages)
 
+    @property
+    def prom_exp(self) -> PrometheusExporter:
+        """Return the prometheus exporter receiving the metric updates"""
+        return self._prom_exp
+
+    @property
+    def subscriptions(self) -> list[str]:
+        """Return the minimal list of topic filters to subscribe to for receiving
+        all messages handled by the bridge."""
+
+        return derive_subscriptions(self._cfg.messages)
+
     def _register_measurements(self, metric_cfg: dict[str, MetricModel]) -> None:
         """Register measurements for Prometheus."""
 
+        exporter_cfg = self._cfg.exporter
+
+        # The total limit is shared by all configured metrics
+        total_limit = (
+            SeriesLimit(exporter_cfg.max_total_series)
+            if exporter_cfg.max_total_series
+            else None
+        )
+
         for name, meas in metric_cfg.items():
             logger.debug(f"Registering measurement '{name}'")
 
@@ -39,21 +78,34 @@ class MqttPrometheusBridge:  # pylint: disable=too-few-public-methods
                 helpstr=meas.help,
                 timeout=meas.timeout,
                 with_update_counter=meas.with_update_counter,
+                max_series=(
+                    exporter_cfg.max_series
+                    if meas.max_series is None
+                    else meas.max_series
+                ),
+                series_policy=meas.series_policy or exporter_cfg.series_policy,
+                buckets=meas.buckets,
+                quantiles=meas.quantiles,
+                aggregation=meas.aggregation,
+                window=meas.window,
+                window_type=meas.window_type,
+                total_limit=total_limit,
             )
 
     def _load_types(self, types_cfg: dict[str, dict[str, TypeConfig]]) -> None:
-        """Load the device types from configuration."""
+        """Load the device types from configuration.
 
-        self._types: dict[str, list[Mapping]] = {}
+        The mappings of each type are compiled into a single type program."""
+
+        self._types: dict[str, TypeProgram] = {}
 
         # loop over types
         for type_name, type_cfg in types_cfg.items():
             logger.debug(f"Instanciating type '{type_name}'")
 
             # create list of mappings for each type
-            self._types[type_name] = [
+            mappings = [
                 Mapping(
-                    promexp=self._prom_exp,
                     type_name=type_name,
                     metric=metric,
                     value_exp=mapping_cfg.value,
@@ -62,6 +114,12 @@ class MqttPrometheusBridge:  # pylint: disable=too-few-public-methods
                 for metric, mapping_cfg in type_cfg.items()
             ]
 
+            self._types[type_name] = TypeProgram(
+                type_name=type_name,
+                mappings=mappings,
+                label_cache_size=self._cfg.ingest.label_cache_size,
+            )
+
     def _load_msg_handlers(self, msg_cfg: list[MessageConfig]) -> None:
         """Load the message handlers from configuration.
 
@@ -75,12 +133,13 @@ class MqttPrometheusBridge:  # pylint: disable=too-few-public-methods
         for handler_cfg in msg_cfg:
             # resolve the type handlers for each message
             type_names = handler_cfg.types
-            mappings = []
-            for type_name in type_names:
-                mappings.extend(self._types[type_name])
+            mappings = [self._types[type_name] for type_name in type_names]
 
             topics = handler_cfg.topics
 
+            # Fail early if the parser is not available
+            get_parser(handler_cfg.parser)
+
             self._handlers.append(
                 MessageHandler(
                     topics=topics, parser=handler_cfg.parser, mappings=mappings
@@ -92,13 +151,68 @@ class MqttPrometheusBridge:  # pylint: disable=too-few-public-methods
                 f"({', '.join(type_names)})"
             )
 
+        self._router = TopicRouter(
+            self._handlers,
+            cache_size=self._cfg.ingest.route_cache_size,
+            projection_min_size=self._cfg.ingest.projection_min_size,
+        )
+
     def handle_mqtt_message(self, msg: Message) -> None:
         """Callback function called by the MQTT client to handle incoming MQTT
         messages."""
 
-        try:
-            for msg_handler in self._handlers:
-                msg_handler.handle(msg)
+        self.handle_mqtt_messages([msg])
+
+    def handle_mqtt_messages(self, batch: Iterable[Message]) -> None:
+        """Handle a batch of messages received from MQTT.
+
+        Each message is routed to the matching handlers and its payload is parsed
+        at most once. The resulting metric updates are handed over to the
+        prometheus exporter in the order of the messages in the batch. An update
+        which cannot be applied, e.g. because of an invalid label value, does not
+        affect the other updates. If a topic receives the same payload as before,
+        the cached updates of the previous payload are used.
+
+        """
+
+        use_cache = self._payload_cache.maxsize > 0
+
+        for msg in batch:
+            if use_cache:
+                digest = _payload_digest(msg.payload)
+
+                # A repeated payload results in the same updates. Applying them
+                # again refreshes the timestamps and update counters.
+                cached = self._payload_cache.get(msg.topic)
+                if cached is not None and cached[0] == digest:
+                    self._apply_updates(msg, cached[1])
+                    continue
+
+            dispatch = self._router.route(msg.topic)
+            if not dispatch:
+                continue
+
+            try:
+                msg_updates = dispatch.evaluate(msg)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Failed to handle MQTT message {msg}")
+                continue
+
+            # Only updates which can be applied are reused for repeated payloads
+            if self._apply_updates(msg, msg_updates) and use_cache:
+                self._payload_cache.put(msg.topic, (digest, msg_updates))
+
+    def _apply_updates(self, msg: Message, updates: list[MetricUpdate]) -> bool:
+        """Hand over the metric updates of a message to the prometheus exporter.
+        Returns True if all updates were applied."""
+
+        applied = True
+
+        for metric, labels, value in updates:
+            try:
+                self._prom_exp.set(name=metric, labels=labels, value=value)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Failed to set metric '{metric}' for message {msg}")
+                applied = False
 
-        except Exception:  # pylint: disable=broad-except
-            logger.exception("Failed to handle MQTT message")
+        return applied
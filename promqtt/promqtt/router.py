@@ -0,0 +1,221 @@
+"""Routing of received messages to the message handlers.
+
+Literal topics and MQTT topic filters of all handlers are stored in a trie, so the
+matching handlers of a topic are found by walking the topic levels once. Regex
+topics are precompiled and checked after the trie. Their named groups are
+collected and attached to the messages of the topic. The result for a topic is
+cached, so for most messages routing is a single cache lookup.
+
+"""
+
+import logging
+
+from ..cfgmodel import ParserTypeEnum
+from ..utils import LruCache
+from .compiler import TypeProgram
+from .mapping import MetricUpdate
+from .msg import Message
+from .msghdlr import MessageHandler
+from .projection import Projection, build_projection
+
+logger = logging.getLogger(__name__)
+
+
+class _TrieNode:  # pylint: disable=too-few-public-methods
+    """Node of the topic filter trie, representing one topic level"""
+
+    def __init__(self) -> None:
+        # child nodes by topic level, including the '+' wildcard
+        self.children: dict[str, "_TrieNode"] = {}
+
+        # indices of the handlers with a filter ending at this node
+        self.handlers: list[int] = []
+
+        # indices of the handlers with a filter ending with '#' at this node
+        self.wildcard_handlers: list[int] = []
+
+
+class Dispatch:
+    """The result of routing a topic: the handlers which handle the topic and the
+    deduplicated list of type programs to evaluate for its messages."""
+
+    def __init__(
+        self,
+        handlers: list[MessageHandler],
+        groups: dict[str, str] | None = None,
+        projection_min_size: int = 0,
+    ) -> None:
+        self._handlers = handlers
+        self._groups = groups or {}
+
+        # The first matching handler determines the parser
+        self._parser = handlers[0].parser if handlers else None
+
+        # Each type program is evaluated only once, even if multiple matching
+        # handlers refer to it.
+        self._mappings: list[TypeProgram] = []
+        for handler in handlers:
+            for mapping in handler.mappings:
+                if mapping not in self._mappings:
+                    self._mappings.append(mapping)
+
+        self._projection = build_projection(
+            self._parser, self._mappings, projection_min_size
+        )
+
+    @property
+    def handlers(self) -> list[MessageHandler]:
+        """Return the matching handlers"""
+        return self._handlers
+
+    @property
+    def groups(self) -> dict[str, str]:
+        """Return the named groups of the regex topics matching the topic"""
+        return self._groups
+
+    @property
+    def parser(self) -> ParserTypeEnum | None:
+        """Return the parser to use for the message payload"""
+        return self._parser
+
+    @property
+    def mappings(self) -> list[TypeProgram]:
+        """Return the deduplicated type programs of all matching handlers"""
+        return self._mappings
+
+    @property
+    def projection(self) -> Projection | None:
+        """Return the projection used to parse large payloads"""
+        return self._projection
+
+    def __bool__(self) -> bool:
+        return bool(self._mappings)
+
+    def evaluate(self, msg: Message) -> list[MetricUpdate]:
+        """Attach the named regex groups to the message, parse the message payload
+        if not already done so and evaluate the type programs for the message.
+        Returns the resulting metric updates."""
+
+        msg.groups = self._groups
+
+        if msg.data is None and self._parser is not None:
+            msg.parse(self._parser, self._projection)
+
+        updates: list[MetricUpdate] = []
+        for mapping in self._mappings:
+            updates.extend(mapping.evaluate(msg))
+
+        return updates
+
+
+class TopicRouter:  # pylint: disable=too-few-public-methods
+    """Find the message handlers for a topic"""
+
+    def __init__(
+        self,
+        handlers: list[MessageHandler],
+        cache_size: int = 4096,
+        projection_min_size: int = 0,
+    ) -> None:
+        self._handlers = handlers
+        self._projection_min_size = projection_min_size
+        self._root = _TrieNode()
+        self._patterns = [
+            (pattern, index)
+            for index, handler in enumerate(handlers)
+            for pattern in handler.patterns
+        ]
+        self._cache: LruCache[str, Dispatch] = LruCache(cache_size)
+
+        for index, handler in enumerate(handlers):
+            for topic_filter in handler.filters:
+                self._insert(topic_filter, index)
+
+    def _insert(self, topic_filter: str, index: int) -> None:
+        """Insert a topic filter of a handler into the trie"""
+
+        node = self._root
+
+        for level in topic_filter.split("/"):
+            if level == "#":
+                node.wildcard_handlers.append(index)
+                return
+
+            node = node.children.setdefault(level, _TrieNode())
+
+        node.handlers.append(index)
+
+    def _match_trie(self, topic: str) -> set[int]:
+        """Return the indices of the handlers with a filter matching the topic"""
+
+        levels = topic.split("/")
+        matches: set[int] = set()
+
+        # Wildcards do not match topics starting with '$', see MQTT spec 4.7.2
+        dollar = topic.startswith("$")
+
+        nodes = [self._root]
+        for depth, level in enumerate(levels):
+            next_nodes = []
+
+            for node in nodes:
+                # '#' also matches the parent level, e.g. 'a/#' matches 'a'
+                if not (dollar and depth == 0):
+                    matches.update(node.wildcard_handlers)
+
+                child = node.children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+
+                child = node.children.get("+")
+                if child is not None and not (dollar and depth == 0):
+                    next_nodes.append(child)
+
+            nodes = next_nodes
+
+        for node in nodes:
+            matches.update(node.handlers)
+            matches.update(node.wildcard_handlers)
+
+        return matches
+
+    def _route(self, topic: str) -> Dispatch:
+        """Find the matching handlers for a topic without using the cache"""
+
+        matches = self._match_trie(topic)
+        groups: dict[str, str] = {}
+
+        for pattern, index in self._patterns:
+            match = pattern.match(topic)
+            if match is None:
+                continue
+
+            matches.add(index)
+
+            # Named groups of earlier regex topics take precedence. Groups which
+            # did not participate in the match are ignored.
+            for name, value in match.groupdict().items():
+                if value is not None:
+                    groups.setdefault(name, value)
+
+        return Dispatch(
+            [self._handlers[index] for index in sorted(matches)],
+            groups,
+            self._projection_min_size,
+        )
+
+    def route(self, topic: str) -> Dispatch:
+        """Return the dispatch information for a topic"""
+
+        dispatch = self._cache.get(topic)
+
+        if dispatch is None:
+            dispatch = self._route(topic)
+            self._cache.put(topic, dispatch)
+
+            logger.debug(
+                f"Routing {topic} to handlers "
+                f"[{', '.join(str(handler) for handler in dispatch.handlers)}]"
+            )
+
+        return dispatch
@@ -0,0 +1,205 @@
+"""Derive MQTT subscriptions from the message configuration.
+
+Instead of subscribing to all topics, promqtt can subscribe to the topic filters
+needed by the configured messages. Literal topics and topic filters are used as
+they are. Regex topics are converted to a topic filter which matches at least all
+topics matched by the regex: topic levels which are literal in the regex are kept,
+all others are replaced by the '+' wildcard. If a part of the regex could match
+across topic levels, the filter ends with '#'. Regex topics are matched with
+`re.match`, i.e. they can also match longer topics unless they end with '$'.
+
+"""
+
+import re
+from re import _parser as sre_parse  # type: ignore # pylint: disable=protected-access
+
+# The regex parser constants are created dynamically
+# pylint: disable=no-member
+from typing import Any
+
+from ..cfgmodel import MessageConfig
+from .msghdlr import REGEX_PREFIX
+
+_SLASH = ord("/")
+
+# Character categories which do not contain the '/' character
+_SLASH_FREE_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT,
+    sre_parse.CATEGORY_SPACE,
+    sre_parse.CATEGORY_WORD,
+}
+
+# Operators which do not consume any characters
+_ZERO_WIDTH_OPS = {sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT}
+
+_REPEAT_OPS = {
+    sre_parse.MAX_REPEAT,
+    sre_parse.MIN_REPEAT,
+    sre_parse.POSSESSIVE_REPEAT,
+}
+
+_END_ANCHORS = {sre_parse.AT_END, sre_parse.AT_END_STRING}
+
+
+def _set_contains_slash(items: list[tuple[Any, Any]]) -> bool:
+    """Check if the items of a character set ('[...]') contain '/'"""
+
+    for op, arg in items:
+        if op == sre_parse.LITERAL and arg == _SLASH:
+            return True
+        if op == sre_parse.RANGE and arg[0] <= _SLASH <= arg[1]:
+            return True
+        if op == sre_parse.CATEGORY and arg not in _SLASH_FREE_CATEGORIES:
+            return True
+
+    return False
+
+
+def _may_match_slash(op: Any, arg: Any) -> bool:
+    """Check if a parsed regex element can match the '/' character. Unknown
+    elements are assumed to match it."""
+
+    # pylint: disable=too-many-return-statements
+
+    if op == sre_parse.LITERAL:
+        return arg == _SLASH
+
+    if op == sre_parse.NOT_LITERAL:
+        return arg != _SLASH
+
+    if op == sre_parse.IN:
+        if arg and arg[0][0] == sre_parse.NEGATE:
+            return not _set_contains_slash(arg[1:])
+        return _set_contains_slash(arg)
+
+    if op in _ZERO_WIDTH_OPS:
+        return False
+
+    if op == sre_parse.BRANCH:
+        return any(
+            _may_match_slash(sub_op, sub_arg)
+            for branch in arg[1]
+            for sub_op, sub_arg in branch
+        )
+
+    if op == sre_parse.SUBPATTERN:
+        return any(_may_match_slash(sub_op, sub_arg) for sub_op, sub_arg in arg[3])
+
+    if op in _REPEAT_OPS:
+        return any(_may_match_slash(sub_op, sub_arg) for sub_op, sub_arg in arg[2])
+
+    return True
+
+
+def _filter_level(chars: list[str], wildcard: bool) -> str:
+    """Return the filter level for the literal characters of a topic level"""
+
+    level = "".join(chars)
+
+    # MQTT wildcard characters cannot be used literally in a filter
+    if wildcard or "+" in level or "#" in level:
+        return "+"
+
+    return level
+
+
+def regex_to_filter(regex: str) -> str:
+    """Convert a topic regex to a MQTT topic filter matching at least all topics
+    matched by the regex."""
+
+    parsed = sre_parse.parse(regex)
+
+    # With case insensitive matching, literals cannot be used in the filter
+    if parsed.state.flags & re.IGNORECASE:
+        return "#"
+
+    levels: list[str] = []
+    level: list[str] = []
+    wildcard = False
+    anchored = False
+
+    for op, arg in parsed:
+        if op == sre_parse.AT and arg in _END_ANCHORS:
+            anchored = True
+            break
+
+        if op == sre_parse.LITERAL and arg == _SLASH:
+            levels.append(_filter_level(level, wildcard))
+            level = []
+            wildcard = False
+        elif op == sre_parse.LITERAL:
+            level.append(chr(arg))
+        elif op in _ZERO_WIDTH_OPS:
+            continue
+        elif _may_match_slash(op, arg):
+            return "/".join(levels + ["#"])
+        else:
+            wildcard = True
+
+    if anchored:
+        levels.append(_filter_level(level, wildcard))
+    else:
+        # The regex can match longer topics, i.e. the current level can have more
+        # characters and more levels can follow.
+        if wildcard or level:
+            levels.append("+")
+        levels.append("#")
+
+    return "/".join(levels)
+
+
+def topic_to_filter(topic: str) -> str:
+    """Convert a topic of the message configuration to a MQTT topic filter"""
+
+    if topic.startswith(REGEX_PREFIX):
+        return regex_to_filter(topic[len(REGEX_PREFIX) :])
+
+    return topic
+
+
+def filter_covers(covering: str, covered: str) -> bool:
+    """Check if a topic filter matches all topics matched by another filter"""
+
+    levels = covering.split("/")
+    covered_levels = covered.split("/")
+
+    for index, level in enumerate(levels):
+        if level == "#":
+            return not (index == 0 and covered_levels[0].startswith("$"))
+
+        if index >= len(covered_levels) or covered_levels[index] == "#":
+            return False
+
+        if level == "+":
+            if index == 0 and covered_levels[0].startswith("$"):
+                return False
+            continue
+
+        if level != covered_levels[index]:
+            return False
+
+    return len(levels) == len(covered_levels)
+
+
+def minimize_filters(filters: list[str]) -> list[str]:
+    """Remove duplicate filters and filters covered by other filters"""
+
+    unique = list(dict.fromkeys(filters))
+
+    return [
+        topic_filter
+        for topic_filter in unique
+        if not any(
+            other != topic_filter and filter_covers(other, topic_filter)
+            for other in unique
+        )
+    ]
+
+
+def derive_subscriptions(msg_cfgs: list[MessageConfig]) -> list[str]:
+    """Compute the minimal list of topic filters to subscribe to for receiving all
+    messages handled by the message configuration."""
+
+    return minimize_filters(
+        [topic_to_filter(topic) for msg_cfg in msg_cfgs for topic in msg_cfg.topics]
+    )
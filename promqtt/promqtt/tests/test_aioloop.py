@@ -0,0 +1,145 @@
+"""Integration tests of the asyncio runtime"""
+
+import asyncio
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from ...cfgmodel import IngestModel, PromqttConfig
+from ...promexp import PrometheusExporter
+from ...test.broker import FakeBroker
+from ..ingest import AsyncIngestQueue
+from ..mqttclt import MqttClient
+from ..msg import Message
+from ..promqtt import MqttPrometheusBridge
+
+
+def _config(broker: FakeBroker) -> PromqttConfig:
+    """Create a configuration for the broker"""
+
+    return PromqttConfig.parse_obj(
+        {
+            "mqtt": {"broker": broker.host, "port": broker.port},
+            "http": {},
+            "metrics": {"energy": {"type": "counter", "with_update_counter": True}},
+            "types": {
+                "meter": {
+                    "energy": {
+                        "value": "data['Total']",
+                        "labels": {"node": "groups['node']"},
+                    }
+                }
+            },
+            "messages": [
+                {"topics": ["re:tele/(?P<node>[^/]+)/SENSOR$"], "types": ["meter"]}
+            ],
+        }
+    )
+
+
+def test_aioloop_receive() -> None:
+    """Messages are received and processed on the event loop"""
+
+    promexp = PrometheusExporter()
+
+    async def run(broker: FakeBroker) -> None:
+        cfg = _config(broker)
+        bridge = MqttPrometheusBridge(promexp, cfg)
+        ingest = AsyncIngestQueue(
+            promexp, cfg.ingest, bridge.handle_mqtt_messages, asyncio.get_running_loop()
+        )
+        client = MqttClient(promexp, cfg.mqtt, bridge, ingest)
+
+        task = asyncio.create_task(client.loop_asyncio())
+
+        # Wait for the subscription of the client
+        while "promqtt_mqtt_conn_state{" not in promexp.render():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+
+        publisher = mqtt.Client()
+        publisher.connect(broker.host, broker.port)
+        publisher.loop_start()
+        for index in range(10):
+            publisher.publish(f"tele/dev{index % 2}/SENSOR", f'{{"Total": {index}}}')
+
+        for _ in range(500):
+            if 'energy{node="dev1"} 9' in promexp.render():
+                break
+            await asyncio.sleep(0.01)
+
+        publisher.loop_stop()
+        publisher.disconnect()
+        task.cancel()
+
+    with FakeBroker() as broker:
+        asyncio.run(run(broker))
+
+    lines = promexp.render().split("\n")
+    assert 'energy{node="dev0"} 8' in lines
+    assert 'energy_updates{node="dev1"} 5' in lines
+
+
+def test_aioloop_ingest_queue() -> None:
+    """The queued messages are processed in batches on the event loop"""
+
+    batches: list[list[Message]] = []
+
+    async def run() -> None:
+        queue = AsyncIngestQueue(
+            PrometheusExporter(),
+            IngestModel.parse_obj(
+                {"batch_size": 2, "queue_size": 3, "overflow": "drop_newest"}
+            ),
+            batches.append,
+            asyncio.get_running_loop(),
+        )
+
+        for index in range(5):
+            queue.put(Message("test", str(index).encode()))
+
+        assert queue.dropped == 2
+
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert [[msg.payload for msg in batch] for batch in batches] == [
+        [b"0", b"1"],
+        [b"2"],
+    ]
+
+
+def test_aioloop_connect_not_blocking(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The event loop keeps running while connecting to the broker"""
+
+    connect = mqtt.Client.reconnect
+
+    def slow_connect(client: mqtt.Client) -> int:
+        time.sleep(0.3)
+        return connect(client)
+
+    monkeypatch.setattr(mqtt.Client, "reconnect", slow_connect)
+
+    promexp = PrometheusExporter()
+    ticks = 0
+
+    async def run(broker: FakeBroker) -> None:
+        nonlocal ticks
+
+        cfg = _config(broker)
+        client = MqttClient(promexp, cfg.mqtt, MqttPrometheusBridge(promexp, cfg))
+        task = asyncio.create_task(client.loop_asyncio())
+
+        while "promqtt_mqtt_conn_state{" not in promexp.render():
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+
+    with FakeBroker() as broker:
+        asyncio.run(run(broker))
+
+    assert ticks >= 10
@@ -0,0 +1,87 @@
+"""Unit tests of the static expression analysis"""
+
+import pytest
+
+from ..analysis import data_paths, is_topic_expression, minimize_paths
+
+
+@pytest.mark.parametrize(
+    "source",
+    (
+        "tlist[1]",
+        "'aqara'",
+        "msg.topic",
+        "msg.topic_list[-1]",
+        "groups['device']",
+        "msg.groups['device'].lower()",
+        "str(len(tlist))",
+        "tlist[1].split('_')[0]",
+        "'/'.join(tlist[:2])",
+    ),
+)
+def test_analysis_topic_expression(source: str) -> None:
+    """Expressions depending only on the topic are detected"""
+
+    assert is_topic_expression(source)
+
+
+@pytest.mark.parametrize(
+    "source",
+    (
+        "data['node']",
+        "msg.payload",
+        "msg",
+        "tlist[data['index']]",
+        "__import__('time').time()",
+        "[x for x in tlist]",
+        "tlist[1",
+    ),
+)
+def test_analysis_not_topic_expression(source: str) -> None:
+    """Expressions depending on anything but the topic are not detected"""
+
+    assert not is_topic_expression(source)
+
+
+@pytest.mark.parametrize(
+    "source,paths",
+    (
+        ("data['ENERGY']['Power'] * 2", {("ENERGY", "Power")}),
+        ("data['a'][0]['b']", {("a",)}),
+        ("data['a'] + data['b']['c'] + len(tlist)", {("a",), ("b", "c")}),
+        ("msg.groups['device']", set()),
+        ("'aqara'", set()),
+    ),
+)
+def test_analysis_data_paths(source: str, paths: set) -> None:
+    """The key paths of the referenced data are found"""
+
+    assert data_paths(source) == paths
+
+
+@pytest.mark.parametrize(
+    "source",
+    (
+        "data",
+        "len(data)",
+        "data[tlist[1]]",
+        "data.get('a')",
+        "msg.data['a']",
+        "msg.payload",
+        "data['a",
+    ),
+)
+def test_analysis_data_paths_complete(source: str) -> None:
+    """Expressions which need the complete data are detected"""
+
+    assert data_paths(source) is None
+
+
+def test_analysis_minimize_paths() -> None:
+    """Paths covered by a shorter path are removed"""
+
+    assert minimize_paths({("a",), ("a", "b"), ("c", "d"), ("c", "e")}) == {
+        ("a",),
+        ("c", "d"),
+        ("c", "e"),
+    }
@@ -0,0 +1,322 @@
+"""Unit tests of the MQTT to Prometheus bridge"""
+
+from typing import Any
+
+import pytest
+
+from ...cfgmodel import (
+    AggregationEnum,
+    MetricTypeEnum,
+    PromqttConfig,
+    SeriesLimitPolicyEnum,
+)
+from ...promexp import PrometheusExporter
+from ..msg import Message
+from ..promqtt import MqttPrometheusBridge
+
+
+def _config(**kwargs: Any) -> PromqttConfig:
+    """Create a bridge configuration with a power meter type"""
+
+    data: dict[str, Any] = {
+        "mqtt": {"broker": "localhost"},
+        "http": {},
+        "metrics": {
+            "power": {"type": "gauge", "with_update_counter": True},
+            "voltage": {"type": "gauge"},
+        },
+        "types": {
+            "meter": {
+                "power": {
+                    "value": "data['ENERGY']['Power']",
+                    "labels": {"node": "tlist[1]"},
+                },
+                "voltage": {
+                    "value": "data['ENERGY']['Voltage']",
+                    "labels": {"node": "tlist[1]"},
+                },
+            },
+        },
+        "messages": [
+            {"topics": ["re:tele/[^/]+/SENSOR$"], "types": ["meter"]},
+        ],
+    }
+    data.update(kwargs)
+
+    return PromqttConfig.parse_obj(data)
+
+
+def _lines(promexp: PrometheusExporter) -> set[str]:
+    """Return the rendered metric instance lines of the exporter"""
+
+    return {line for line in promexp.render().split("\n") if not line.startswith("#")}
+
+
+def _messages() -> list[Message]:
+    """Create a list of test messages"""
+
+    return [
+        Message("tele/dev1/SENSOR", b'{"ENERGY": {"Power": 1, "Voltage": 230}}'),
+        Message("tele/dev2/SENSOR", b'{"ENERGY": {"Power": 2}}'),
+        Message("tele/dev1/STATE", b'{"ENERGY": {"Power": 9}}'),
+        Message("tele/dev3/SENSOR", b"no json"),
+        Message("tele/dev1/SENSOR", b'{"ENERGY": {"Power": 3, "Voltage": 231}}'),
+    ]
+
+
+@pytest.fixture(name="bridge")
+def bridge_fixture() -> MqttPrometheusBridge:
+    """Create a bridge with a new prometheus exporter"""
+
+    return MqttPrometheusBridge(PrometheusExporter(), cfg=_config())
+
+
+def test_bridge_handle_message(bridge: MqttPrometheusBridge) -> None:
+    """A single message is mapped to the metrics"""
+
+    bridge.handle_mqtt_message(_messages()[0])
+
+    assert _lines(bridge.prom_exp) == {
+        'power{node="dev1"} 1',
+        'power_updates{node="dev1"} 1',
+        'voltage{node="dev1"} 230',
+    }
+
+
+def test_bridge_batch_equals_single() -> None:
+    """Handling a batch gives the same result as handling the messages one by
+    one."""
+
+    single = MqttPrometheusBridge(PrometheusExporter(), cfg=_config())
+    for msg in _messages():
+        single.handle_mqtt_message(msg)
+
+    batch = MqttPrometheusBridge(PrometheusExporter(), cfg=_config())
+    batch.handle_mqtt_messages(_messages())
+
+    assert _lines(batch.prom_exp) == _lines(single.prom_exp)
+    assert 'power{node="dev1"} 3' in _lines(batch.prom_exp)
+    assert 'power_updates{node="dev1"} 2' in _lines(batch.prom_exp)
+
+
+def test_bridge_group_labels() -> None:
+    """Named groups of the topic regex can be used as labels"""
+
+    cfg = _config(
+        types={
+            "meter": {
+                "power": {
+                    "value": "data['ENERGY']['Power']",
+                    "labels": {"node": "groups['device']"},
+                },
+            },
+        },
+        messages=[
+            {"topics": ["re:tele/(?P<device>[^/]+)/SENSOR$"], "types": ["meter"]},
+        ],
+    )
+    bridge = MqttPrometheusBridge(PrometheusExporter(), cfg=cfg)
+
+    bridge.handle_mqtt_messages(_messages())
+
+    assert 'power{node="dev1"} 3' in _lines(bridge.prom_exp)
+    assert 'power{node="dev2"} 2' in _lines(bridge.prom_exp)
+
+
+@pytest.mark.parametrize("cache_size", (0, 4096))
+def test_bridge_repeated_payload(cache_size: int) -> None:
+    """A repeated payload updates the metrics like a new one, with and without
+    the payload cache."""
+
+    cfg = _config(ingest={"payload_cache_size": cache_size})
+    bridge = MqttPrometheusBridge(PrometheusExporter(), cfg=cfg)
+
+    payload = b'{"ENERGY": {"Power": 1, "Voltage": 230}}'
+    bridge.handle_mqtt_messages([Message("tele/dev1/SENSOR", payload)] * 3)
+    bridge.handle_mqtt_message(Message("tele/dev1/SENSOR", payload))
+
+    assert _lines(bridge.prom_exp) == {
+        'power{node="dev1"} 1',
+        'power_updates{node="dev1"} 4',
+        'voltage{node="dev1"} 230',
+    }
+
+    bridge.handle_mqtt_message(
+        Message("tele/dev1/SENSOR", b'{"ENERGY": {"Power": 2, "Voltage": 230}}')
+    )
+
+    assert 'power{node="dev1"} 2' in _lines(bridge.prom_exp)
+    assert 'power_updates{node="dev1"} 5' in _lines(bridge.prom_exp)
+
+
+def test_bridge_repeated_payload_skips_parsing(
+    bridge: MqttPrometheusBridge, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A repeated payload is not parsed again"""
+
+    msg = _messages()[0]
+    bridge.handle_mqtt_message(msg)
+
+    def fail(*args: Any) -> None:
+        raise AssertionError("Payload parsed again")
+
+    monkeypatch.setattr(Message, "parse", fail)
+
+    bridge.handle_mqtt_message(Message(msg.topic, msg.payload))
+
+    assert 'power_updates{node="dev1"} 2' in _lines(bridge.prom_exp)
+
+
+def test_bridge_failed_update_isolated(monkeypatch: pytest.MonkeyPatch) -> None:
+    """An update which cannot be applied does not affect the other updates of the
+    batch and is not reused for repeated payloads"""
+
+    cfg = _config()
+    cfg.metrics["voltage"].type = MetricTypeEnum.HISTOGRAM
+    bridge = MqttPrometheusBridge(PrometheusExporter(), cfg=cfg)
+
+    # A string cannot be observed by the histogram
+    bad = Message("tele/dev2/SENSOR", b'{"ENERGY": {"Power": 2, "Voltage": "x"}}')
+
+    bridge.handle_mqtt_messages(
+        [
+            Message("tele/dev1/SENSOR", b'{"ENERGY": {"Power": 1}}'),
+            bad,
+            Message("tele/dev3/SENSOR", b'{"ENERGY": {"Power": 3}}'),
+        ]
+    )
+
+    lines = _lines(bridge.prom_exp)
+
+    assert {'power{node="dev1"} 1', 'power{node="dev2"} 2'} <= lines
+    assert 'power{node="dev3"} 3' in lines
+
+    parsed = []
+    parse = Message.parse
+
+    def count(msg: Message, *args: Any) -> None:
+        parsed.append(msg.topic)
+        parse(msg, *args)
+
+    monkeypatch.setattr(Message, "parse", count)
+
+    bridge.handle_mqtt_message(Message(bad.topic, bad.payload))
+
+    assert parsed == [bad.topic]
+
+
+def test_bridge_series_limit() -> None:
+    """The exporter limits apply to all metrics without own limit"""
+
+    cfg = _config(exporter={"max_series": 1, "series_policy": "evict_lru"})
+    cfg.metrics["voltage"].max_series = 2
+    cfg.metrics["voltage"].series_policy = SeriesLimitPolicyEnum.REJECT
+
+    bridge = MqttPrometheusBridge(PrometheusExporter(), cfg=cfg)
+
+    for node in ("dev1", "dev2", "dev3"):
+        bridge.handle_mqtt_message(
+            Message(f"tele/{node}/SENSOR", b'{"ENERGY": {"Power": 1, "Voltage": 230}}')
+        )
+
+    lines = _lines(bridge.prom_exp)
+
+    assert {line for line in lines if line.startswith("power")} == {
+        'power{node="dev3"} 1',
+        'power_updates{node="dev3"} 1',
+    }
+    assert 'voltage{node="dev3"} 230' not in lines
+    assert 'promqtt_series_evicted{metric="power"} 2' in lines
+    assert 'promqtt_series_rejected{metric="voltage"} 1' in lines
+
+
+def test_bridge_total_series_limit() -> None:
+    """The total limit applies to all configured metrics, metrics can opt out of
+    the default limit"""
+
+    cfg = _config(exporter={"max_series": 1, "max_total_series": 4})
+    cfg.metrics["voltage"].max_series = 0
+
+    bridge = MqttPrometheusBridge(PrometheusExporter(), cfg=cfg)
+
+    for node in ("dev1", "dev2", "dev3"):
+        bridge.handle_mqtt_message(
+            Message(f"tele/{node}/SENSOR", b'{"ENERGY": {"Power": 1, "Voltage": 230}}')
+        )
+
+    lines = _lines(bridge.prom_exp)
+
+    assert {line for line in lines if line.startswith(("power", "voltage"))} == {
+        'power{node="dev1"} 1',
+        'power_updates{node="dev1"} 1',
+        'voltage{node="dev1"} 230',
+        'voltage{node="dev2"} 230',
+    }
+    assert 'promqtt_series_rejected{metric="voltage"} 1' in lines
+
+
+def test_bridge_histogram() -> None:
+    """The values of a histogram metric are observed in the configured buckets"""
+
+    cfg = _config()
+    cfg.metrics["voltage"].type = MetricTypeEnum.HISTOGRAM
+    cfg.metrics["voltage"].buckets = [230]
+
+    bridge = MqttPrometheusBridge(PrometheusExporter(), cfg=cfg)
+    bridge.handle_mqtt_messages(_messages())
+
+    lines = _lines(bridge.prom_exp)
+
+    assert 'voltage_bucket{node="dev1",le="230.0"} 1' in lines
+    assert 'voltage_bucket{node="dev1",le="+Inf"} 2' in lines
+    assert 'voltage_count{node="dev1"} 2' in lines
+
+
+@pytest.mark.parametrize(
+    "metric",
+    [
+        {"type": "histogram", "buckets": [1, 1]},
+        {"type": "histogram", "buckets": []},
+        {"type": "summary", "quantiles": [0.5, 1.5]},
+    ],
+)
+def test_config_invalid_distribution(metric: dict[str, Any]) -> None:
+    """Buckets and quantiles must be increasing, quantiles within [0, 1]"""
+
+    with pytest.raises(ValueError):
+        _config(metrics={"power": metric, "voltage": {"type": "gauge"}})
+
+
+def test_bridge_aggregation(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The values of an aggregated metric are aggregated per instance"""
+
+    now = 3600.0
+    monkeypatch.setattr("promqtt.promexp.metric_inst.get_current_time", lambda: now)
+
+    cfg = _config()
+    cfg.metrics["power"].aggregation = AggregationEnum.SUM
+    cfg.metrics["power"].window = 3600
+
+    bridge = MqttPrometheusBridge(PrometheusExporter(), cfg=cfg)
+    bridge.handle_mqtt_messages(_messages())
+
+    # The sums are exported once the window is completed
+    now += 3600
+    lines = _lines(bridge.prom_exp)
+
+    assert 'power{node="dev1"} 4.0' in lines
+    assert 'power{node="dev2"} 2.0' in lines
+
+
+@pytest.mark.parametrize(
+    "metric",
+    [
+        {"type": "counter", "aggregation": "avg", "window": 10},
+        {"type": "gauge", "aggregation": "avg"},
+    ],
+)
+def test_config_invalid_aggregation(metric: dict[str, Any]) -> None:
+    """Only gauges can be aggregated, within a positive window"""
+
+    with pytest.raises(ValueError):
+        _config(metrics={"power": metric, "voltage": {"type": "gauge"}})
@@ -0,0 +1,126 @@
+"""Unit tests of capture files and replaying them"""
+
+from pathlib import Path
+
+import pytest
+
+from ...promexp import PrometheusExporter
+from ..capture import (
+    MAGIC,
+    CapturedMessage,
+    CaptureFormatException,
+    CaptureWriter,
+    read_capture,
+    replay,
+)
+from ..promqtt import MqttPrometheusBridge
+from .test_bridge import _config, _lines
+
+
+def _capture() -> list[CapturedMessage]:
+    """Create a list of captured messages"""
+
+    return [
+        CapturedMessage(100.0, "tele/dev1/SENSOR", b'{"ENERGY": {"Power": 1}}'),
+        CapturedMessage(100.05, "tele/dev2/SENSOR", b'{"ENERGY": {"Power": 2}}'),
+        CapturedMessage(100.1, "tele/dev1/SENSOR", b'{"ENERGY": {"Power": 3}}'),
+    ]
+
+
+def _write(filename: Path, messages: list[CapturedMessage]) -> None:
+    """Write messages to a capture file"""
+
+    writer = CaptureWriter(filename)
+    for msg in messages:
+        writer.write(msg.timestamp, msg.topic, msg.payload)
+    writer.close()
+
+
+def test_capture_roundtrip(tmp_path: Path) -> None:
+    """Messages are read back from a capture file, also after appending"""
+
+    filename = tmp_path / "test.cap"
+
+    _write(filename, _capture()[:1])
+    _write(filename, _capture()[1:])
+
+    assert list(read_capture(filename)) == _capture()
+
+
+def test_capture_truncated(tmp_path: Path) -> None:
+    """A truncated record at the end of the file is ignored"""
+
+    filename = tmp_path / "test.cap"
+    _write(filename, _capture())
+
+    data = filename.read_bytes()
+    filename.write_bytes(data[:-5])
+
+    assert list(read_capture(filename)) == _capture()[:2]
+
+
+def test_capture_append_truncated(tmp_path: Path) -> None:
+    """Appending to a file with a truncated record continues after the last
+    complete record"""
+
+    filename = tmp_path / "test.cap"
+    _write(filename, _capture()[:2])
+
+    data = filename.read_bytes()
+    filename.write_bytes(data[:-5])
+
+    _write(filename, _capture()[2:])
+
+    assert list(read_capture(filename)) == [_capture()[0], _capture()[2]]
+
+
+def test_capture_append_truncated_magic(tmp_path: Path) -> None:
+    """A truncated magic string is rewritten"""
+
+    filename = tmp_path / "test.cap"
+    filename.write_bytes(MAGIC[:5])
+
+    _write(filename, _capture())
+
+    assert list(read_capture(filename)) == _capture()
+
+
+def test_capture_append_invalid(tmp_path: Path) -> None:
+    """Other files are not appended to"""
+
+    filename = tmp_path / "test.cap"
+    filename.write_bytes(b"x" * len(MAGIC))
+
+    with pytest.raises(CaptureFormatException):
+        CaptureWriter(filename)
+
+    assert filename.read_bytes() == b"x" * len(MAGIC)
+
+
+def test_capture_invalid(tmp_path: Path) -> None:
+    """Files without the magic string are rejected"""
+
+    filename = tmp_path / "test.cap"
+    filename.write_bytes(b"x" * len(MAGIC))
+
+    with pytest.raises(CaptureFormatException):
+        list(read_capture(filename))
+
+
+@pytest.mark.parametrize("speed", (0, 1))
+def test_capture_replay(speed: float) -> None:
+    """Replaying updates the metrics and reports the handling times"""
+
+    bridge = MqttPrometheusBridge(PrometheusExporter(), cfg=_config())
+
+    stats = replay(bridge, _capture(), speed=speed)
+
+    assert stats.messages == 3
+    assert stats.throughput > 0
+    assert 0 < stats.latency(50) <= stats.latency(100)
+    assert "throughput" in stats.report()
+
+    if speed:
+        assert stats.duration >= 0.1
+
+    assert 'power{node="dev1"} 3' in _lines(bridge.prom_exp)
@@ -0,0 +1,265 @@
+"""Integration tests of multiple promqtt instances sharing a subscription"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from ...cfgmodel import ClusterModel, MetricTypeEnum, PromqttConfig
+from ...promexp import PrometheusExporter, merge_states
+from ...test.broker import FakeBroker
+from ..cluster import ClusterView
+from ..mqttclt import MqttClient
+from ..promqtt import MqttPrometheusBridge
+
+
+def _config(broker: FakeBroker) -> PromqttConfig:
+    """Create the configuration of a cluster member"""
+
+    return PromqttConfig.parse_obj(
+        {
+            "mqtt": {
+                "broker": broker.host,
+                "port": broker.port,
+                "topic": "tele/#",
+                "share_group": "promqtt",
+            },
+            "http": {},
+            "metrics": {"power": {"type": "gauge", "with_update_counter": True}},
+            "types": {
+                "meter": {
+                    "power": {
+                        "value": "data['Power']",
+                        "labels": {"node": "tlist[1]"},
+                    },
+                },
+            },
+            "messages": [{"topics": ["tele/+/SENSOR"], "types": ["meter"]}],
+            "ingest": {"workers": 0},
+        }
+    )
+
+
+def _wait_for(condition: Any, timeout: float = 5.0) -> None:
+    """Wait until a condition is true"""
+
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timeout"
+        time.sleep(0.01)
+
+
+@pytest.fixture(name="broker")
+def broker_fixture():
+    """Run a MQTT broker"""
+
+    with FakeBroker() as broker:
+        yield broker
+
+
+def test_cluster_shared_subscription(broker: FakeBroker) -> None:
+    """The broker distributes the messages between the members and the merged
+    metrics contain all instances once."""
+
+    exporters = [PrometheusExporter(), PrometheusExporter()]
+    clients = []
+    for promexp in exporters:
+        cfg = _config(broker)
+        client = MqttClient(promexp, cfg.mqtt, MqttPrometheusBridge(promexp, cfg))
+        client.loop_start()
+        clients.append(client)
+
+    _wait_for(
+        lambda: all(
+            'promqtt_mqtt_conn_state{broker="127.0.0.1",port="%d"} 1' % broker.port
+            in promexp.render()
+            for promexp in exporters
+        )
+    )
+
+    publisher = mqtt.Client()
+    publisher.connect(broker.host, broker.port)
+    publisher.loop_start()
+
+    # Give the subscriptions time to be registered by the broker
+    time.sleep(0.1)
+
+    for index in range(20):
+        publisher.publish(f"tele/dev{index % 4}/SENSOR", f'{{"Power": {index}}}')
+
+    def updates(promexp: PrometheusExporter) -> int:
+        return sum(
+            int(line.split(" ")[1])
+            for line in promexp.render().split("\n")
+            if line.startswith("power_updates{")
+        )
+
+    _wait_for(lambda: sum(updates(promexp) for promexp in exporters) == 20)
+
+    publisher.loop_stop()
+    publisher.disconnect()
+    for client in clients:
+        client.loop_stop()
+
+    assert [updates(promexp) for promexp in exporters] == [10, 10]
+
+    merged = merge_states([promexp.get_state() for promexp in exporters])
+    lines = merged.render().split("\n")
+
+    for node in range(4):
+        assert (
+            len([line for line in lines if f'power{{node="dev{node}"}}' in line]) == 1
+        )
+        assert f'power_updates{{node="dev{node}"}} 5' in lines
+
+    # The connection state of each member is kept
+    for member in range(2):
+        assert (
+            f'promqtt_mqtt_conn_state{{broker="127.0.0.1",member="{member}",'
+            f'port="{broker.port}"}} 0' in lines
+        )
+
+
+def test_cluster_unreachable_member() -> None:
+    """Members which cannot be reached are left out"""
+
+    promexp = PrometheusExporter()
+    cfg = PromqttConfig.parse_obj(
+        {
+            "mqtt": {"broker": "localhost"},
+            "http": {},
+            "metrics": {},
+            "types": {},
+            "messages": [],
+            "cluster": {"members": ["http://127.0.0.1:1"], "timeout": 0.5},
+        }
+    )
+    MqttPrometheusBridge(promexp, cfg)
+
+    view = ClusterView(promexp, cfg.cluster)
+
+    assert view.render() == promexp.render()
+
+
+class _StateHandler(BaseHTTPRequestHandler):
+    """Serve the state of a cluster member after a delay, answering with 304 if
+    the state is unchanged"""
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Handler for GET requests"""
+
+        server: _Member = self.server  # type: ignore
+        time.sleep(server.delay)
+
+        body, etag = server.view.render_state_with_etag()
+
+        if self.headers.get("If-None-Match") == etag:
+            server.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        server.statuses.append(200)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:  # pylint: disable=arguments-differ
+        """Do not log the requests"""
+
+
+class _Member(ThreadingHTTPServer):
+    """HTTP server of a cluster member serving the state of its exporter"""
+
+    daemon_threads = True
+
+    def __init__(self, name: str, delay: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), _StateHandler)
+
+        self.promexp = PrometheusExporter()
+        self.promexp.register("power", MetricTypeEnum.GAUGE, "Power")
+        self.view = ClusterView(self.promexp, _cluster_config([], name=name))
+        self.delay = delay
+        self.statuses: list[int] = []
+
+    @property
+    def url(self) -> str:
+        """Return the base URL of the member"""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def _cluster_config(members: list[str], **kwargs: Any) -> ClusterModel:
+    """Create the cluster configuration of an instance"""
+
+    return ClusterModel.parse_obj({"members": members, **kwargs})
+
+
+@pytest.fixture(name="members")
+def members_fixture(request: pytest.FixtureRequest) -> Iterator[list[_Member]]:
+    """Run the HTTP servers of cluster members with the delays of the parameter"""
+
+    members = [_Member(str(index), delay) for index, delay in enumerate(request.param)]
+    for member in members:
+        threading.Thread(target=member.serve_forever, daemon=True).start()
+
+    yield members
+
+    for member in members:
+        member.shutdown()
+        member.server_close()
+
+
+@pytest.mark.parametrize("members", [(0.0, 0.0)], indirect=True)
+def test_cluster_merged_cached(members: list[_Member]) -> None:
+    """Unchanged states are not transferred again and the merged metrics are
+    reused until a state changes"""
+
+    promexp = PrometheusExporter()
+    view = ClusterView(
+        promexp, _cluster_config([member.url for member in members], name="local")
+    )
+
+    for index, member in enumerate(members):
+        member.promexp.set("power", {"node": str(index)}, index)
+
+    merged = view.merged()
+    body, etag = view.render_with_etag()
+
+    assert view.merged() is merged
+    assert b'power{node="1"} 1' in body
+    assert [member.statuses for member in members] == [[200, 304, 304]] * 2
+
+    members[1].promexp.set("power", {"node": "1"}, 5)
+
+    body, new_etag = view.render_with_etag()
+
+    assert new_etag != etag
+    assert b'power{node="1"} 5' in body
+    assert [member.statuses[-1] for member in members] == [304, 200]
+
+
+@pytest.mark.parametrize("members", [(0.5, 0.5, 5.0)], indirect=True)
+def test_cluster_concurrent_fetch(members: list[_Member]) -> None:
+    """The states are retrieved concurrently and members which do not respond
+    within the timeout are left out"""
+
+    for index, member in enumerate(members):
+        member.promexp.set("power", {"node": str(index)}, index)
+
+    view = ClusterView(
+        PrometheusExporter(),
+        _cluster_config([member.url for member in members], timeout=1.0),
+    )
+
+    start = time.monotonic()
+    lines = view.render().split("\n")
+
+    assert time.monotonic() - start < 1.5
+    assert 'power{node="0"} 0' in lines
+    assert 'power{node="1"} 1' in lines
+    assert not any(line.startswith('power{node="2"}') for line in lines)
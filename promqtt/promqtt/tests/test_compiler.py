@@ -0,0 +1,102 @@
+"""Unit tests of the mapping compiler"""
+
+import pytest
+
+from ...cfgmodel import ParserTypeEnum
+from ..compiler import ExpressionCompileError, TypeProgram
+from ..mapping import Mapping
+from ..msg import Message
+
+
+def _mapping(metric: str, value: str, labels: dict):
+    """Create a mapping of type 'test'"""
+
+    return Mapping(
+        type_name="test",
+        value_exp=value,
+        label_exps=labels,
+        metric=metric,
+    )
+
+
+def _message(topic: str, payload: bytes) -> Message:
+    """Create a parsed JSON message"""
+
+    msg = Message(topic, payload)
+    msg.parse(ParserTypeEnum.JSON)
+
+    return msg
+
+
+def test_compiler_fused_updates() -> None:
+    """The fused function returns the updates of all mappings in order."""
+
+    program = TypeProgram(
+        type_name="test",
+        mappings=[
+            _mapping("m1", "data['a']['b']", {"node": "tlist[1]"}),
+            _mapping("m2", "0.5 * data['c']  # comment", {"x": "'y'"}),
+            _mapping("m3", "len(msg.topic)", {}),
+        ],
+    )
+
+    updates = program.evaluate(_message("tele/dev1/SENSOR", b'{"a": {"b": 1}, "c": 4}'))
+
+    assert updates == [
+        ("m1", {"node": "dev1"}, 1),
+        ("m2", {"x": "y"}, 2.0),
+        ("m3", {}, 16),
+    ]
+
+
+def test_compiler_faulty_mapping_skipped() -> None:
+    """A mapping with a failing value or label expression does not produce an
+    update, but the other mappings of the type still do."""
+
+    program = TypeProgram(
+        type_name="test",
+        mappings=[
+            _mapping("m1", "data['missing']", {}),
+            _mapping("m2", "data['c']", {"node": "tlist[7]"}),
+            _mapping("m3", "data['c']", {"node": "tlist[0]"}),
+        ],
+    )
+
+    updates = program.evaluate(_message("tele/dev1", b'{"c": 4}'))
+
+    assert updates == [("m3", {"node": "tele"}, 4)]
+
+
+def test_compiler_syntax_error() -> None:
+    """Invalid expressions are rejected when the mapping is created."""
+
+    with pytest.raises(ExpressionCompileError):
+        _mapping("m1", "data['a'", {})
+
+    with pytest.raises(ExpressionCompileError):
+        _mapping("m1", "data['a']", {"n": "1 +"})
+
+
+def test_compiler_topic_labels_cached() -> None:
+    """Labels depending only on the topic are evaluated once per topic and the same
+    label dictionary is returned for every message of the topic."""
+
+    program = TypeProgram(
+        type_name="test",
+        mappings=[
+            _mapping("m1", "data['a']", {"node": "tlist[1]"}),
+            _mapping("m2", "data['a']", {"node": "data['n']"}),
+            _mapping("m3", "data['a']", {"node": "tlist[7]"}),
+        ],
+    )
+
+    updates1 = program.evaluate(_message("tele/dev1", b'{"a": 1, "n": "x"}'))
+    updates2 = program.evaluate(_message("tele/dev1", b'{"a": 2, "n": "y"}'))
+    updates3 = program.evaluate(_message("tele/dev2", b'{"a": 3, "n": "z"}'))
+
+    assert updates1 == [("m1", {"node": "dev1"}, 1), ("m2", {"node": "x"}, 1)]
+    assert updates2 == [("m1", {"node": "dev1"}, 2), ("m2", {"node": "y"}, 2)]
+    assert updates3 == [("m1", {"node": "dev2"}, 3), ("m2", {"node": "z"}, 3)]
+
+    # The cached label dictionary is reused
+    assert updates1[0][1] is updates2[0][1]
@@ -0,0 +1,151 @@
+"""Unit tests of the ingest queue"""
+
+from threading import Event
+from typing import Any
+
+import pytest
+from pydantic import ValidationError
+
+from ...cfgmodel import IngestModel
+from ...promexp import PrometheusExporter
+from ..ingest import IngestQueue
+from ..msg import Message
+
+
+def _config(**kwargs: Any) -> IngestModel:
+    """Create an ingest configuration"""
+
+    return IngestModel.parse_obj(kwargs)
+
+
+def _messages(count: int, topics: int = 1) -> list[Message]:
+    """Create a list of messages distributed over a number of topics"""
+
+    return [
+        Message(f"test/{index % topics}", str(index).encode()) for index in range(count)
+    ]
+
+
+def test_ingest_inline() -> None:
+    """Without workers, messages are processed immediately"""
+
+    batches: list[list[Message]] = []
+    queue = IngestQueue(PrometheusExporter(), _config(workers=0), batches.append)
+
+    msgs = _messages(3)
+    for msg in msgs:
+        queue.put(msg)
+
+    assert batches == [[msg] for msg in msgs]
+
+
+def test_ingest_workers_keep_topic_order() -> None:
+    """All messages are processed and the order of each topic is kept"""
+
+    received: list[Message] = []
+    promexp = PrometheusExporter()
+    queue = IngestQueue(
+        promexp, _config(workers=4, queue_size=10000, batch_size=7), received.extend
+    )
+    queue.start()
+
+    msgs = _messages(500, topics=10)
+    for msg in msgs:
+        queue.put(msg)
+
+    queue.stop()
+
+    assert len(received) == len(msgs)
+    for topic in {msg.topic for msg in msgs}:
+        assert [msg for msg in received if msg.topic == topic] == [
+            msg for msg in msgs if msg.topic == topic
+        ]
+
+    lines = promexp.render().split("\n")
+    assert f"{IngestQueue.DEPTH_METRIC}{{}} 0" in lines
+    assert f"{IngestQueue.DROPPED_METRIC}{{}} 0" in lines
+
+
+def _blocked_queue(
+    policy: str, promexp: PrometheusExporter | None = None
+) -> tuple[IngestQueue, list[Message], Event]:
+    """Create a queue with one worker, which is blocked in processing the first
+    message until the returned event is set."""
+
+    received: list[Message] = []
+    started = Event()
+    release = Event()
+
+    def handler(batch: list[Message]) -> None:
+        started.set()
+        release.wait()
+        received.extend(batch)
+
+    queue = IngestQueue(
+        promexp or PrometheusExporter(),
+        _config(workers=1, queue_size=2, batch_size=1, overflow=policy),
+        handler,
+    )
+    queue.start()
+
+    queue.put(Message("test/first", b""))
+    started.wait()
+
+    return queue, received, release
+
+
+def test_ingest_drop_oldest() -> None:
+    """When the queue is full, the oldest message is dropped. The depth and the
+    number of dropped messages are exported while the worker is stuck."""
+
+    promexp = PrometheusExporter()
+    queue, received, release = _blocked_queue("drop_oldest", promexp)
+
+    msgs = _messages(4)
+    for msg in msgs:
+        queue.put(msg)
+
+    assert queue.depth == 2
+    assert queue.dropped == 2
+
+    lines = promexp.render().split("\n")
+    assert f"{IngestQueue.DEPTH_METRIC}{{}} 2" in lines
+    assert f"{IngestQueue.DROPPED_METRIC}{{}} 2" in lines
+
+    release.set()
+    queue.stop()
+
+    assert received[1:] == msgs[2:]
+
+
+def test_ingest_drop_newest() -> None:
+    """When the queue is full, the received message is dropped"""
+
+    queue, received, release = _blocked_queue("drop_newest")
+
+    msgs = _messages(4)
+    for msg in msgs:
+        queue.put(msg)
+
+    assert queue.dropped == 2
+
+    release.set()
+    queue.stop()
+
+    assert received[1:] == msgs[:2]
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {"workers": -1},
+        {"queue_size": -1},
+        {"batch_size": 0},
+        {"payload_cache_size": -1},
+    ],
+)
+def test_ingest_invalid_config(settings: dict[str, int]) -> None:
+    """Negative sizes and empty batches are rejected"""
+
+    with pytest.raises(ValidationError):
+        _config(**settings)
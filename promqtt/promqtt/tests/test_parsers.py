@@ -0,0 +1,97 @@
+"""Unit tests of the message payload parsers"""
+
+import pytest
+
+from ...cfgmodel import ParserTypeEnum
+from ..msg import Message
+from ..parsers import (
+    ParserUnavailableException,
+    get_parser,
+    parse_json,
+    parse_json_fast,
+    register_parser,
+)
+
+
+def _parse(parser: ParserTypeEnum, payload: bytes):
+    """Parse a payload with a message"""
+
+    msg = Message("a/b", payload)
+    msg.parse(parser)
+
+    return msg.data
+
+
+@pytest.mark.parametrize(
+    "payload,data",
+    (
+        (b'{"a": {"b": [1, 2.5, "x"]}}', {"a": {"b": [1, 2.5, "x"]}}),
+        (b"21.5", 21.5),
+    ),
+)
+def test_parsers_json(payload: bytes, data) -> None:
+    """JSON payloads are parsed, also by the fast parser"""
+
+    assert _parse(ParserTypeEnum.JSON, payload) == data
+    assert parse_json(payload) == data
+
+    pytest.importorskip("orjson")
+    assert parse_json_fast(payload) == data
+
+
+def test_parsers_json_nan() -> None:
+    """NaN values are accepted like by the standard library"""
+
+    pytest.importorskip("orjson")
+
+    value = parse_json_fast(b'{"a": NaN}')["a"]
+    assert value != value  # pylint: disable=comparison-with-itself
+
+
+@pytest.mark.parametrize(
+    "payload,data", ((b"21.5", 21.5), (b" 17\n", 17), (b"-1e3", -1000.0))
+)
+def test_parsers_number(payload: bytes, data) -> None:
+    """Number payloads are parsed to int or float"""
+
+    assert _parse(ParserTypeEnum.NUMBER, payload) == data
+    assert isinstance(_parse(ParserTypeEnum.NUMBER, payload), type(data))
+
+
+def test_parsers_number_invalid() -> None:
+    """Invalid number payloads raise an exception"""
+
+    with pytest.raises(ValueError):
+        _parse(ParserTypeEnum.NUMBER, b"ON")
+
+
+def test_parsers_raw() -> None:
+    """Raw payloads are returned as string"""
+
+    assert _parse(ParserTypeEnum.RAW, b"ON") == "ON"
+
+
+def test_parsers_msgpack() -> None:
+    """MessagePack payloads are parsed if msgpack is installed"""
+
+    msgpack = pytest.importorskip("msgpack")
+
+    assert _parse(ParserTypeEnum.MSGPACK, msgpack.packb({"a": 1})) == {"a": 1}
+
+
+def test_parsers_unavailable(monkeypatch) -> None:
+    """Requesting an unavailable parser raises an exception"""
+
+    monkeypatch.setattr("promqtt.promqtt.parsers._PARSERS", {})
+
+    with pytest.raises(ParserUnavailableException):
+        get_parser(ParserTypeEnum.CBOR)
+
+
+def test_parsers_register(monkeypatch) -> None:
+    """Parsers can be replaced"""
+
+    monkeypatch.setattr("promqtt.promqtt.parsers._PARSERS", {})
+    register_parser(ParserTypeEnum.RAW, bytes.upper)
+
+    assert _parse(ParserTypeEnum.RAW, b"on") == b"ON"
@@ -0,0 +1,165 @@
+"""Unit tests of the projection parsing of JSON payloads"""
+
+import json
+
+import pytest
+
+from ...cfgmodel import ParserTypeEnum
+from ..compiler import TypeProgram
+from ..mapping import Mapping
+from ..projection import Projection, build_projection
+
+pytest.importorskip("ijson")
+
+
+def _program(values: list[str]) -> TypeProgram:
+    """Create a type program with one mapping per value expression"""
+
+    return TypeProgram(
+        type_name="test",
+        mappings=[
+            Mapping(
+                type_name="test",
+                value_exp=value,
+                label_exps={},
+                metric=f"m{index}",
+            )
+            for index, value in enumerate(values)
+        ],
+    )
+
+
+def _payload(padding: int) -> bytes:
+    """Create a JSON payload with the referenced keys at the start, followed by
+    padding data"""
+
+    return json.dumps(
+        {
+            "ENERGY": {"Power": 12.5, "Total": [1, 2, {"x": None}]},
+            "ignored": "x",
+            "padding": ["0123456789"] * padding,
+        }
+    ).encode()
+
+
+def test_projection_extract() -> None:
+    """Only the key paths are extracted, with the same values as a full parse"""
+
+    projection = Projection({("ENERGY", "Power"), ("ENERGY", "Total")}, min_size=1)
+
+    data = projection.parse(_payload(1000))
+
+    assert data == {"ENERGY": {"Power": 12.5, "Total": [1, 2, {"x": None}]}}
+    assert projection.streaming
+
+
+def test_projection_missing_key() -> None:
+    """Keys not contained in the payload are missing in the data"""
+
+    projection = Projection({("ENERGY", "Power"), ("missing",)}, min_size=1)
+
+    data = projection.parse(_payload(10))
+
+    assert data == {"ENERGY": {"Power": 12.5}}
+
+
+def test_projection_small_payload() -> None:
+    """Small payloads are parsed completely"""
+
+    projection = Projection({("ENERGY", "Power")}, min_size=100000)
+
+    assert projection.parse(_payload(10)) == json.loads(_payload(10))
+
+
+def test_projection_adaptive() -> None:
+    """Streaming is disabled if a large part of the payload had to be read"""
+
+    projection = Projection({("padding",)}, min_size=1)
+
+    assert projection.parse(_payload(1000))["padding"][0] == "0123456789"
+    assert not projection.streaming
+
+    assert projection.parse(_payload(1000)) == json.loads(_payload(1000))
+
+
+@pytest.mark.parametrize(
+    "parser,values,paths",
+    (
+        (
+            ParserTypeEnum.JSON,
+            ["data['ENERGY']['Power']", "data['ENERGY']['Total'][0]"],
+            {("ENERGY", "Power"), ("ENERGY", "Total")},
+        ),
+        (ParserTypeEnum.JSON, ["data['ENERGY']['Power']", "len(data)"], None),
+        (ParserTypeEnum.JSON, ["data['a.b']"], None),
+        (ParserTypeEnum.JSON, ["data['item']"], None),
+        (ParserTypeEnum.JSON, ["len(tlist)"], None),
+        (ParserTypeEnum.RAW, ["data['a']"], None),
+    ),
+)
+def test_projection_build(
+    parser: ParserTypeEnum, values: list[str], paths: set | None
+) -> None:
+    """A projection is only built if all expressions reference data by keys"""
+
+    projection = build_projection(parser, [_program(values)], min_size=1)
+
+    if paths is None:
+        assert projection is None
+    else:
+        assert projection is not None
+        assert projection.paths == paths
+
+
+def test_projection_disabled() -> None:
+    """No projection is built with a minimum payload size of 0"""
+
+    assert (
+        build_projection(ParserTypeEnum.JSON, [_program(["data['a']"])], min_size=0)
+        is None
+    )
+
+
+_PADDING = json.dumps(["0123456789"] * 100)
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b'{"ENERGY": {"Power": 1, "Total": 2, "Power": 3}, "x": 0}',
+        b'{"ENERGY": {"Power": {"a": 1}, "Power": {"a": 2}}, "x": 0}',
+        # Repeated objects containing the keys
+        b'{"ENERGY": {"Power": 1, "Total": 2}, "ENERGY": {"Power": 3, "Total": 4}, '
+        + f'"padding": {_PADDING}}}'.encode(),
+        b'{"ENERGY": {"Power": 1, "Total": 2}, "z": 1, "ENERGY": {"Total": 4}, '
+        + f'"padding": {_PADDING}}}'.encode(),
+        # Repetitions far behind the keys, also spelled with escape sequences
+        f'{{"ENERGY": {{"Power": 1, "Total": 2}}, "padding": {_PADDING}, '.encode()
+        + b'"ENERGY": {"Total": 4}}',
+        f'{{"ENERGY": {{"Power": 1, "Total": 2}}, "padding": {_PADDING}, '.encode()
+        + b'"\\u0045NERGY": {"Total": 4}}',
+    ],
+    ids=["value", "object", "parent", "parent_other", "far", "escaped"],
+)
+def test_projection_duplicate_keys(payload: bytes) -> None:
+    """Duplicate keys give the same result as a complete parse, which keeps the
+    last occurrence"""
+
+    projection = Projection({("ENERGY", "Power"), ("ENERGY", "Total")}, min_size=1)
+
+    assert projection.parse(payload)["ENERGY"] == json.loads(payload)["ENERGY"]
+    assert not projection.streaming
+
+
+@pytest.mark.parametrize("key, streaming", [("Power", True), ("ENERGY", False)])
+def test_projection_key_in_rest(key: str, streaming: bool) -> None:
+    """If a top-level key occurs behind the extracted data, e.g. as value, the
+    complete payload is parsed"""
+
+    projection = Projection({("ENERGY", "Power")}, min_size=1)
+    payload = (
+        f'{{"ENERGY": {{"Power": 1}}, "padding": {_PADDING}, "name": "{key}"}}'
+    ).encode()
+
+    assert projection.parse(payload)["ENERGY"] == {"Power": 1}
+    assert projection.streaming == streaming
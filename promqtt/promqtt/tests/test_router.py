@@ -0,0 +1,100 @@
+"""Unit tests of the topic router"""
+
+import pytest
+
+from ...cfgmodel import ParserTypeEnum
+from ..compiler import TypeProgram
+from ..msghdlr import MessageHandler, topic_matches_filter
+from ..router import TopicRouter
+
+
+def _program(type_name: str) -> TypeProgram:
+    """Create an empty type program"""
+
+    return TypeProgram(type_name=type_name, mappings=[])
+
+
+@pytest.mark.parametrize(
+    "topic_filter,topic,result",
+    (
+        ("a/b", "a/b", True),
+        ("a/b", "a/c", False),
+        ("a/b", "a/b/c", False),
+        ("a/+", "a/b", True),
+        ("a/+", "a/b/c", False),
+        ("a/+/c", "a/b/c", True),
+        ("a/#", "a", True),
+        ("a/#", "a/b/c", True),
+        ("#", "a/b", True),
+        ("#", "$SYS/x", False),
+        ("+/x", "$SYS/x", False),
+        ("$SYS/#", "$SYS/x", True),
+    ),
+)
+def test_router_filter_match(topic_filter: str, topic: str, result: bool) -> None:
+    """MQTT topic filters are matched according to the MQTT spec, both by the
+    filter function and by the router trie."""
+
+    assert topic_matches_filter(topic_filter, topic) == result
+
+    handler = MessageHandler(
+        topics=[topic_filter], parser=ParserTypeEnum.JSON, mappings=[_program("t")]
+    )
+    router = TopicRouter([handler])
+
+    assert bool(router.route(topic)) == result
+
+
+def test_router_handlers_in_config_order() -> None:
+    """All matching handlers are found in configuration order, type programs are
+    deduplicated and the first handler determines the parser."""
+
+    prog1 = _program("t1")
+    prog2 = _program("t2")
+
+    handlers = [
+        MessageHandler(["a/+"], ParserTypeEnum.JSON, [prog1]),
+        MessageHandler(["x/y"], ParserTypeEnum.JSON, [prog2]),
+        MessageHandler(["re:a/[0-9]+$"], ParserTypeEnum.JSON, [prog2, prog1]),
+        MessageHandler(["a/#"], ParserTypeEnum.JSON, [prog2]),
+    ]
+    router = TopicRouter(handlers)
+
+    dispatch = router.route("a/17")
+    assert dispatch.handlers == [handlers[0], handlers[2], handlers[3]]
+    assert dispatch.mappings == [prog1, prog2]
+    assert dispatch.parser == ParserTypeEnum.JSON
+
+    dispatch = router.route("a/b")
+    assert dispatch.handlers == [handlers[0], handlers[3]]
+
+    assert not router.route("b/c")
+    assert router.route("b/c").parser is None
+
+
+def test_router_cache() -> None:
+    """The routing result of a topic is cached"""
+
+    router = TopicRouter(
+        [MessageHandler(["a/+"], ParserTypeEnum.JSON, [_program("t")])], cache_size=1
+    )
+
+    assert router.route("a/b") is router.route("a/b")
+
+
+def test_router_named_groups() -> None:
+    """Named groups of all matching regex topics are collected, the first match
+    of a group name takes precedence."""
+
+    handlers = [
+        MessageHandler(["re:tele/(?P<device>[^/]+)/"], ParserTypeEnum.JSON, []),
+        MessageHandler(["re:(?P<prefix>\\w+)/(?P<device>.*)"], ParserTypeEnum.JSON, []),
+        MessageHandler(["re:tele/x(?P<opt>y)?"], ParserTypeEnum.JSON, []),
+    ]
+    router = TopicRouter(handlers)
+
+    assert router.route("tele/dev1/SENSOR").groups == {
+        "device": "dev1",
+        "prefix": "tele",
+    }
+    assert router.route("tele/x").groups == {"prefix": "tele", "device": "x"}
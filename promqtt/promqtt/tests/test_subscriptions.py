@@ -0,0 +1,105 @@
+"""Unit tests of the derivation of MQTT subscriptions"""
+
+import re
+
+import pytest
+
+from ...cfgmodel import MessageConfig
+from ..msghdlr import topic_matches_filter
+from ..subscriptions import (
+    derive_subscriptions,
+    filter_covers,
+    minimize_filters,
+    regex_to_filter,
+)
+
+
+@pytest.mark.parametrize(
+    "regex,topic_filter",
+    (
+        ("tele/tasmota_(9909BE|9955BB)/SENSOR$", "tele/+/SENSOR"),
+        ("tele/tasmota_(9909BE|9955BB)/SENSOR", "tele/+/+/#"),
+        ("zigbee2mqtt/aqara_(sw_01|sens_tph_01)", "zigbee2mqtt/+/#"),
+        ("^a/\\d+/x\\Z", "a/+/x"),
+        ("a/[^/]+/b$", "a/+/b"),
+        ("a/.*", "a/#"),
+        ("a/[^x]+/b$", "a/#"),
+        ("a/(b/c|d)$", "a/#"),
+        ("a/\\+/b$", "a/+/b"),
+        ("(?i)a/b$", "#"),
+        ("", "#"),
+    ),
+)
+def test_subscriptions_regex_to_filter(regex: str, topic_filter: str) -> None:
+    """Regex topics are converted to filters with wildcards"""
+
+    assert regex_to_filter(regex) == topic_filter
+
+
+@pytest.mark.parametrize(
+    "regex",
+    (
+        "tele/tasmota_(9909BE|9955BB)/SENSOR",
+        "tele/tasmota_([A-Z0-9]+)/STATE$",
+        "a/[^x]+/b",
+        "a/b\\w*",
+    ),
+)
+@pytest.mark.parametrize(
+    "topic",
+    (
+        "tele/tasmota_9909BE/SENSOR",
+        "tele/tasmota_9909BE/SENSOR/x",
+        "tele/tasmota_9909BE/SENSORS",
+        "tele/tasmota_AB12/STATE",
+        "a/y/b",
+        "a/y/z/b",
+        "a/bcd",
+        "a/b",
+    ),
+)
+def test_subscriptions_filter_superset(regex: str, topic: str) -> None:
+    """Every topic matched by the regex is also matched by the derived filter"""
+
+    if re.match(regex, topic):
+        assert topic_matches_filter(regex_to_filter(regex), topic)
+
+
+@pytest.mark.parametrize(
+    "topic_filter,other,result",
+    (
+        ("#", "a/b", True),
+        ("a/#", "a", True),
+        ("a/#", "a/+/#", True),
+        ("a/+", "a/b", True),
+        ("a/+", "a/#", False),
+        ("a/b", "a/+", False),
+        ("a/+/#", "a", False),
+        ("#", "$SYS/x", False),
+    ),
+)
+def test_subscriptions_filter_covers(
+    topic_filter: str, other: str, result: bool
+) -> None:
+    """Check coverage of topic filters by other filters"""
+
+    assert filter_covers(topic_filter, other) == result
+
+
+def test_subscriptions_minimize() -> None:
+    """Duplicate and covered filters are removed"""
+
+    assert minimize_filters(["a/b", "a/+", "x/y", "a/+", "x/#"]) == ["a/+", "x/#"]
+
+
+def test_subscriptions_derive() -> None:
+    """Subscriptions are derived from literal and regex topics"""
+
+    msg_cfgs = [
+        MessageConfig.parse_obj({"topics": ["zigbee2mqtt/sensor_1"], "types": ["t"]}),
+        MessageConfig.parse_obj(
+            {"topics": ["re:zigbee2mqtt/[^/]+$", "tele/+/STATE"], "types": ["t"]}
+        ),
+    ]
+
+    assert derive_subscriptions(msg_cfgs) == ["zigbee2mqtt/+", "tele/+/STATE"]
@@ -0,0 +1,66 @@
+"""Replay a capture file of MQTT messages and report throughput and latency.
+
+Usage: python -m promqtt.replay [--config promqtt.yml] [--speed 0] capture-file
+
+Capture files are recorded by promqtt if the environment variable PROMQTT_RECORD
+is set to the name of the capture file.
+
+"""
+
+import argparse
+import logging
+import os
+from pathlib import Path
+
+from .main import load_config
+from .promexp import PrometheusExporter
+from .promqtt import MqttPrometheusBridge, read_capture
+from .promqtt.capture import replay
+
+
+def main() -> None:
+    """Replay main function"""
+
+    parser = argparse.ArgumentParser(
+        description="Replay captured MQTT messages through promqtt."
+    )
+    parser.add_argument("capture", type=Path, help="Capture file to replay")
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=Path(os.environ.get("PROMQTT_CONFIG", "promqtt.yml")),
+        help="promqtt configuration file",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help=(
+            "Replay speed relative to the recording, e.g. 1 for the original "
+            "speed. 0 replays as fast as possible (default)."
+        ),
+    )
+    parser.add_argument(
+        "--render",
+        action="store_true",
+        help="Print the resulting metrics in prometheus format",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    cfg = load_config(args.config)
+
+    promexp = PrometheusExporter()
+    bridge = MqttPrometheusBridge(promexp, cfg=cfg)
+
+    stats = replay(bridge, read_capture(args.capture), speed=args.speed)
+
+    if args.render:
+        print(promexp.render())
+
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
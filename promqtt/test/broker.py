@@ -0,0 +1,341 @@
+"""Minimal MQTT broker for testing.
+
+The broker implements the subset of MQTT 3.1.1 used by promqtt and its tests:
+connecting, subscribing, unsubscribing and publishing with QoS 0 and 1. Messages
+are always delivered with QoS 0. Shared subscriptions ('$share/<group>/<filter>')
+are supported, the messages matching a shared subscription are distributed round
+robin between the members of the group.
+
+"""
+
+import socket
+import socketserver
+import struct
+from threading import Lock, Thread
+from typing import Any
+
+from ..promqtt.msghdlr import topic_matches_filter
+
+# MQTT control packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+SHARE_PREFIX = "$share/"
+
+
+def encode_packet(packet_type: int, body: bytes, flags: int = 0) -> bytes:
+    """Encode a MQTT control packet with fixed header"""
+
+    header = bytearray([packet_type << 4 | flags])
+
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            break
+
+    return bytes(header) + body
+
+
+def encode_string(value: str) -> bytes:
+    """Encode a length prefixed UTF-8 string"""
+
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def encode_publish(topic: str, payload: bytes) -> bytes:
+    """Encode a PUBLISH packet with QoS 0"""
+
+    return encode_packet(PUBLISH, encode_string(topic) + payload)
+
+
+def _decode_string(data: bytes, pos: int) -> tuple[str, int]:
+    """Decode a length prefixed string. Returns the string and the position after
+    it."""
+
+    (length,) = struct.unpack_from("!H", data, pos)
+    pos += 2
+
+    return data[pos : pos + length].decode("utf-8"), pos + length
+
+
+def _split_shared(topic_filter: str) -> tuple[str, str]:
+    """Split a shared subscription into the group name and the topic filter"""
+
+    group, _, shared_filter = topic_filter[len(SHARE_PREFIX) :].partition("/")
+
+    return group, shared_filter
+
+
+class _Session:  # pylint: disable=too-few-public-methods
+    """Connection of a client to the broker"""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+        self._lock = Lock()
+
+    def send(self, data: bytes) -> None:
+        """Send data to the client. Errors are ignored, the connection is closed by
+        the receiving thread."""
+
+        with self._lock:
+            try:
+                self._sock.sendall(data)
+            except OSError:
+                pass
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """Handle the connection of a client"""
+
+    def _read(self, count: int) -> bytes:
+        """Read a number of bytes from the client. Raises EOFError if the
+        connection is closed."""
+
+        data = b""
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+
+        return data
+
+    def _read_packet(self) -> tuple[int, int, bytes]:
+        """Read a control packet. Returns the packet type, flags and body."""
+
+        first = self._read(1)[0]
+
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self._read(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+
+        return first >> 4, first & 0x0F, self._read(length)
+
+    def handle(self) -> None:
+        broker: FakeBroker = self.server.broker  # type: ignore
+        session = _Session(self.request)
+
+        try:
+            while True:
+                packet_type, flags, body = self._read_packet()
+
+                if packet_type == DISCONNECT:
+                    break
+
+                broker.handle_packet(session, packet_type, flags, body)
+        except (EOFError, OSError):
+            pass
+        finally:
+            broker.remove_session(session)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    """TCP server of the broker"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeBroker:
+    """A MQTT broker running in a background thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = _Server((host, port), _RequestHandler)
+        self._server.broker = self  # type: ignore
+        self._thread: Thread | None = None
+
+        self._lock = Lock()
+
+        # Subscriptions as (session, topic filter) pairs
+        self._subscriptions: list[tuple[_Session, str]] = []
+
+        # Shared subscriptions by (group, topic filter), each with the list of
+        # member sessions and the index of the next member to deliver to
+        self._shared: dict[tuple[str, str], tuple[list[_Session], list[int]]] = {}
+
+        self._published = 0
+
+    @property
+    def host(self) -> str:
+        """Return the address the broker listens on"""
+        return str(self._server.server_address[0])
+
+    @property
+    def port(self) -> int:
+        """Return the port the broker listens on"""
+        return self._server.server_address[1]
+
+    @property
+    def published(self) -> int:
+        """Return the number of messages published to the broker"""
+        return self._published
+
+    @property
+    def subscriptions(self) -> int:
+        """Return the number of subscriptions, including the members of shared
+        subscriptions"""
+
+        with self._lock:
+            return len(self._subscriptions) + sum(
+                len(members) for members, _ in self._shared.values()
+            )
+
+    def start(self) -> None:
+        """Start the broker thread"""
+
+        self._thread = Thread(
+            target=self._server.serve_forever, name="fake_broker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the broker"""
+
+        self._server.shutdown()
+        self._server.server_close()
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeBroker":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def handle_packet(
+        self, session: _Session, packet_type: int, flags: int, body: bytes
+    ) -> None:
+        """Handle a control packet received from a client"""
+
+        if packet_type == CONNECT:
+            session.send(encode_packet(CONNACK, b"\x00\x00"))
+        elif packet_type == SUBSCRIBE:
+            self._subscribe(session, body)
+        elif packet_type == UNSUBSCRIBE:
+            self._unsubscribe(session, body)
+        elif packet_type == PUBLISH:
+            self._publish(session, flags, body)
+        elif packet_type == PINGREQ:
+            session.send(encode_packet(PINGRESP, b""))
+
+    def _subscribe(self, session: _Session, body: bytes) -> None:
+        """Add the subscriptions of a SUBSCRIBE packet"""
+
+        packet_id = body[:2]
+        pos = 2
+        granted = bytearray()
+
+        while pos < len(body):
+            topic_filter, pos = _decode_string(body, pos)
+            pos += 1  # requested QoS
+
+            with self._lock:
+                if topic_filter.startswith(SHARE_PREFIX):
+                    members, _ = self._shared.setdefault(
+                        _split_shared(topic_filter), ([], [0])
+                    )
+                    if session not in members:
+                        members.append(session)
+                elif (session, topic_filter) not in self._subscriptions:
+                    self._subscriptions.append((session, topic_filter))
+
+            granted.append(0)
+
+        session.send(encode_packet(SUBACK, packet_id + bytes(granted)))
+
+    def _unsubscribe(self, session: _Session, body: bytes) -> None:
+        """Remove the subscriptions of an UNSUBSCRIBE packet"""
+
+        packet_id = body[:2]
+        pos = 2
+
+        while pos < len(body):
+            topic_filter, pos = _decode_string(body, pos)
+
+            with self._lock:
+                if topic_filter.startswith(SHARE_PREFIX):
+                    members, _ = self._shared.get(
+                        _split_shared(topic_filter), ([], [0])
+                    )
+                    if session in members:
+                        members.remove(session)
+                elif (session, topic_filter) in self._subscriptions:
+                    self._subscriptions.remove((session, topic_filter))
+
+        session.send(encode_packet(UNSUBACK, packet_id, flags=0))
+
+    def _publish(self, session: _Session, flags: int, body: bytes) -> None:
+        """Deliver a published message to the subscribers"""
+
+        topic, pos = _decode_string(body, 0)
+
+        qos = (flags >> 1) & 0x03
+        if qos:
+            packet_id = body[pos : pos + 2]
+            pos += 2
+            session.send(encode_packet(PUBACK, packet_id))
+
+        self.publish(topic, body[pos:])
+
+    def publish(self, topic: str, payload: bytes) -> int:
+        """Deliver a message to the subscribers, like a message published by a
+        client. Returns the number of receiving clients."""
+
+        packet = encode_publish(topic, payload)
+
+        with self._lock:
+            self._published += 1
+
+            # Each session receives a message only once, even if multiple
+            # subscriptions match.
+            receivers = list(
+                dict.fromkeys(
+                    subscriber
+                    for subscriber, topic_filter in self._subscriptions
+                    if topic_matches_filter(topic_filter, topic)
+                )
+            )
+
+            for (_, topic_filter), (members, index) in self._shared.items():
+                if members and topic_matches_filter(topic_filter, topic):
+                    receivers.append(members[index[0] % len(members)])
+                    index[0] += 1
+
+        for receiver in receivers:
+            receiver.send(packet)
+
+        return len(receivers)
+
+    def remove_session(self, session: _Session) -> None:
+        """Remove all subscriptions of a closed session"""
+
+        with self._lock:
+            self._subscriptions = [
+                (subscriber, topic_filter)
+                for subscriber, topic_filter in self._subscriptions
+                if subscriber is not session
+            ]
+
+            for members, _ in self._shared.values():
+                if session in members:
+                    members.remove(session)
@@ -1,3 +1,4 @@
 """Module containing utility functions and classes."""
 
+from .lru import LruCache
 from .utils import str_to_bool
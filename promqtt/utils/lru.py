@@ -0,0 +1,57 @@
+"""Bounded least-recently-used cache"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LruCache(Generic[K, V]):
+    """A thread-safe mapping with a maximum number of entries. When the cache is
+    full, the least recently used entry is discarded."""
+
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def maxsize(self) -> int:
+        """Return the maximum number of entries"""
+        return self._maxsize
+
+    def get(self, key: K) -> V | None:
+        """Return the value stored for a key and mark it as recently used. Returns
+        None if the key is not in the cache."""
+
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        """Store a value for a key. Discards the least recently used entry if the
+        cache is full."""
+
+        if self._maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            if len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,39 @@
+"""Unit tests for the LRU cache"""
+
+from .. import LruCache
+
+
+def test_lru_get_put() -> None:
+    """Stored values can be retrieved, unknown keys return None"""
+
+    cache: LruCache[str, int] = LruCache(maxsize=2)
+    cache.put("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+
+def test_lru_evicts_least_recently_used() -> None:
+    """When full, the least recently used entry is discarded"""
+
+    cache: LruCache[str, int] = LruCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+
+    # use a, so b is the least recently used entry
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_disabled() -> None:
+    """A cache with size 0 stores nothing"""
+
+    cache: LruCache[str, int] = LruCache(maxsize=0)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None